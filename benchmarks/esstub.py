@@ -0,0 +1,150 @@
+"""esstub.py
+In-process stand-in for the ElasticSearch HTTP API used by the indexers.
+
+Bulk requests are parsed and acknowledged as successful, and their sizes
+are recorded, but documents are not stored. Other requests (index
+creation, settings, aliases, refresh, search) are acknowledged with
+minimal responses, so that rebuilds can also be run against the stand-in.
+"""
+import json
+import threading
+import urlparse
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+
+class ESStubStats(object):
+    """Counters of the requests received by the stand-in."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = 0
+            self.bulk_requests = 0
+            self.bulk_bytes = 0
+            self.bulk_actions = 0
+
+    def record(self, bulk_bytes=None, bulk_actions=0):
+        with self.lock:
+            self.requests += 1
+            if bulk_bytes is not None:
+                self.bulk_requests += 1
+                self.bulk_bytes += bulk_bytes
+                self.bulk_actions += bulk_actions
+
+
+class ESStubRequestHandler(BaseHTTPRequestHandler):
+    """Handles requests to the stand-in."""
+
+    # Bulk actions followed by a document source line
+    SOURCE_ACTIONS = ("index", "create", "update")
+
+    def log_message(self, format, *args):
+        pass
+
+    def _body(self):
+        length = int(self.headers.getheader("content-length") or 0)
+        return self.rfile.read(length) if length else ""
+
+    def _respond(self, response, status=200):
+        data = json.dumps(response) if response is not None else ""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(data)
+
+    def _path(self):
+        path = urlparse.urlparse(self.path).path
+        return [part for part in path.split("/") if part]
+
+    def _bulk(self, parts, body):
+        """Acknowledge every action of a bulk request."""
+        default_index = parts[0] if len(parts) > 1 else None
+        default_type = parts[1] if len(parts) > 2 else None
+
+        items = []
+        lines = iter([line for line in body.splitlines() if line.strip()])
+        for line in lines:
+            action = json.loads(line)
+            name, metadata = action.items()[0]
+            if name in self.SOURCE_ACTIONS:
+                next(lines, None)
+            items.append({name: {
+                "_index": metadata.get("_index", default_index),
+                "_type": metadata.get("_type", default_type),
+                "_id": metadata.get("_id"),
+                "_version": 1,
+                "ok": True,
+                "status": 201 if name == "create" else 200
+            }})
+
+        self.server.stats.record(bulk_bytes=len(body), bulk_actions=len(items))
+        self._respond({"took": 1, "errors": False, "items": items})
+
+    def _handle(self):
+        parts = self._path()
+        body = self._body()
+
+        if parts and parts[-1] == "_bulk":
+            return self._bulk(parts, body)
+
+        self.server.stats.record()
+        if self.command == "GET" and parts and parts[-1] == "_settings":
+            self._respond({parts[0]: {"settings": {}}})
+        elif self.command == "GET" and parts == ["_aliases"]:
+            self._respond({})
+        elif self.command == "HEAD":
+            self._respond(None, status=404)
+        elif parts and parts[-1] == "_search":
+            self._respond({"took": 1, "hits": {"total": 0, "hits": []}})
+        else:
+            self._respond({"ok": True, "acknowledged": True})
+
+    do_GET = _handle
+    do_POST = _handle
+    do_PUT = _handle
+    do_DELETE = _handle
+    do_HEAD = _handle
+
+
+class ESStubHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class ESStubServer(object):
+    """ElasticSearch stand-in served from a background thread.
+
+    Args:
+        host: interface to listen on
+        port: port to listen on. 0 selects a free port.
+    """
+    def __init__(self, host="127.0.0.1", port=0):
+        self.server = ESStubHTTPServer((host, port), ESStubRequestHandler)
+        self.server.stats = ESStubStats()
+        self.thread = None
+
+    @property
+    def endpoint(self):
+        host, port = self.server.server_address
+        return "http://%s:%d" % (host, port)
+
+    @property
+    def stats(self):
+        return self.server.stats
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self.thread:
+            self.thread.join()
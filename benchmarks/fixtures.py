@@ -0,0 +1,231 @@
+"""fixtures.py
+Synthetic data for benchmarking the document generators.
+
+The data set is sized by the number of users. Each user has skills,
+location, technology and position prefs, and chat reels. Reference
+tables (technologies, locations, types) have a fixed size, and there
+is one topic tree per 10 users. Rows are inserted in batches with
+explicit ids, so the schema must be empty.
+"""
+import datetime
+import random
+
+from trsvcscore.db.models import User, Chat, ChatReel, Skill, Technology, \
+        Location, Topic, TopicTag, Tag, JobPositionTypePref, \
+        JobTechnologyPref, JobLocationPref
+
+# Rows per user
+SKILLS_PER_USER = 5
+LOCATION_PREFS_PER_USER = 2
+TECHNOLOGY_PREFS_PER_USER = 2
+POSITION_PREFS_PER_USER = 1
+CHAT_REELS_PER_USER = 2
+
+# Reference table sizes
+TECHNOLOGIES = 500
+TECHNOLOGY_TYPES = 3
+LOCATIONS = 200
+EXPERTISE_TYPES = 3
+POSITION_TYPES = 3
+TOPIC_TYPES = 2
+TAGS = 100
+
+# Topic trees
+USERS_PER_TOPIC = 10
+SUBTOPICS_PER_TOPIC = 5
+TAGS_PER_TOPIC = 3
+
+DEVELOPER_TENANT_ID = 1
+BATCH_SIZE = 5000
+
+
+def related_model(relationship):
+    """Return the model class referenced by a relationship attribute."""
+    return relationship.property.mapper.class_
+
+
+class FixtureLoader(object):
+    """Seeds a database with synthetic data.
+
+    Args:
+        engine: sqlalchemy engine of an empty benchmark database
+        seed: random seed, so that data sets are reproducible
+    """
+    def __init__(self, engine, seed=0):
+        self.engine = engine
+        self.random = random.Random(seed)
+        self.now = datetime.datetime(2013, 1, 1)
+
+    def create_schema(self):
+        """Drop and create all tables of the models."""
+        User.metadata.drop_all(self.engine)
+        User.metadata.create_all(self.engine)
+
+    def _insert(self, model_class, rows):
+        """Insert rows in batches.
+
+        Args:
+            model_class: model class
+            rows: iterable of column value dicts
+        Returns:
+            number of rows inserted
+        """
+        table = model_class.__table__
+        count = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= BATCH_SIZE:
+                self.engine.execute(table.insert(), batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            self.engine.execute(table.insert(), batch)
+            count += len(batch)
+        return count
+
+    def _types(self, model_class, count, prefix):
+        return self._insert(model_class, (
+            {"id": i, "name": "%s %d" % (prefix, i)} for i in range(1, count + 1)))
+
+    def load_reference_data(self):
+        """Insert the reference tables."""
+        if hasattr(User, "tenant"):
+            self._types(related_model(User.tenant), DEVELOPER_TENANT_ID, "Tenant")
+        self._types(related_model(Technology.type), TECHNOLOGY_TYPES, "Technology type")
+        self._types(related_model(Skill.expertise_type), EXPERTISE_TYPES, "Expertise")
+        self._types(related_model(JobPositionTypePref.position_type), POSITION_TYPES, "Position")
+        self._types(related_model(Topic.type), TOPIC_TYPES, "Topic type")
+        self._types(Tag, TAGS, "Tag")
+
+        self._insert(Technology, ({
+            "id": i,
+            "name": "Technology %d" % i,
+            "description": "Description of technology %d" % i,
+            "type_id": 1 + i % TECHNOLOGY_TYPES,
+            "modified": self.now
+        } for i in range(1, TECHNOLOGIES + 1)))
+
+        self._insert(Location, ({
+            "id": i,
+            "region": "Region %d" % i,
+            "modified": self.now
+        } for i in range(1, LOCATIONS + 1)))
+
+    def load_topics(self, roots):
+        """Insert topic trees.
+
+        Args:
+            roots: number of root topics
+        """
+        per_tree = SUBTOPICS_PER_TOPIC + 1
+
+        def topics():
+            for root in range(roots):
+                root_id = root * per_tree + 1
+                for rank in range(per_tree):
+                    yield {
+                        "id": root_id + rank,
+                        "parent_id": root_id if rank else None,
+                        "type_id": 1 + root % TOPIC_TYPES,
+                        "title": "Topic %d.%d" % (root, rank),
+                        "description": "Description of topic %d.%d" % (root, rank),
+                        "duration": 300,
+                        "recommended_participants": 1,
+                        "rank": rank,
+                        "public": True,
+                        "active": True
+                    }
+
+        def topic_tags():
+            id = 0
+            for root in range(roots):
+                for tag in self.random.sample(range(1, TAGS + 1), TAGS_PER_TOPIC):
+                    id += 1
+                    yield {"id": id, "topic_id": root * per_tree + 1, "tag_id": tag}
+
+        self._insert(Topic, topics())
+        self._insert(TopicTag, topic_tags())
+        return [root * per_tree + 1 for root in range(roots)]
+
+    def load_users(self, users, topic_ids):
+        """Insert users and their related rows.
+
+        Args:
+            users: number of users
+            topic_ids: list of root topic ids chats are about
+        """
+        rand = self.random
+        user_ids = range(1, users + 1)
+
+        self._insert(User, ({
+            "id": id,
+            "tenant_id": DEVELOPER_TENANT_ID,
+            "username": "user%d" % id,
+            "email": "user%d@example.com" % id,
+            "first_name": "First%d" % id,
+            "last_name": "Last%d" % id,
+            "password": "!",
+            "is_active": True,
+            "is_staff": False,
+            "is_superuser": False,
+            "last_login": self.now,
+            "date_joined": self.now,
+            "modified": self.now
+        } for id in user_ids))
+
+        self._insert(related_model(User.developer_profile), ({
+            "id": id,
+            "user_id": id,
+            "location": "Region %d" % rand.randint(1, LOCATIONS),
+            "actively_seeking": rand.random() < 0.5
+        } for id in user_ids))
+
+        def per_user(count, row):
+            id = 0
+            for user_id in user_ids:
+                for i in range(count):
+                    id += 1
+                    values = row(user_id)
+                    values.update({"id": id, "user_id": user_id, "modified": self.now})
+                    yield values
+
+        self._insert(Skill, per_user(SKILLS_PER_USER, lambda user_id: {
+            "technology_id": rand.randint(1, TECHNOLOGIES),
+            "expertise_type_id": rand.randint(1, EXPERTISE_TYPES),
+            "yrs_experience": rand.randint(0, 15)
+        }))
+        self._insert(JobLocationPref, per_user(LOCATION_PREFS_PER_USER, lambda user_id: {
+            "location_id": rand.randint(1, LOCATIONS)
+        }))
+        self._insert(JobTechnologyPref, per_user(TECHNOLOGY_PREFS_PER_USER, lambda user_id: {
+            "technology_id": rand.randint(1, TECHNOLOGIES)
+        }))
+        self._insert(JobPositionTypePref, per_user(POSITION_PREFS_PER_USER, lambda user_id: {
+            "position_type_id": rand.randint(1, POSITION_TYPES),
+            "salary_start": 50000,
+            "salary_end": 150000
+        }))
+
+        chats = users * CHAT_REELS_PER_USER
+        self._insert(Chat, ({
+            "id": id,
+            "topic_id": rand.choice(topic_ids)
+        } for id in range(1, chats + 1)))
+
+        chat_ids = iter(range(1, chats + 1))
+        self._insert(ChatReel, per_user(CHAT_REELS_PER_USER, lambda user_id: {
+            "chat_id": next(chat_ids),
+            "rank": 0
+        }))
+
+    def load(self, users):
+        """Create the schema and insert a data set.
+
+        Args:
+            users: number of users
+        """
+        self.create_schema()
+        self.load_reference_data()
+        topic_ids = self.load_topics(max(1, users // USERS_PER_TOPIC))
+        self.load_users(users, topic_ids)
@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+
+"""indexing.py
+This script measures indexing throughput offline. For each data set size,
+a local benchmark database is seeded with synthetic data, and then, for
+each index, the DocumentGenerator and the ESIndexer are run over the entire
+index. The ESIndexer sends its bulk requests to an in-process stand-in for
+ElasticSearch. Each run is made in a separate process, and reports docs/sec,
+db queries per document, peak RSS and bulk request bytes. In 'processes'
+mode the index is partitioned and indexed by a pool of worker processes,
+whose queries are counted but whose RSS is not included.
+
+The benchmark database is dropped and recreated. Do not point it at a
+database with data you want to keep.
+options:
+    -d --database=URL    sqlalchemy URL of the benchmark database (Required)
+    -u --users=USERS     comma separated list of data set sizes, in users (Optional. Defaults to 1000,10000)
+    -i --index=INDEX     comma separated list of index names (Optional. Defaults to all indexes)
+    -m --mode=MODE       comma separated list of modes, 'generator', 'indexer' and/or 'processes' (Optional. Defaults to generator,indexer)
+    -p --processes=N     number of worker processes in 'processes' mode (Optional. Defaults to number of cpus)
+    -S --skip-seed       Flag to use the data already in the benchmark database (Optional. Defaults to False. Requires a single data set size)
+"""
+import getopt
+import multiprocessing
+import os
+import Queue
+import resource
+import sys
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from tres.client import ESClient
+from tres.pool import ESClientPool
+from trpycore.factory.base import Factory
+from trindexsvc.gen.ttypes import IndexData
+
+PROJECT_DIRECTORY = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SERVICE =  os.path.basename(PROJECT_DIRECTORY)
+SERVICE_DIRECTORY = os.path.join(PROJECT_DIRECTORY, SERVICE)
+sys.path.insert(0, SERVICE_DIRECTORY)
+
+import settings
+
+from documents.factory import DocumentGeneratorFactory
+from documents.refcache import ReferenceCache
+import jobstats
+from indexers.factory import IndexerFactory
+from indexop import IndexAction, IndexOp
+from processpool import IndexProcessPool
+
+from esstub import ESStubServer
+from fixtures import FixtureLoader
+
+INDEXES = [
+    ("users", "user"),
+    ("technologies", "technology"),
+    ("topics", "topic"),
+    ("locations", "location")
+]
+MODES = ["generator", "indexer", "processes"]
+
+# Seconds between checks for a benchmark process exiting without results
+RESULTS_POLL_SECONDS = 5
+
+
+class Usage(Exception):
+    def __str__(self):
+        return __doc__
+
+class Config(object):
+
+    def __init__(self, argv):
+        self.database = None
+        self.users = [1000, 10000]
+        self.indexes = [name for name, type in INDEXES]
+        self.modes = ["generator", "indexer"]
+        self.processes = multiprocessing.cpu_count()
+        self.seed = True
+        try:
+            options, arguments = getopt.getopt(argv, "hSd:u:i:m:p:",["help", "skip-seed", "database=", "users=", "index=", "mode=", "processes="])
+
+            for option, argument in options:
+                if option in ("-h", "--help"):
+                    raise Usage()
+                elif option in ("-S", "--skip-seed"):
+                    self.seed = False
+                elif option in ("-d", "--database"):
+                    self.database = argument
+                elif option in ("-u", "--users"):
+                    self.users = [int(u) for u in argument.replace(" ", "").split(',')]
+                elif option in ("-i", "--index"):
+                    self.indexes = argument.replace(" ", "").split(',')
+                elif option in ("-m", "--mode"):
+                    self.modes = argument.replace(" ", "").split(',')
+                elif option in ("-p", "--processes"):
+                    self.processes = int(argument)
+                else:
+                    raise Usage()
+
+            if (not self.database or
+                self.database == settings.DATABASE_CONNECTION or
+                not set(self.modes).issubset(MODES) or
+                (not self.seed and len(self.users) != 1)):
+                raise Usage()
+
+        except Exception as e:
+            raise Usage()
+
+
+class QueryCounter(object):
+    """Counts the statements executed by an engine."""
+
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux and bytes on OS X
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        rss /= 1024
+    return rss / 1024.0
+
+def run_generator(db_session_factory, name, type):
+    generator = DocumentGeneratorFactory(
+        db_session_factory, name, type,
+        reference_cache=ReferenceCache()).create()
+    docs = 0
+    for key, doc in generator.generate([]):
+        docs += 1
+    return docs
+
+def run_indexer(db_session_factory, endpoint, name, type):
+    def es_client_factory():
+        return ESClient(endpoint)
+    es_client_pool = ESClientPool(
+        es_client_factory=Factory(es_client_factory),
+        size=1
+    )
+    settings.ES_ENDPOINT = endpoint
+    indexer = IndexerFactory(
+        db_session_factory,
+        es_client_pool,
+        name,
+        type,
+        reference_cache=ReferenceCache()).create()
+    indexop = IndexOp(IndexAction.Update, IndexData(name=name, type=type, keys=[]))
+    return indexer.index(indexop).count
+
+def run_processes(db_session_factory, database, endpoint, name, type, processes):
+    settings.ES_ENDPOINT = endpoint
+    pool = IndexProcessPool(processes, database, endpoint)
+    pool.start()
+    try:
+        indexer = IndexerFactory(db_session_factory, None, name, type).create()
+        indexop = IndexOp(IndexAction.Update, IndexData(name=name, type=type, keys=[]))
+        stats = jobstats.JobStats()
+        with jobstats.activate(stats):
+            count = pool.index(indexer.partition(indexop, processes)).count
+        return count, stats.counts[jobstats.QUERIES]
+    finally:
+        pool.stop()
+
+def run(results, database, endpoint, name, type, mode, processes):
+    """Run a benchmark in a child process and put its results on a queue."""
+    engine = create_engine(database)
+    counter = QueryCounter(engine)
+    db_session_factory = sessionmaker(bind=engine)
+    worker_queries = 0
+
+    start = time.time()
+    if mode == "generator":
+        docs = run_generator(db_session_factory, name, type)
+    elif mode == "indexer":
+        docs = run_indexer(db_session_factory, endpoint, name, type)
+    else:
+        docs, worker_queries = run_processes(
+                db_session_factory, database, endpoint, name, type, processes)
+    elapsed = time.time() - start
+    results.put((docs, elapsed, counter.count + worker_queries, peak_rss_mb()))
+
+def wait_results(process, results):
+    """Return the results of a benchmark process.
+
+    Returns:
+        results tuple, or None if the process exited without results.
+    """
+    while True:
+        # Results are put before the process exits, so they're
+        # available to a get() following its exit.
+        exited = process.exitcode is not None
+        try:
+            return results.get(timeout=RESULTS_POLL_SECONDS)
+        except Queue.Empty:
+            if exited:
+                return None
+
+def main(argv):
+    try:
+        es_server = None
+        config = Config(argv)
+
+        es_server = ESStubServer()
+        es_server.start()
+
+        print '################################################'
+        print "%-14s %8s %-10s %9s %8s %10s %12s %9s %9s %9s" % (
+            "index", "users", "mode", "docs", "secs", "docs/sec",
+            "queries/doc", "rss (MB)", "requests", "bulk (MB)")
+        for users in config.users:
+            if config.seed:
+                FixtureLoader(create_engine(config.database)).load(users)
+
+            for name, type in INDEXES:
+                if name not in config.indexes:
+                    continue
+                for mode in config.modes:
+                    es_server.stats.reset()
+                    results = multiprocessing.Queue()
+                    process = multiprocessing.Process(
+                        target=run,
+                        args=(results, config.database, es_server.endpoint, name, type, mode, config.processes))
+                    process.start()
+                    result = wait_results(process, results)
+                    process.join()
+                    if result is None:
+                        print "%-14s %8d %-10s failed (exit code %s)" % (
+                            name, users, mode, process.exitcode)
+                        continue
+                    docs, elapsed, queries, rss = result
+
+                    stats = es_server.stats
+                    print "%-14s %8d %-10s %9d %8.2f %10.1f %12.2f %9.1f %9d %9.2f" % (
+                        name, users, mode, docs, elapsed,
+                        docs / elapsed if elapsed else 0.0,
+                        float(queries) / docs if docs else 0.0,
+                        rss,
+                        stats.bulk_requests,
+                        stats.bulk_bytes / (1024.0 * 1024.0))
+        print '################################################'
+        return 0
+
+    except Usage, error:
+        print str(error)
+    except Exception, error:
+        print '**************************************************'
+        print 'Exception'
+        print '%s' % str(error)
+        print '**************************************************'
+    finally:
+        if es_server:
+            es_server.stop()
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+
+"""serializers.py
+This script compares the JSON serialization backends of the service on
+synthetic documents shaped like the user and topic index documents.
+For each installed backend, and for the Serializer selected from them,
+it reports encodes/sec and decodes/sec, the serialized bytes per document,
+and whether the backend's output is identical to the standard library
+json backend, which is required for it to be selected.
+options:
+    -n --iterations=N    number of times each document is encoded and decoded (Optional. Defaults to 2000)
+    -d --docs=DOCS       number of documents of each kind (Optional. Defaults to 10)
+"""
+import datetime
+import getopt
+import os
+import random
+import sys
+import time
+
+PROJECT_DIRECTORY = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SERVICE =  os.path.basename(PROJECT_DIRECTORY)
+SERVICE_DIRECTORY = os.path.join(PROJECT_DIRECTORY, SERVICE)
+sys.path.insert(0, SERVICE_DIRECTORY)
+
+import serialization
+
+BACKENDS = [
+    serialization.UJSONBackend,
+    serialization.SimpleJSONBackend,
+    serialization.JSONBackend
+]
+
+TECHNOLOGIES = [u"Python", u"C++", u"Java", u"JavaScript", u"Ruby", u"Go", u"Scala", u"SQL"]
+EXPERTISE_TYPES = [u"Beginner", u"Proficient", u"Expert"]
+REGIONS = [u"Boston, MA", u"San Francisco, CA", u"Montr\xe9al, QC", u"New York, NY"]
+POSITION_TYPES = [u"Junior Developer", u"Senior Developer", u"Team Lead", u"Contractor"]
+WORDS = [u"design", u"scalable", u"services", u"using", u"caching", u"and", u"queues",
+         u"for", u"high", u"throughput", u"systems", u"with", u"C/C++", u"\"tuning\""]
+
+
+class Usage(Exception):
+    def __str__(self):
+        return __doc__
+
+class Config(object):
+
+    def __init__(self, argv):
+        self.iterations = 2000
+        self.docs = 10
+        try:
+            options, arguments = getopt.getopt(argv, "hn:d:",["help", "iterations=", "docs="])
+
+            for option, argument in options:
+                if option in ("-h", "--help"):
+                    raise Usage()
+                elif option in ("-n", "--iterations"):
+                    self.iterations = int(argument)
+                elif option in ("-d", "--docs"):
+                    self.docs = int(argument)
+                else:
+                    raise Usage()
+
+            if self.iterations <= 0 or self.docs <= 0:
+                raise Usage()
+
+        except Exception as e:
+            raise Usage()
+
+
+def text(rand, words):
+    return u" ".join([rand.choice(WORDS) for i in range(words)])
+
+def user_doc(rand, id):
+    """Return a document shaped like an ESUserDocument."""
+    skills = [{
+        "id": id * 10 + i,
+        "name": rand.choice(TECHNOLOGIES),
+        "yrs_experience": rand.randint(1, 15),
+        "technology_id": rand.randint(1, len(TECHNOLOGIES)),
+        "expertise_type_id": rand.randint(1, len(EXPERTISE_TYPES)),
+        "expertise_type": rand.choice(EXPERTISE_TYPES)
+    } for i in range(rand.randint(3, 10))]
+    return {
+        "id": id,
+        "joined": datetime.datetime(2012, 1, 1) + datetime.timedelta(seconds=rand.randint(0, 10 ** 8)),
+        "location": rand.choice(REGIONS),
+        "actively_seeking": rand.random() < 0.5,
+        "skills": skills,
+        "technology_prefs": [{
+            "id": id * 10 + i,
+            "name": rand.choice(TECHNOLOGIES),
+            "technology_id": rand.randint(1, len(TECHNOLOGIES))
+        } for i in range(rand.randint(0, 4))],
+        "location_prefs": [{
+            "id": id * 10 + i,
+            "location_id": rand.randint(1, len(REGIONS)),
+            "region": rand.choice(REGIONS)
+        } for i in range(rand.randint(0, 3))],
+        "position_prefs": [{
+            "id": id * 10 + i,
+            "type": rand.choice(POSITION_TYPES),
+            "type_id": rand.randint(1, len(POSITION_TYPES)),
+            "salary_start": rand.randint(50, 100) * 1000,
+            "salary_end": rand.randint(100, 200) * 1000
+        } for i in range(rand.randint(0, 2))],
+        "chats": [{
+            "id": id * 10 + i,
+            "topic_id": rand.randint(1, 1000),
+            "topic_title": text(rand, 4)
+        } for i in range(rand.randint(0, 5))],
+        "yrs_experience": max([skill["yrs_experience"] for skill in skills]),
+        "score": rand.random() * 10,
+        "demo": False
+    }
+
+def topic_doc(rand, id):
+    """Return a document shaped like a topic index document."""
+    tree = [{
+        "id": id * 100 + i,
+        "type_id": 1,
+        "type": u"default",
+        "duration": rand.randint(1, 30) * 60,
+        "title": text(rand, 4),
+        "description": text(rand, 30),
+        "recommended_participants": rand.randint(1, 4),
+        "rank": i,
+        "public": True,
+        "active": True,
+        "level": 0 if i == 0 else rand.randint(1, 3)
+    } for i in range(rand.randint(2, 12))]
+    return {
+        "id": id,
+        "type": u"default",
+        "duration": sum([topic["duration"] for topic in tree[1:]]),
+        "title": tree[0]["title"],
+        "description": tree[0]["description"],
+        "subtopic_summary": u" ".join([topic["title"] for topic in tree[1:]]),
+        "public": True,
+        "active": True,
+        "tree": tree,
+        "tags": [{"id": rand.randint(1, 100), "name": rand.choice(TECHNOLOGIES)}
+                 for i in range(rand.randint(0, 5))]
+    }
+
+def measure(iterations, function, items):
+    """Return the number of calls per second of function over items."""
+    start = time.time()
+    for i in range(iterations):
+        for item in items:
+            function(item)
+    elapsed = time.time() - start
+    return iterations * len(items) / elapsed if elapsed else 0.0
+
+def report(label, backend, reference, iterations, docs):
+    data = [reference.dumps(doc) for doc in docs]
+    exact = all([backend.dumps(doc) == expected for doc, expected in zip(docs, data)])
+    encodes = measure(iterations, backend.dumps, docs)
+    decodes = measure(iterations, backend.loads, data)
+    size = sum([len(backend.dumps(doc)) for doc in docs]) / float(len(docs))
+    print "%-8s %-22s %12.1f %12.1f %10.1f %7s" % (
+        label, backend.name, encodes, decodes, size, "yes" if exact else "no")
+
+def main(argv):
+    try:
+        config = Config(argv)
+
+        rand = random.Random(0)
+        kinds = [
+            ("user", [user_doc(rand, id) for id in range(1, config.docs + 1)]),
+            ("topic", [topic_doc(rand, id) for id in range(1, config.docs + 1)])
+        ]
+        reference = serialization.JSONBackend()
+        serializer = serialization.Serializer()
+        serializer.name = "serializer(%s/%s)" % (serializer.encoder.name, serializer.decoder.name)
+
+        print '################################################'
+        print "%-8s %-22s %12s %12s %10s %7s" % (
+            "doc", "backend", "encodes/sec", "decodes/sec", "bytes/doc", "exact")
+        for kind, docs in kinds:
+            for backend_class in BACKENDS:
+                try:
+                    backend = backend_class()
+                except ImportError:
+                    continue
+                report(kind, backend, reference, config.iterations, docs)
+            report(kind, serializer, reference, config.iterations, docs)
+        print '################################################'
+        return 0
+
+    except Usage, error:
+        print str(error)
+    except Exception, error:
+        print '**************************************************'
+        print 'Exception'
+        print '%s' % str(error)
+        print '**************************************************'
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
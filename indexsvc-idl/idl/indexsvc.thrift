@@ -13,6 +13,19 @@ exception InvalidDataException {
     1: string fault,
 }
 
+/*
+IndexPriority
+   Priority lanes of index jobs. Each lane has reserved
+   worker threads, so that interactive jobs are not held
+   up by jobs updating entire indexes.
+   INTERACTIVE: small jobs which should be processed immediately
+   BULK: large jobs, i.e. jobs updating or rebuilding entire indexes
+*/
+enum IndexPriority {
+    INTERACTIVE = 1,
+    BULK = 2,
+}
+
 /*
 IndexData
    This is not the data that is actually being indexed, but
@@ -23,12 +36,20 @@ IndexData
    name: index name
    type: document type
    keys: list of db keys that need to be indexed
+   fields: optional list of top-level document fields that need
+       to be updated. Restricts updates to partial updates of
+       existing documents. Ignored by indexes that do not
+       support partial updates.
+   priority: optional IndexPriority. If not provided, the priority
+       is derived from the keys and the request context.
 */
 struct IndexData {
     1: optional double notBefore,
     3: string name,
     4: string type,
     5: optional list<string> keys,
+    6: optional list<string> fields,
+    7: optional IndexPriority priority,
 }
 
 service TIndexService extends core.TRService
@@ -61,6 +82,58 @@ service TIndexService extends core.TRService
                 1:UnavailableException unavailableException,
                 2:InvalidDataException invalidDataException),
 
+    /*
+        Update index data for a batch of IndexData objects.
+        All jobs are created in a single transaction.
+        Args:
+            context: string representing the request context
+            indexDataList: list of Thrift IndexData objects.
+                IndexData objects without keys update all
+                data within the index.
+        Returns:
+            None
+    */
+    void indexBatch(
+        1: string context,
+        2: list<IndexData> indexDataList) throws (
+                1:UnavailableException unavailableException,
+                2:InvalidDataException invalidDataException),
+
+    /*
+        Rebuild the entire index without interrupting searches.
+        A new version of the index is created from its mapping
+        file and loaded. The index name, an alias, is then
+        atomically switched to the new version.
+        Args:
+            context: string representing the request context
+            indexData: Thrift IndexData object. IndexData.keys
+                not supported.
+        Returns:
+            None
+    */
+    void rebuild(
+        1: string context,
+        2: IndexData indexData) throws (
+                1:UnavailableException unavailableException,
+                2:InvalidDataException invalidDataException),
+
+    /*
+        Update the data within the index which changed since the
+        last incremental update of the index. If the index has not
+        been incrementally updated before, all data is updated.
+        Args:
+            context: string representing the request context
+            indexData: Thrift IndexData object. IndexData.keys
+                not supported.
+        Returns:
+            None
+    */
+    void indexIncremental(
+        1: string context,
+        2: IndexData indexData) throws (
+                1:UnavailableException unavailableException,
+                2:InvalidDataException invalidDataException),
+
     /*
     For future.
 
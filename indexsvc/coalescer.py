@@ -0,0 +1,221 @@
+import logging
+
+from sqlalchemy.sql import func, text
+
+from trsvcscore.db.models import IndexJob
+from trindexsvc.gen.ttypes import IndexData
+
+from indexop import IndexOp, IndexOpSQL
+
+
+class IndexJobCoalescer(object):
+    """Merges pending IndexJobs into the IndexJob being processed.
+
+    Once a job has been claimed, ready and unclaimed jobs with the same
+    index name, document type and action are claimed as well and merged
+    into a single index operation over the union of their keys. If any
+    of the merged jobs operates on the entire index, the merged operation
+    does too, which absorbs all keyed jobs for that index.
+
+    Candidate jobs are selected and locked with SELECT ... FOR UPDATE
+    SKIP LOCKED, so jobs being claimed by other claimers are skipped,
+    and mergeable jobs are claimed with a single update.
+
+    Merged jobs are finished together with the job they were merged into.
+    """
+    def __init__(self, db_session_factory, owner='indexsvc', max_jobs=1000,
+                 membership=None):
+        """Constructor.
+
+        Args:
+            db_session_factory: callable returning a new sqlalchemy db session
+            owner: IndexJob owner to record for claimed jobs
+            max_jobs: maximum number of jobs to merge into a single job
+            membership: optional IndexMembership object. If provided,
+                only jobs which may be claimed by this node are merged.
+        """
+        self.log = logging.getLogger(__name__)
+        self.db_session_factory = db_session_factory
+        self.owner = owner
+        self.max_jobs = max_jobs
+        self.membership = membership
+
+    def _mergeable(self, indexop, candidate):
+        """Check if candidate IndexOp can be merged into indexop.
+
+        Args:
+            indexop: IndexOp object being processed
+            candidate: IndexOp object of a pending job
+        Returns:
+            True if the candidate can be merged, False otherwise.
+        """
+        return candidate.action == indexop.action and\
+               candidate.data.name == indexop.data.name and\
+               candidate.data.type == indexop.data.type and\
+               sorted(candidate.data.fields or []) == sorted(indexop.data.fields or []) and\
+               candidate.data.priority == indexop.data.priority and\
+               candidate.key_range is None
+
+    def _candidates(self, job, indexop):
+        """Return the query locking the pending jobs which may be merged.
+
+        Jobs with the same action, index name and document type are
+        selected in SQL. Given an IndexMembership, only jobs owned by
+        this node, or ready for the membership's grace period, are
+        selected, as when jobs are claimed by IndexJobQueue.
+
+        Args:
+            job: claimed IndexJob db model object
+            indexop: IndexOp object of the claimed job
+        Returns:
+            (SQL statement, dict of bind params) tuple
+        """
+        table = IndexJob.__table__
+        data = IndexOpSQL(table.c.data.name)
+        columns = {
+            "table": table.fullname,
+            "id": table.c.id.name,
+            "data": table.c.data.name,
+            "owner": table.c.owner.name,
+            "not_before": table.c.not_before.name
+        }
+        params = {
+            "job_id": job.id,
+            "action": indexop.action,
+            "name": indexop.data.name,
+            "type": indexop.data.type,
+            "max_jobs": self.max_jobs
+        }
+        predicates = [
+            "%(id)s != :job_id" % columns,
+            "%(owner)s IS NULL" % columns,
+            "%(not_before)s <= current_timestamp" % columns,
+            "%s = :action" % data.action,
+            "%s = :name" % data.name,
+            "%s = :type" % data.type
+        ]
+
+        if self.membership is not None:
+            owned_clause, owned_params = self.membership.clause(data)
+            if owned_clause is not None:
+                predicates.append("(%s OR %s <= current_timestamp - :grace_seconds * interval '1 second')" %\
+                        (owned_clause, columns["not_before"]))
+                params.update(owned_params)
+                params["grace_seconds"] = self.membership.grace_seconds
+
+        statement = "SELECT %(id)s, %(data)s FROM %(table)s WHERE %(predicates)s "\
+                "ORDER BY %(id)s LIMIT :max_jobs FOR UPDATE SKIP LOCKED" % dict(columns,
+                        predicates=" AND ".join(predicates))
+        return statement, params
+
+    def coalesce(self, job, indexop):
+        """Claim and merge pending jobs matching the specified job.
+
+        Args:
+            job: claimed IndexJob db model object
+            indexop: IndexOp object of the claimed job
+        Returns:
+            (IndexOp, list of merged IndexJob ids) tuple. The IndexOp
+            covers the input job and all merged jobs.
+        """
+        if indexop.key_range is not None:
+            return (indexop, [])
+
+        statement, params = self._candidates(job, indexop)
+        try:
+            db_session = None
+            db_session = self.db_session_factory()
+
+            candidates = db_session.execute(
+                    text(statement), params).fetchall()
+
+            merged_job_ids = []
+            index_all = not len(indexop.data.keys)
+            keys = list(indexop.data.keys)
+            seen_keys = set(keys)
+            sources = list(indexop.sources)
+
+            for job_id, data in candidates:
+                try:
+                    candidate = IndexOp.from_json(data)
+                except Exception:
+                    continue
+                if not self._mergeable(indexop, candidate):
+                    continue
+
+                merged_job_ids.append(job_id)
+                if not len(candidate.data.keys):
+                    index_all = True
+                for key in candidate.data.keys:
+                    if key not in seen_keys:
+                        seen_keys.add(key)
+                        keys.append(key)
+                sources.extend([s for s in candidate.sources if s not in sources])
+
+            # Claim the locked jobs in a single statement
+            if merged_job_ids:
+                claimed = db_session.query(IndexJob)\
+                        .filter(IndexJob.id.in_(merged_job_ids))\
+                        .filter(IndexJob.owner == None)\
+                        .update({
+                            IndexJob.owner: self.owner,
+                            IndexJob.start: func.current_timestamp()
+                        }, synchronize_session=False)
+                if claimed != len(merged_job_ids):
+                    raise Exception("Claimed %d of IndexJobs %s" % (claimed, merged_job_ids))
+
+            db_session.commit()
+
+        except Exception as e:
+            self.log.exception(e)
+            if db_session:
+                db_session.rollback()
+            return (indexop, [])
+        finally:
+            if db_session:
+                db_session.close()
+
+        if not merged_job_ids:
+            return (indexop, [])
+
+        self.log.info("Merged IndexJobs %s into index_job_id=%d" % (merged_job_ids, job.id))
+        merged_indexop = IndexOp(
+            action=indexop.action,
+            data=IndexData(
+                name=indexop.data.name,
+                type=indexop.data.type,
+                keys=[] if index_all else keys,
+                fields=indexop.data.fields,
+                priority=indexop.data.priority),
+            sources=sources)
+        return (merged_indexop, merged_job_ids)
+
+    def finish(self, job_ids, successful):
+        """Mark merged jobs as finished.
+
+        Args:
+            job_ids: list of merged IndexJob ids
+            successful: boolean indicating if the merged operation succeeded
+        Returns:
+            None
+        """
+        if not job_ids:
+            return
+
+        try:
+            db_session = None
+            db_session = self.db_session_factory()
+            db_session.query(IndexJob)\
+                    .filter(IndexJob.id.in_(job_ids))\
+                    .update({
+                        IndexJob.end: func.current_timestamp(),
+                        IndexJob.successful: successful
+                    }, synchronize_session=False)
+            db_session.commit()
+        except Exception as e:
+            self.log.exception(e)
+            if db_session:
+                db_session.rollback()
+        finally:
+            if db_session:
+                db_session.close()
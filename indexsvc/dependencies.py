@@ -0,0 +1,176 @@
+import logging
+
+from sqlalchemy.sql import func
+
+from trsvcscore.db.models import IndexJob, Chat, ChatReel, Skill, \
+        JobTechnologyPref, JobLocationPref
+from trindexsvc.gen.ttypes import IndexData
+
+import serialization
+from indexop import IndexAction, IndexOp
+from notify import notify_index_job
+
+
+class DocumentDependency(object):
+    """Dependency of an index's documents upon another index's source table.
+
+    Documents of the dependent index copy (denormalize) data from the
+    rows which are indexed in the source index. When source rows change,
+    the dependent documents referencing them need to be reindexed.
+
+    Args:
+        name: dependent index name
+        type: dependent document type
+        source_name: source index name
+        key_column: column holding the dependent document key
+        source_column: column referencing the source document key
+        join: optional (target, onclause) tuple required to relate
+            key_column and source_column
+    """
+    def __init__(self, name, type, source_name, key_column, source_column, join=None):
+        self.name = name
+        self.type = type
+        self.source_name = source_name
+        self.key_column = key_column
+        self.source_column = source_column
+        self.join = join
+
+    def affected_keys(self, db_session, source_keys):
+        """Return the keys of dependent documents referencing the source keys.
+
+        Args:
+            db_session: sqlalchemy db session
+            source_keys: list of source document keys
+        Returns:
+            list of dependent document keys
+        """
+        query = db_session.query(self.key_column).distinct()
+        if self.join is not None:
+            query = query.join(*self.join)
+        query = query.filter(self.source_column.in_(source_keys))
+        return [key for (key,) in query]
+
+
+# Declared dependencies between document types and source tables.
+DEPENDENCIES = [
+    # users/user skills[].name
+    DocumentDependency("users", "user", "technologies",
+        Skill.user_id, Skill.technology_id),
+    # users/user technology_prefs[].name
+    DocumentDependency("users", "user", "technologies",
+        JobTechnologyPref.user_id, JobTechnologyPref.technology_id),
+    # users/user location_prefs[].region
+    DocumentDependency("users", "user", "locations",
+        JobLocationPref.user_id, JobLocationPref.location_id),
+    # users/user chats[].topic_title
+    DocumentDependency("users", "user", "topics",
+        ChatReel.user_id, Chat.topic_id, join=(Chat, ChatReel.chat_id == Chat.id)),
+]
+
+
+class DependencyFanout(object):
+    """Creates IndexJobs for documents depending on an index operation.
+
+    After a keyed index operation on a source index completes, the keys
+    of dependent documents are determined with set-based queries and
+    keyed IndexJobs are created to reindex them. Operations on an entire
+    source index, i.e. scheduled reindexes, are not fanned out, since
+    they would reindex the entire dependent index.
+
+    Created jobs record the source index, so that the node processing
+    them invalidates its cached reference rows of the source index.
+    """
+    def __init__(self, db_session_factory, job_max_retry_attempts,
+                 max_keys=1000, dependencies=None, notify_channel=None):
+        """Constructor.
+
+        Args:
+            db_session_factory: callable returning a new sqlalchemy db session
+            job_max_retry_attempts: retries_remaining of created jobs
+            max_keys: maximum number of keys per created job
+            dependencies: list of DocumentDependency objects.
+                Defaults to DEPENDENCIES.
+            notify_channel: optional Postgres notification channel
+                signalled when IndexJobs are created.
+        """
+        self.log = logging.getLogger(__name__)
+        self.db_session_factory = db_session_factory
+        self.job_max_retry_attempts = job_max_retry_attempts
+        self.max_keys = max_keys
+        if dependencies is None:
+            dependencies = DEPENDENCIES
+        self.dependencies = dependencies
+        self.notify_channel = notify_channel
+
+    def _affected(self, db_session, indexop):
+        """Determine the dependent documents affected by an index operation.
+
+        Args:
+            db_session: sqlalchemy db session
+            indexop: IndexOp object of the source operation
+        Returns:
+            dict of {(name, type): list of keys}
+        """
+        affected = {}
+        for dependency in self.dependencies:
+            if dependency.source_name != indexop.data.name:
+                continue
+
+            keys = affected.setdefault((dependency.name, dependency.type), [])
+            keys.extend(dependency.affected_keys(db_session, indexop.data.keys))
+        return affected
+
+    def fan_out(self, indexop, context):
+        """Create IndexJobs for documents depending on the index operation.
+
+        Args:
+            indexop: IndexOp object of the completed source operation
+            context: context of the created IndexJobs
+        Returns:
+            number of IndexJobs created
+        """
+        if not indexop.data.keys or\
+           indexop.key_range is not None or\
+           indexop.action == IndexAction.Delete:
+            return 0
+        if not [d for d in self.dependencies if d.source_name == indexop.data.name]:
+            return 0
+
+        try:
+            db_session = None
+            db_session = self.db_session_factory()
+
+            jobs = []
+            for (name, type), keys in self._affected(db_session, indexop).items():
+                if not keys:
+                    continue
+
+                keys = sorted(set([str(key) for key in keys]))
+                chunks = [keys[i:i + self.max_keys] for i in range(0, len(keys), self.max_keys)]
+                for chunk in chunks:
+                    data = IndexOp(
+                        action=IndexAction.Update,
+                        data=IndexData(name=name, type=type, keys=chunk),
+                        sources=[indexop.data.name])
+                    jobs.append(IndexJob(
+                        data=serialization.dumps(data.to_json()),
+                        context=context,
+                        created=func.current_timestamp(),
+                        not_before=func.current_timestamp(),
+                        retries_remaining=self.job_max_retry_attempts))
+                self.log.info("Reindexing %d '%s/%s' documents depending on '%s'" %\
+                              (len(keys), name, type, indexop.data.name))
+
+            db_session.add_all(jobs)
+            if jobs and self.notify_channel:
+                notify_index_job(db_session, self.notify_channel)
+            db_session.commit()
+            return len(jobs)
+
+        except Exception:
+            if db_session:
+                db_session.rollback()
+            raise
+        finally:
+            if db_session:
+                db_session.close()
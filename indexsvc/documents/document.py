@@ -1,5 +1,40 @@
 import logging
 
+from sqlalchemy.sql import func
+
+from jobstats import Stage, HYDRATE
+from refcache import ReferenceCache
+
+
+class ModifiedSource(object):
+    """Source table whose modification timestamps documents depend on.
+
+    Args:
+        key_column: column holding the document key
+        modified_column: column holding the row modification timestamp
+        join: optional (target, onclause) tuple required to relate
+            key_column and modified_column
+    """
+    def __init__(self, key_column, modified_column, join=None):
+        self.key_column = key_column
+        self.modified_column = modified_column
+        self.join = join
+
+    def changed_keys(self, db_session, since):
+        """Return the keys of documents with rows modified since a time.
+
+        Args:
+            db_session: sqlalchemy db session
+            since: datetime
+        Returns:
+            list of document keys
+        """
+        query = db_session.query(self.key_column).distinct()
+        if self.join is not None:
+            query = query.join(*self.join)
+        query = query.filter(self.modified_column >= since)
+        return [key for (key,) in query]
+
 
 class DocumentGenerator(object):
     """DocumentGenerator objects are responsible for knowing how to fetch
@@ -8,15 +43,36 @@ class DocumentGenerator(object):
     This class is designed to be used as a base class. Derived classes are
     responsible for overriding the generate() method.
 
+    Derived classes which read documents from a single model keyed by
+    a unique, orderable column may also set key_column and override
+    _query() in order to support key ranges. Key ranges allow
+    a full index operation to be split into partitions.
+
+    Derived classes may also override _modified_sources() to declare
+    the modification timestamps their documents depend on, in order
+    to support incremental index operations.
+
+    Derived classes able to generate partial documents list the
+    top-level document fields which may be requested in scoped_fields,
+    and override generate_fields().
+
     Args:
         db_session_factory: callable returning a new sqlalchemy db session
+        chunk_size: maximum number of rows read from the db at once
+        reference_cache: optional ReferenceCache used to resolve
+            reference rows embedded in documents. If not provided,
+            a cache private to the generator is used.
     """
 
-    def __init__(self, db_session_factory):
+    def __init__(self, db_session_factory, chunk_size=500, reference_cache=None):
         self.log = logging.getLogger(__name__)
         self.db_session_factory = db_session_factory
+        self.chunk_size = chunk_size
+        self.reference_cache = reference_cache or ReferenceCache()
+        self.key_column = None
+        self.scoped_fields = ()
 
-    def generate(self, keys):
+    def generate(self, keys, key_range=None):
         """ Generate a document
 
         Sub-classes should override this method which encapsulates the
@@ -25,9 +81,175 @@ class DocumentGenerator(object):
 
         Args:
             keys: list of db keys
+            key_range: optional (start, end) tuple restricting the
+                generated documents to keys >= start and < end.
+                Either bound may be None to leave it open.
 
         Returns:
             Uses a generator to return an indexable document
 
         """
-        pass
\ No newline at end of file
+        pass
+
+    def supports_fields(self, fields):
+        """Check if partial documents with the specified fields can be generated.
+
+        Args:
+            fields: list of top-level document field names
+        Returns:
+            True if generate_fields() supports the fields.
+        """
+        return bool(fields) and set(fields).issubset(self.scoped_fields)
+
+    def generate_fields(self, keys, fields, key_range=None):
+        """ Generate partial documents
+
+        Sub-classes supporting partial documents should override this
+        method and set scoped_fields. Callers check supports_fields()
+        before invoking it.
+
+        Partial documents contain the requested fields, along with any
+        fields derived from them, and may be applied to existing
+        documents as partial updates.
+
+        Args:
+            keys: list of db keys
+            fields: list of top-level document field names
+            key_range: optional (start, end) tuple of keys
+
+        Returns:
+            Uses a generator to return a tuple of (key, partial JSON dictionary)
+        """
+        return iter([])
+
+    def key_range(self):
+        """Return the range of keys of the documents which can be generated.
+
+        Returns:
+            (min key, max key) tuple, or None if the generator
+            does not support key ranges or there are no documents.
+        """
+        if self.key_column is None:
+            return None
+
+        try:
+            db_session = None
+            db_session = self.db_session_factory()
+            query = self._query(db_session).with_entities(
+                func.min(self.key_column),
+                func.max(self.key_column))
+            min_key, max_key = query.one()
+            db_session.commit()
+        finally:
+            if db_session:
+                db_session.close()
+
+        if min_key is None:
+            return None
+        return (min_key, max_key)
+
+    def _modified_sources(self):
+        """Return the sources whose modifications change documents.
+
+        Sub-classes supporting incremental index operations should
+        override this method. Sources are only evaluated for
+        incremental operations.
+
+        Returns:
+            list of ModifiedSource objects
+        """
+        return []
+
+    def changed_keys(self, since):
+        """Return the keys of documents whose source rows changed.
+
+        Rows which are deleted are not detected.
+
+        Args:
+            since: datetime
+        Returns:
+            sorted list of document keys, or None if the generator
+            does not declare its modified sources.
+        """
+        sources = self._modified_sources()
+        if not sources:
+            return None
+
+        try:
+            db_session = None
+            db_session = self.db_session_factory()
+            keys = set()
+            for source in sources:
+                keys.update(source.changed_keys(db_session, since))
+            db_session.commit()
+        finally:
+            if db_session:
+                db_session.close()
+        return sorted(keys)
+
+    def _query(self, db_session):
+        """Return query for the model objects documents are generated from.
+
+        Sub-classes supporting key ranges should override this method.
+        Query options, i.e. joinedload(), should not be applied here.
+
+        Args:
+            db_session: sqlalchemy db session
+        Returns:
+            sqlalchemy query
+        """
+        return None
+
+    def _filter_keys(self, query, keys, key_range=None):
+        """Restrict query to the specified keys and key range.
+
+        Args:
+            query: sqlalchemy query
+            keys: list of db keys. An empty list implies all keys.
+            key_range: optional (start, end) tuple of keys
+        Returns:
+            sqlalchemy query
+        """
+        if len(keys):
+            query = query.filter(self.key_column.in_(keys))
+        if key_range is not None:
+            start, end = key_range
+            if start is not None:
+                query = query.filter(self.key_column >= start)
+            if end is not None:
+                query = query.filter(self.key_column < end)
+        return query
+
+    def _iter_chunks(self, db_session, query, key_column):
+        """Page through query results in chunks of chunk_size rows.
+
+        Rows are read in key order using key ranges (keyset pagination)
+        rather than loading the entire result set at once, so memory use
+        is bounded by the chunk size and not by the size of the table.
+        ORM state for a chunk is released from the session once the
+        caller is done with it.
+
+        Args:
+            db_session: sqlalchemy db session
+            query: sqlalchemy query of the rows to read
+            key_column: unique, orderable column to page by, i.e. User.id
+        Returns:
+            Uses a generator to return lists of model objects
+        """
+        last_key = None
+        while True:
+            chunk_query = query
+            if last_key is not None:
+                chunk_query = chunk_query.filter(key_column > last_key)
+            with Stage(HYDRATE):
+                chunk = chunk_query.order_by(key_column).limit(self.chunk_size).all()
+            if not chunk:
+                break
+
+            last_key = getattr(chunk[-1], key_column.key)
+            yield chunk
+
+            # Processing of the chunk is complete
+            db_session.expunge_all()
+            if len(chunk) < self.chunk_size:
+                break
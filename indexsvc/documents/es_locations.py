@@ -1,34 +1,42 @@
 from trsvcscore.db.models import Location
 
-from document import DocumentGenerator
+from document import DocumentGenerator, ModifiedSource
 
 
 class ESLocationDocumentGenerator(DocumentGenerator):
     """ESLocationDocumentGenerator generates ES Location docs."""
 
-    def __init__(self, db_session_factory):
-        super(ESLocationDocumentGenerator, self).__init__(db_session_factory)
+    def __init__(self, db_session_factory, chunk_size=500, reference_cache=None):
+        super(ESLocationDocumentGenerator, self).__init__(
+                db_session_factory, chunk_size, reference_cache)
+        self.key_column = Location.id
 
-    def generate(self, keys):
+    def _query(self, db_session):
+        return db_session.query(Location)
+
+    def _modified_sources(self):
+        return [ModifiedSource(Location.id, Location.modified)]
+
+    def generate(self, keys, key_range=None):
         """Generates a JSON dict that can be indexed by ES
 
         Args:
-            key: user db key
+            keys: list of db keys. An empty list implies all keys.
+            key_range: optional (start, end) tuple of db keys
         Returns:
             Uses a generator to return a tuple of (key, JSON dictionary)
         """
         try:
             db_session = self.db_session_factory()
-            query = db_session.query(Location)
-            if len(keys):
-                query = query.filter(Location.id.in_(keys))
-
-            for location in query.all():
-                location_json = {
-                    "id": location.id,
-                    "region": location.region
-                }
-                yield (location.id, location_json)
+            query = self._filter_keys(self._query(db_session), keys, key_range)
+
+            for locations in self._iter_chunks(db_session, query, Location.id):
+                for location in locations:
+                    location_json = {
+                        "id": location.id,
+                        "region": location.region
+                    }
+                    yield (location.id, location_json)
 
             db_session.commit()
 
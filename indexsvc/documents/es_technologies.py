@@ -1,41 +1,49 @@
-from sqlalchemy.orm import joinedload
-
 from trsvcscore.db.models import Technology
 
-from document import DocumentGenerator
+from document import DocumentGenerator, ModifiedSource
+from refcache import TECHNOLOGY_TYPES
 
 
 class ESTechnologyDocumentGenerator(DocumentGenerator):
     """ESTechnologyDocumentGenerator generates ES Technology docs."""
 
-    def __init__(self, db_session_factory):
-        super(ESTechnologyDocumentGenerator, self).__init__(db_session_factory)
+    def __init__(self, db_session_factory, chunk_size=500, reference_cache=None):
+        super(ESTechnologyDocumentGenerator, self).__init__(
+                db_session_factory, chunk_size, reference_cache)
+        self.key_column = Technology.id
+
+    def _query(self, db_session):
+        return db_session.query(Technology)
 
-    def generate(self, keys):
+    def _modified_sources(self):
+        return [ModifiedSource(Technology.id, Technology.modified)]
+
+    def generate(self, keys, key_range=None):
         """Generates a JSON dict that can be indexed by ES
 
         Args:
-            key: user db key
+            keys: list of db keys. An empty list implies all keys.
+            key_range: optional (start, end) tuple of db keys
         Returns:
             Uses a generator to return a tuple of (key, JSON dictionary)
         """
         try:
             db_session = self.db_session_factory()
 
-            query = db_session.query(Technology).options(joinedload(Technology.type))
-            if len(keys):
-                query = query.filter(Technology.id.in_(keys))
-            
-            for technology in query.all():
-                
-                technology_json = {
-                    "id": technology.id,
-                    "name": technology.name,
-                    "description": technology.description,
-                    "type_id": technology.type_id,
-                    "type": technology.type.name
-                }
-                yield (technology.id, technology_json)
+            query = self._filter_keys(self._query(db_session), keys, key_range)
+
+            for technologies in self._iter_chunks(db_session, query, Technology.id):
+                types = self.reference_cache.get(db_session, TECHNOLOGY_TYPES,
+                        [technology.type_id for technology in technologies])
+                for technology in technologies:
+                    technology_json = {
+                        "id": technology.id,
+                        "name": technology.name,
+                        "description": technology.description,
+                        "type_id": technology.type_id,
+                        "type": types[technology.type_id]["name"]
+                    }
+                    yield (technology.id, technology_json)
             
             db_session.commit()
 
@@ -1,18 +1,40 @@
-from sqlalchemy.orm import joinedload
+from collections import defaultdict
+
+from sqlalchemy.orm import aliased
+from sqlalchemy.sql import literal
 
 from trsvcscore.db.models import Topic, TopicTag, Tag
-from trsvcscore.db.managers.tree import TreeManager
 
+from jobstats import Stage, HYDRATE
 from document import DocumentGenerator
+from refcache import TOPIC_TYPES
 
 
 class ESTopicDocumentGenerator(DocumentGenerator):
-    """ESTopicDocumentGenerator generates ES Topic docs."""
+    """ESTopicDocumentGenerator generates ES Topic docs.
+
+    Root topics are read in chunks. For each chunk, the topic trees
+    of all roots are read with a single recursive query, and the tags
+    of all roots with a single query, regardless of the number of roots.
+    """
+
+    # Level of root topics within a topic tree
+    ROOT_LEVEL = 0
+
+    def __init__(self, db_session_factory, chunk_size=500, reference_cache=None):
+        super(ESTopicDocumentGenerator, self).__init__(
+                db_session_factory, chunk_size, reference_cache)
+        self.key_column = Topic.id
 
-    def __init__(self, db_session_factory):
-        super(ESTopicDocumentGenerator, self).__init__(db_session_factory)
+        # Only index root topics since there aren't any use cases at
+        # the present time to search for sub-topics.  Subtopic titles
+        # and descriptions are indexed via the 'subtopic_summary' field.
+        self.root_topic_rank = 0
 
-    def _topic_to_json(self, topic, level):
+    def _query(self, db_session):
+        return db_session.query(Topic).filter(Topic.rank == self.root_topic_rank)
+
+    def _topic_to_json(self, topic, level, types):
         """ Converts a Topic object to JSON representation
 
          This method is intended to be used only for constructing the
@@ -22,13 +44,14 @@ class ESTopicDocumentGenerator(DocumentGenerator):
          Args:
             topic: Topic object
             level: topic level
+            types: dict of {type_id: topic type row}
         Returns:
             JSON dict
         """
         return {
             "id": topic.id,
             "type_id": topic.type_id,
-            "type": topic.type.name,
+            "type": types[topic.type_id]["name"],
             "duration": topic.duration,
             "title": topic.title,
             "description": topic.description,
@@ -39,68 +62,120 @@ class ESTopicDocumentGenerator(DocumentGenerator):
             "level": level
         }
 
-    def generate(self, keys):
+    def _load_trees(self, db_session, root_ids):
+        """Read the topic trees of the specified root topics.
+
+        Args:
+            db_session: sqlalchemy db session
+            root_ids: list of root topic db keys
+        Returns:
+            dict of {root_id: [(Topic, level)]} with each tree
+            ordered by rank.
+        """
+        # Recursive CTE walking down from the roots, tracking
+        # the root and level of each topic.
+        tree = db_session.query(
+                    Topic.id.label("id"),
+                    Topic.id.label("root_id"),
+                    literal(self.ROOT_LEVEL).label("level"))\
+                .filter(Topic.id.in_(root_ids))\
+                .cte(name="topic_tree", recursive=True)
+        parent = aliased(tree, name="parent")
+        tree = tree.union_all(
+                db_session.query(
+                    Topic.id,
+                    parent.c.root_id,
+                    parent.c.level + 1)\
+                .filter(Topic.parent_id == parent.c.id))
+
+        query = db_session.query(Topic, tree.c.root_id, tree.c.level)\
+                .join(tree, Topic.id == tree.c.id)\
+                .order_by(tree.c.root_id, Topic.rank)
+
+        trees = defaultdict(list)
+        with Stage(HYDRATE):
+            for topic, root_id, level in query:
+                trees[root_id].append((topic, level))
+        return trees
+
+    def _load_tags(self, db_session, root_ids):
+        """Read the tags of the specified root topics.
+
+        Args:
+            db_session: sqlalchemy db session
+            root_ids: list of root topic db keys
+        Returns:
+            dict of {root_id: [Tag]}
+        """
+        query = db_session.query(Tag, TopicTag.topic_id)\
+                .join(TopicTag)\
+                .filter(TopicTag.topic_id.in_(root_ids))
+
+        tags = defaultdict(list)
+        with Stage(HYDRATE):
+            for tag, topic_id in query:
+                tags[topic_id].append(tag)
+        return tags
+
+    def generate(self, keys, key_range=None):
         """Generates a JSON dict that can be indexed by ES
 
         Args:
-            key: user db key
+            keys: list of db keys. An empty list implies all keys.
+            key_range: optional (start, end) tuple of db keys
         Returns:
             Uses a generator to return a tuple of (key, JSON dictionary)
         """
         try:
             db_session = self.db_session_factory()
 
-            # Only index root topics since there aren't any use cases at
-            # the present time to search for sub-topics.  Subtopic titles
-            # and descriptions are indexed via the 'subtopic_summary' field.
-            root_topic_rank = 0
-
-            # TODO alternative to loading on Topic type using Enum
-            query = db_session.query(Topic).options(joinedload(Topic.type))
-            query = query.filter(Topic.rank == root_topic_rank)
-            if len(keys):
-                query = query.filter(Topic.id.in_(keys))
-
-            for root_topic in query.all():
-                # Combine subtopic titles and descriptions
-                subtopic_summary = ''
-
-                # Create JSON topic tree
-                topic_tree = []
-
-                tree_manager = TreeManager(Topic)
-                for topic, level in tree_manager.tree_by_rank(db_session, root_topic.id):
-                    topic_tree.append(self._topic_to_json(topic, level))
-                    # Skip adding the root topic's title & description to subtopic_summary
-                    if topic.rank != root_topic_rank:
-                        subtopic_summary += topic.title + ' ' + topic.description
-
-                #tags
-                tags = db_session.query(Tag)\
-                        .join(TopicTag)\
-                        .filter(TopicTag.topic_id == root_topic.id)\
-                        .all()
-                tags_json = []
-                for tag in tags:
-                    tags_json.append({
-                        "id": tag.id,
-                        "name": tag.name
-                    })
-
-                topic_json = {
-                    "id": root_topic.id,
-                    "type": root_topic.type.name,
-                    "duration": root_topic.duration,
-                    "title": root_topic.title,
-                    "description": root_topic.description,
-                    "subtopic_summary": subtopic_summary,
-                    "public": topic.public,
-                    "active": topic.active,
-                    "tree": topic_tree,
-                    "tags": tags_json
-                }
-
-                yield (root_topic.id, topic_json)
+            root_topic_rank = self.root_topic_rank
+
+            query = self._filter_keys(self._query(db_session), keys, key_range)
+
+            for root_topics in self._iter_chunks(db_session, query, Topic.id):
+                root_ids = [root_topic.id for root_topic in root_topics]
+                trees = self._load_trees(db_session, root_ids)
+                tags = self._load_tags(db_session, root_ids)
+                types = self.reference_cache.get(db_session, TOPIC_TYPES,
+                        [topic.type_id for tree in trees.values() for topic, level in tree] +
+                        [root_topic.type_id for root_topic in root_topics])
+
+                for root_topic in root_topics:
+                    # Combine subtopic titles and descriptions
+                    subtopic_summary = ''
+
+                    # Create JSON topic tree
+                    topic_tree = []
+
+                    for topic, level in trees[root_topic.id]:
+                        topic_tree.append(self._topic_to_json(topic, level, types))
+                        # Skip adding the root topic's title & description to subtopic_summary
+                        if topic.rank != root_topic_rank:
+                            subtopic_summary += topic.title + ' ' + topic.description
+
+                    #tags
+                    tags_json = []
+                    for tag in tags[root_topic.id]:
+                        tags_json.append({
+                            "id": tag.id,
+                            "name": tag.name
+                        })
+
+                    topic_json = {
+                        "id": root_topic.id,
+                        "type": types[root_topic.type_id]["name"],
+                        "duration": root_topic.duration,
+                        "title": root_topic.title,
+                        "description": root_topic.description,
+                        "subtopic_summary": subtopic_summary,
+                        "public": topic.public,
+                        "active": topic.active,
+                        "tree": topic_tree,
+                        "tags": tags_json
+                    }
+
+                    yield (root_topic.id, topic_json)
 
             db_session.commit()
 
@@ -1,10 +1,14 @@
+from collections import defaultdict
 from datetime import datetime
-from sqlalchemy.orm import joinedload, joinedload_all
+from sqlalchemy.orm import joinedload
 
 from trsvcscore.db.models import User, Chat, ChatReel, Skill, \
         JobPositionTypePref, JobTechnologyPref, JobLocationPref
 
-from document import DocumentGenerator
+from jobstats import Stage, HYDRATE
+from document import DocumentGenerator, ModifiedSource
+from refcache import TECHNOLOGIES, LOCATIONS, TOPICS, EXPERTISE_TYPES, \
+        POSITION_TYPES
 
 
 
@@ -14,100 +18,297 @@ class ESUserDocumentGenerator(DocumentGenerator):
     This class is responsible for fetching all needed data from the db
     based upon the input keys parameter, and returning a JSON dictionary that
     can be indexed by ES.
+
+    Users are read in chunks. For each chunk, the related rows
+    (skills, prefs, chat reels) are read with a single IN query per
+    relation, rather than a set of queries per user. Related rows are
+    read as foreign keys only; the names of the referenced technologies,
+    locations, topics and types are resolved through the reference cache.
+
+    Partial documents only read the related rows of the requested fields.
+    For the other relations, only the existence of rows is read, which is
+    needed to calculate the score.
     """
 
-    def __init__(self, db_session_factory):
-        super(ESUserDocumentGenerator, self).__init__(db_session_factory)
+    # Document fields backed by related rows, and their model classes
+    RELATION_FIELDS = {
+        "skills": Skill,
+        "location_prefs": JobLocationPref,
+        "technology_prefs": JobTechnologyPref,
+        "position_prefs": JobPositionTypePref,
+        "chats": ChatReel
+    }
+
+    # Document fields derived from other fields
+    DERIVED_FIELDS = {
+        "skills": ["yrs_experience"]
+    }
+
+    def __init__(self, db_session_factory, chunk_size=500, reference_cache=None):
+        """ESUserDocumentGenerator constructor.
+
+        Args:
+            db_session_factory: callable returning a new sqlalchemy db session
+            chunk_size: number of users read, along with their related
+                rows, at once.
+            reference_cache: optional ReferenceCache object
+        """
+        super(ESUserDocumentGenerator, self).__init__(
+                db_session_factory, chunk_size, reference_cache)
+        self.key_column = User.id
+        self.developer_tenant_id = 1
+        self.scoped_fields = ["location", "actively_seeking"] + self.RELATION_FIELDS.keys()
+
+    def _query(self, db_session):
+        return db_session.query(User)\
+                .filter(User.tenant_id==self.developer_tenant_id)
+
+    def _modified_sources(self):
+        return [
+            ModifiedSource(User.id, User.modified),
+            ModifiedSource(Skill.user_id, Skill.modified),
+            ModifiedSource(JobLocationPref.user_id, JobLocationPref.modified),
+            ModifiedSource(JobTechnologyPref.user_id, JobTechnologyPref.modified),
+            ModifiedSource(JobPositionTypePref.user_id, JobPositionTypePref.modified),
+            ModifiedSource(ChatReel.user_id, ChatReel.modified)
+        ]
+
+    def _load_by_user(self, query, user_id_column, user_ids):
+        """Read the rows of a query belonging to the specified users.
+
+        Args:
+            query: sqlalchemy query of columns, including a user_id column
+            user_id_column: column to restrict to the specified users
+            user_ids: list of user db keys
+        Returns:
+            dict of {user_id: [rows]}
+        """
+        rows_by_user = defaultdict(list)
+        with Stage(HYDRATE):
+            for row in query.filter(user_id_column.in_(user_ids)):
+                rows_by_user[row.user_id].append(row)
+        return rows_by_user
+
+    def _users_with(self, db_session, model_class, user_ids):
+        """Return the users which have rows of model_class.
 
-    def generate(self, keys):
+        Args:
+            db_session: sqlalchemy db session
+            model_class: model class with a user_id column
+            user_ids: list of user db keys
+        Returns:
+            set of user db keys
+        """
+        query = db_session.query(model_class.user_id).distinct()\
+                .filter(model_class.user_id.in_(user_ids))
+        with Stage(HYDRATE):
+            return set([user_id for (user_id,) in query])
+
+    def _scope(self, fields):
+        """Return the document fields of a partial document.
+
+        Args:
+            fields: list of requested field names
+        Returns:
+            list of field names, including derived fields
+        """
+        scope = list(fields)
+        for field in fields:
+            scope.extend(self.DERIVED_FIELDS.get(field, []))
+        # Score depends upon every field
+        scope.append("score")
+        return scope
+
+    def _resolve(self, db_session, table, rows_by_user, column):
+        """Resolve the reference rows referenced by the specified rows.
+
+        Args:
+            db_session: sqlalchemy db session
+            table: ReferenceTable object
+            rows_by_user: dict of {user_id: [rows]}
+            column: name of the row column referencing the table
+        Returns:
+            dict of {id: {column: value}}
+        """
+        ids = [getattr(row, column) for rows in rows_by_user.values() for row in rows]
+        return self.reference_cache.get(db_session, table, ids)
+
+    def _generate_batch(self, db_session, users, fields=None):
+        """Generate documents for a batch of users.
+
+        Args:
+            db_session: sqlalchemy db session
+            users: list of User objects
+            fields: optional list of field names. If provided,
+                partial documents are generated.
+        Returns:
+            Uses a generator to return a tuple of (key, JSON dictionary)
+        """
+        user_ids = [user.id for user in users]
+
+        def requested(field):
+            return fields is None or field in fields
+
+        skills = {}
+        if requested("skills"):
+            skills = self._load_by_user(
+                    db_session.query(Skill.id, Skill.user_id, Skill.technology_id,
+                        Skill.expertise_type_id, Skill.yrs_experience)\
+                    .order_by(Skill.id),
+                    Skill.user_id, user_ids)
+        location_prefs = {}
+        if requested("location_prefs"):
+            location_prefs = self._load_by_user(
+                    db_session.query(JobLocationPref.id, JobLocationPref.user_id,
+                        JobLocationPref.location_id)\
+                    .order_by(JobLocationPref.id),
+                    JobLocationPref.user_id, user_ids)
+        technology_prefs = {}
+        if requested("technology_prefs"):
+            technology_prefs = self._load_by_user(
+                    db_session.query(JobTechnologyPref.id, JobTechnologyPref.user_id,
+                        JobTechnologyPref.technology_id)\
+                    .order_by(JobTechnologyPref.id),
+                    JobTechnologyPref.user_id, user_ids)
+        position_prefs = {}
+        if requested("position_prefs"):
+            position_prefs = self._load_by_user(
+                    db_session.query(JobPositionTypePref.id, JobPositionTypePref.user_id,
+                        JobPositionTypePref.position_type_id,
+                        JobPositionTypePref.salary_start, JobPositionTypePref.salary_end)\
+                    .order_by(JobPositionTypePref.id),
+                    JobPositionTypePref.user_id, user_ids)
+        reels = {}
+        if requested("chats"):
+            reels = self._load_by_user(
+                    db_session.query(ChatReel.user_id, Chat.id.label("chat_id"), Chat.topic_id)\
+                    .join(Chat, ChatReel.chat_id == Chat.id)\
+                    .order_by(ChatReel.id),
+                    ChatReel.user_id, user_ids)
+
+        # Users with rows for relations which were not read
+        users_with = {}
+        for field, model_class in self.RELATION_FIELDS.items():
+            if not requested(field):
+                users_with[field] = self._users_with(db_session, model_class, user_ids)
+
+        # Resolve names of referenced rows
+        technologies = self._resolve(db_session, TECHNOLOGIES, skills, "technology_id")
+        technologies.update(self._resolve(db_session, TECHNOLOGIES, technology_prefs, "technology_id"))
+        expertise_types = self._resolve(db_session, EXPERTISE_TYPES, skills, "expertise_type_id")
+        locations = self._resolve(db_session, LOCATIONS, location_prefs, "location_id")
+        position_types = self._resolve(db_session, POSITION_TYPES, position_prefs, "position_type_id")
+        topics = self._resolve(db_session, TOPICS, reels, "topic_id")
+
+        for user in users:
+            # generate ES document JSON
+            es_user = ESUserDocument(
+                id=user.id,
+                date_joined=user.date_joined,
+                location=user.developer_profile.location,
+                actively_seeking=user.developer_profile.actively_seeking
+            )
+
+            #skills
+            for skill in skills.get(user.id, []):
+                es_user.add_skill(
+                    id=skill.id,
+                    technology_id=skill.technology_id,
+                    name=technologies[skill.technology_id]["name"],
+                    yrs_experience=skill.yrs_experience,
+                    expertise_type_id=skill.expertise_type_id,
+                    expertise_type=expertise_types[skill.expertise_type_id]["name"])
+
+            #location prefs
+            for location_pref in location_prefs.get(user.id, []):
+                es_user.add_location_pref(
+                    id=location_pref.id,
+                    location_id=location_pref.location_id,
+                    region=locations[location_pref.location_id]["region"])
+
+            #technology prefs
+            for technology_pref in technology_prefs.get(user.id, []):
+                es_user.add_technology_pref(
+                    id=technology_pref.id,
+                    technology_id=technology_pref.technology_id,
+                    name=technologies[technology_pref.technology_id]["name"])
+
+            #position prefs
+            for position_pref in position_prefs.get(user.id, []):
+                es_user.add_position_pref(
+                    id=position_pref.id,
+                    type_id=position_pref.position_type_id,
+                    type=position_types[position_pref.position_type_id]["name"],
+                    salary_start=position_pref.salary_start,
+                    salary_end=position_pref.salary_end)
+
+            #chats
+            for reel in reels.get(user.id, []):
+                es_user.add_chat(
+                    id=reel.chat_id,
+                    topic_id=reel.topic_id,
+                    topic_title=topics[reel.topic_id]["title"])
+
+            # Calculate total yrs experience
+            # Derive total yrs experience from the skill with the most yrs
+            yrs_experience = 0
+            for skill in es_user.skills:
+                if skill['yrs_experience'] > yrs_experience:
+                    yrs_experience = skill['yrs_experience']
+            es_user.set_yrs_experience(yrs_experience)
+
+            #calculate score
+            for field, field_users in users_with.items():
+                es_user.set_present(field, user.id in field_users)
+            es_user.calculate_score()
+
+            # Make TR users visible in demo event
+            if user.email.endswith('@techresidents.com'):
+                es_user.set_demo()
+
+            # return (key, doc) tuple
+            doc = es_user.to_json()
+            if fields is not None:
+                doc = dict([(field, doc[field]) for field in self._scope(fields)])
+            yield (user.id, doc)
+
+    def generate(self, keys, key_range=None):
         """Generates a JSON dict that can be indexed by ES
 
         Args:
-            key: user db key
+            keys: list of db keys. An empty list implies all keys.
+            key_range: optional (start, end) tuple of db keys
         Returns:
             Uses a generator to return a tuple of (key, JSON dictionary)
         """
+        return self._generate(keys, key_range)
+
+    def generate_fields(self, keys, fields, key_range=None):
+        """Generates partial JSON dicts that can be applied as ES partial updates
+
+        Args:
+            keys: list of db keys. An empty list implies all keys.
+            fields: list of field names within scoped_fields
+            key_range: optional (start, end) tuple of db keys
+        Returns:
+            Uses a generator to return a tuple of (key, partial JSON dictionary)
+        """
+        return self._generate(keys, key_range, fields)
+
+    def _generate(self, keys, key_range=None, fields=None):
+        """Generate full, or partial if fields is provided, documents."""
         try:
             # lookup user and associated data
             db_session = self.db_session_factory()
 
-            # Read all users at once as performance optimization
-            developer_tenant_id = 1
-            query = db_session.query(User)\
-                    .options(joinedload(User.developer_profile))\
-                    .filter(User.tenant_id==developer_tenant_id)
-            if len(keys):
-                query = query.filter(User.id.in_(keys))
+            # Read users in chunks to bound memory use
+            query = self._query(db_session)\
+                    .options(joinedload(User.developer_profile))
             # An empty keys list implies to index all keys
-            users = query.all()
-
-            for user in users:
-                # generate ES document JSON
-                es_user = ESUserDocument(
-                    id=user.id,
-                    date_joined=user.date_joined,
-                    location=user.developer_profile.location,
-                    actively_seeking=user.developer_profile.actively_seeking
-                )
-
-                #skills
-                skills = db_session.query(Skill)\
-                        .options(joinedload(Skill.technology))\
-                        .filter(Skill.user_id == user.id)\
-                        .all()
-                for skill in skills:
-                    es_user.add_skill(skill)
-
-                #location prefs
-                location_prefs = db_session.query(JobLocationPref)\
-                        .options(joinedload(JobLocationPref.location))\
-                        .filter(JobLocationPref.user_id == user.id)\
-                        .all()
-                for location_pref in location_prefs:
-                    es_user.add_location_pref(location_pref)
-
-                #technology prefs
-                technology_prefs = db_session.query(JobTechnologyPref)\
-                        .options(joinedload(JobTechnologyPref.technology))\
-                        .filter(JobTechnologyPref.user_id == user.id)\
-                        .all()
-                for technology_pref in technology_prefs:
-                    es_user.add_technology_pref(technology_pref)
-                
-
-                #position prefs
-                position_prefs = db_session.query(JobPositionTypePref)\
-                        .options(joinedload(JobPositionTypePref.position_type))\
-                        .filter(JobPositionTypePref.user_id == user.id)\
-                        .all()
-                for position_pref in position_prefs:
-                    es_user.add_position_pref(position_pref)
-
-                #chats
-                reels = db_session.query(ChatReel)\
-                        .options(joinedload_all(ChatReel.chat, Chat.topic))\
-                        .filter(ChatReel.user_id == user.id)\
-                        .all()
-                for reel in reels:
-                    es_user.add_chat(reel.chat)
-
-                # Calculate total yrs experience
-                # Derive total yrs experience from the skill with the most yrs
-                yrs_experience = 0
-                for skill in es_user.skills:
-                    if skill['yrs_experience'] > yrs_experience:
-                        yrs_experience = skill['yrs_experience']
-                es_user.set_yrs_experience(yrs_experience)
-                
-                #calculate score
-                es_user.calculate_score()
-
-                # Make TR users visible in demo event
-                if user.email.endswith('@techresidents.com'):
-                    es_user.set_demo()
-
-                # return (key, doc) tuple
-                yield (user.id, es_user.to_json())
+            query = self._filter_keys(query, keys, key_range)
+            for users in self._iter_chunks(db_session, query, User.id):
+                for key, doc in self._generate_batch(db_session, users, fields):
+                    yield (key, doc)
             db_session.commit()
 
         finally:
@@ -138,6 +339,7 @@ class ESUserDocument(object):
         self.yrs_experience = None
         self.score = 1.0
         self.demo = False # Visibility in demo event
+        self.present = {} # Presence of fields which were not loaded
 
     def to_json(self):
         """ Return a JSON dictionary"""
@@ -156,83 +358,99 @@ class ESUserDocument(object):
             'demo': self.demo
         }
 
-    def add_skill(self, skill):
+    def add_skill(self, id, technology_id, name, yrs_experience,
+                  expertise_type_id, expertise_type):
         """add_skill
 
          Args:
-            skill: SQLAlchemy Skill object
+            id: skill db ID
+            technology_id: technology db ID
+            name: technology name
+            yrs_experience: number of yrs experience
+            expertise_type_id: expertise type db ID
+            expertise_type: expertise type name
         Returns:
             None
         """
         skill_dict = {
-            'id': skill.id,
-            'name': skill.technology.name,
-            'yrs_experience': skill.yrs_experience,
-            'technology_id': skill.technology.id,
-            'expertise_type_id': skill.expertise_type.id,
-            'expertise_type': skill.expertise_type.name
+            'id': id,
+            'name': name,
+            'yrs_experience': yrs_experience,
+            'technology_id': technology_id,
+            'expertise_type_id': expertise_type_id,
+            'expertise_type': expertise_type
         }
         self.skills.append(skill_dict)
 
-    def add_location_pref(self, location_pref):
+    def add_location_pref(self, id, location_id, region):
         """add_location_pref
 
          Args:
-            skill: SQLAlchemy JobLocationPref object
+            id: location pref db ID
+            location_id: location db ID
+            region: location region
         Returns:
             None
         """
         location_pref_dict = {
-            'id': location_pref.id,
-            'location_id': location_pref.location.id,
-            'region': location_pref.location.region
+            'id': id,
+            'location_id': location_id,
+            'region': region
         }
         self.location_prefs.append(location_pref_dict)
 
-    def add_technology_pref(self, technology_pref):
+    def add_technology_pref(self, id, technology_id, name):
         """add_technology_pref
 
          Args:
-            skill: SQLAlchemy JobTechnologyPref object
+            id: technology pref db ID
+            technology_id: technology db ID
+            name: technology name
         Returns:
             None
         """
         technology_pref_dict = {
-            'id': technology_pref.id,
-            'name': technology_pref.technology.name,
-            'technology_id': technology_pref.technology.id
+            'id': id,
+            'name': name,
+            'technology_id': technology_id
         }
         self.technology_prefs.append(technology_pref_dict)
 
-    def add_position_pref(self, position_pref):
+    def add_position_pref(self, id, type_id, type, salary_start, salary_end):
         """add_position_pref
 
          Args:
-            skill: SQLAlchemy JobPositionPref object
+            id: position pref db ID
+            type_id: position type db ID
+            type: position type name
+            salary_start: salary range start
+            salary_end: salary range end
         Returns:
             None
         """
         position_pref_dict = {
-            'id': position_pref.id,
-            'type': position_pref.position_type.name,
-            'type_id': position_pref.position_type.id,
-            'salary_start': position_pref.salary_start,
-            'salary_end': position_pref.salary_end
+            'id': id,
+            'type': type,
+            'type_id': type_id,
+            'salary_start': salary_start,
+            'salary_end': salary_end
         }
         self.position_prefs.append(position_pref_dict)
 
-    def add_chat(self, chat):
+    def add_chat(self, id, topic_id, topic_title):
         """add_chat
 
          Args:
-            chat: SQLAlchemy Chat object
+            id: chat db ID
+            topic_id: topic db ID
+            topic_title: topic title
         Returns:
             None
         """
         chat_dict = {
-            'id': chat.id,
-            'topic_id': chat.topic_id,
-            'topic_title': chat.topic.title
+            'id': id,
+            'topic_id': topic_id,
+            'topic_title': topic_title
         }
         self.chats.append(chat_dict)
 
@@ -246,20 +464,36 @@ class ESUserDocument(object):
         """
         self.yrs_experience = yrs
     
+    def set_present(self, field, present):
+        """set_present
+
+        Record if a list field, which was not loaded, has items.
+
+        Args:
+            field: field name, i.e. 'skills'
+            present: boolean indicating if the field has items
+        Returns:
+            None
+        """
+        self.present[field] = present
+
+    def _has(self, field):
+        return self.present.get(field, bool(getattr(self, field)))
+
     def calculate_score(self):
         """calculate and store score"""
         score = 1.0
         if self.actively_seeking:
             score += 2 
-        if self.skills:
+        if self._has('skills'):
             score += 1
-        if self.chats:
+        if self._has('chats'):
             score += 2
-        if self.location_prefs:
+        if self._has('location_prefs'):
             score += 0.5
-        if self.technology_prefs:
+        if self._has('technology_prefs'):
             score += 0.5
-        if self.position_prefs:
+        if self._has('position_prefs'):
             score += 0.5
         self.score = score
 
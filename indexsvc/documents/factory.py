@@ -1,5 +1,7 @@
 from trpycore.factory.base import Factory
 
+import settings
+
 from es_users import ESUserDocumentGenerator
 from es_technologies import ESTechnologyDocumentGenerator
 from es_topics import ESTopicDocumentGenerator
@@ -9,17 +11,20 @@ from es_locations import ESLocationDocumentGenerator
 class DocumentGeneratorFactory(Factory):
     """Factory for creating DocumentGenerator objects."""
 
-    def __init__(self, db_session_factory, name, type):
+    def __init__(self, db_session_factory, name, type, reference_cache=None):
         """DocumentGeneratorFactory constructor.
 
         Args:
             db_session_factory: callable returning a new sqlalchemy db session
             name: The index name
             type: The document type
+            reference_cache: optional ReferenceCache shared by the
+                created generators
         """
         self.db_session_factory = db_session_factory
         self.name = name
         self.type = type
+        self.reference_cache = reference_cache
 
     def create(self):
         """Create an instance of DocumentGenerator based upon input name and type
@@ -30,11 +35,23 @@ class DocumentGeneratorFactory(Factory):
         """
         ret = None
         if self.name == 'users' and self.type == 'user':
-            ret = ESUserDocumentGenerator(self.db_session_factory)
+            ret = ESUserDocumentGenerator(
+                self.db_session_factory,
+                chunk_size=settings.INDEXER_CHUNK_SIZE,
+                reference_cache=self.reference_cache)
         elif self.name == 'technologies' and self.type == 'technology':
-            ret = ESTechnologyDocumentGenerator(self.db_session_factory)
+            ret = ESTechnologyDocumentGenerator(
+                self.db_session_factory,
+                chunk_size=settings.INDEXER_CHUNK_SIZE,
+                reference_cache=self.reference_cache)
         elif self.name == 'topics' and self.type == 'topic':
-            ret = ESTopicDocumentGenerator(self.db_session_factory)
+            ret = ESTopicDocumentGenerator(
+                self.db_session_factory,
+                chunk_size=settings.INDEXER_CHUNK_SIZE,
+                reference_cache=self.reference_cache)
         elif self.name == 'locations' and self.type == 'location':
-            ret = ESLocationDocumentGenerator(self.db_session_factory)
+            ret = ESLocationDocumentGenerator(
+                self.db_session_factory,
+                chunk_size=settings.INDEXER_CHUNK_SIZE,
+                reference_cache=self.reference_cache)
         return ret
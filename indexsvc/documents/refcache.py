@@ -0,0 +1,178 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from trsvcscore.db.models import Location, Skill, Technology, Topic, \
+        JobPositionTypePref
+
+from jobstats import Stage, HYDRATE
+
+
+class ReferenceTable(object):
+    """Reference (lookup) table whose rows are embedded in documents.
+
+    Args:
+        name: unique table name used to key cached rows
+        model: model class, or relationship attribute referencing the
+            model class, i.e. Skill.expertise_type. Relationships are
+            resolved when the table is first read.
+        columns: list of column names to read
+        index_name: optional name of the index the table's rows are
+            indexed in. Cached rows are invalidated when an IndexJob
+            for this index, or depending on it, is processed.
+    """
+    def __init__(self, name, model, columns, index_name=None):
+        self.name = name
+        self.model = model
+        self.columns = columns
+        self.index_name = index_name
+
+    @property
+    def model_class(self):
+        if hasattr(self.model, "property"):
+            return self.model.property.mapper.class_
+        return self.model
+
+    def load(self, db_session, ids):
+        """Read the specified rows.
+
+        Args:
+            db_session: sqlalchemy db session
+            ids: list of row db keys
+        Returns:
+            dict of {id: {column: value}}
+        """
+        model_class = self.model_class
+        columns = [getattr(model_class, column) for column in self.columns]
+        query = db_session.query(model_class.id, *columns)\
+                .filter(model_class.id.in_(ids))
+
+        rows = {}
+        with Stage(HYDRATE):
+            for row in query:
+                rows[row[0]] = dict(zip(self.columns, row[1:]))
+        return rows
+
+
+# Reference tables embedded in documents
+TECHNOLOGIES = ReferenceTable("technologies", Technology, ["name"], index_name="technologies")
+TECHNOLOGY_TYPES = ReferenceTable("technology_types", Technology.type, ["name"])
+LOCATIONS = ReferenceTable("locations", Location, ["region"], index_name="locations")
+TOPICS = ReferenceTable("topics", Topic, ["title"], index_name="topics")
+TOPIC_TYPES = ReferenceTable("topic_types", Topic.type, ["name"])
+EXPERTISE_TYPES = ReferenceTable("expertise_types", Skill.expertise_type, ["name"])
+POSITION_TYPES = ReferenceTable("position_types", JobPositionTypePref.position_type, ["name"])
+
+REFERENCE_TABLES = [
+    TECHNOLOGIES,
+    TECHNOLOGY_TYPES,
+    LOCATIONS,
+    TOPICS,
+    TOPIC_TYPES,
+    EXPERTISE_TYPES,
+    POSITION_TYPES
+]
+
+
+class ReferenceCache(object):
+    """Thread-safe, in-process cache of reference table rows.
+
+    Document generators embed the names of a small number of reference
+    rows (technologies, locations, types) in a large number of documents.
+    Rather than joining and hydrating these rows for every document,
+    generators read foreign keys only and resolve them through this cache,
+    which reads missing rows with a single query per table.
+
+    Entries expire after ttl_seconds, and the least recently used entries
+    are evicted once the cache holds more than max_size rows. Entries of a
+    table are also invalidated when an IndexJob for its index, or for
+    documents depending on its index, is processed.
+    """
+    def __init__(self, ttl_seconds=300, max_size=10000):
+        """Constructor.
+
+        Args:
+            ttl_seconds: number of seconds rows are cached
+            max_size: maximum number of cached rows
+        """
+        self.log = logging.getLogger(__name__)
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.generations = {}
+        self.lock = threading.Lock()
+
+    def get(self, db_session, table, ids):
+        """Return the specified rows of a reference table.
+
+        Args:
+            db_session: sqlalchemy db session used to read missing rows
+            table: ReferenceTable object
+            ids: iterable of row db keys
+        Returns:
+            dict of {id: {column: value}}. Rows which do not
+            exist are omitted.
+        """
+        rows = {}
+        missing = []
+        now = time.time()
+
+        with self.lock:
+            generation = self.generations.get(table.name, 0)
+            for id in set(ids):
+                if id is None:
+                    continue
+                entry = self.entries.pop((table.name, id), None)
+                if entry is not None and entry[0] > now:
+                    # Reinsert to mark as most recently used
+                    self.entries[(table.name, id)] = entry
+                    rows[id] = entry[1]
+                else:
+                    missing.append(id)
+
+        if missing:
+            loaded = table.load(db_session, missing)
+            rows.update(loaded)
+            self._store(table, generation, loaded, now + self.ttl_seconds)
+        return rows
+
+    def _store(self, table, generation, rows, expires):
+        """Cache rows read from the db.
+
+        Rows are discarded if the table was invalidated while
+        they were being read, since they may be stale.
+        """
+        with self.lock:
+            if self.generations.get(table.name, 0) != generation:
+                return
+            for id, row in rows.items():
+                self.entries[(table.name, id)] = (expires, row)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, index_name):
+        """Invalidate the cached rows of tables indexed in an index.
+
+        Args:
+            index_name: index name
+        """
+        tables = set([table.name for table in REFERENCE_TABLES
+                      if table.index_name == index_name])
+        if not tables:
+            return
+
+        with self.lock:
+            for table_name in tables:
+                self.generations[table_name] = self.generations.get(table_name, 0) + 1
+            for key in self.entries.keys():
+                if key[0] in tables:
+                    del self.entries[key]
+        self.log.debug("Invalidated reference cache tables: %s" % ", ".join(sorted(tables)))
+
+    def clear(self):
+        """Invalidate all cached rows."""
+        with self.lock:
+            for table in REFERENCE_TABLES:
+                self.generations[table.name] = self.generations.get(table.name, 0) + 1
+            self.entries.clear()
@@ -1,7 +1,6 @@
-import json
 import logging
 
-from sqlalchemy.sql import func
+from sqlalchemy.sql import text
 
 from tres.client import ESClient
 from tres.pool import ESClientPool
@@ -12,13 +11,25 @@ from trpycore.timezone import tz
 from trsvcscore.db.models import IndexJob as IndexJobModel
 from trsvcscore.service.handler.service import ServiceHandler
 from trindexsvc.gen import TIndexService
-from trindexsvc.gen.ttypes import UnavailableException, InvalidDataException
+from trindexsvc.gen.ttypes import UnavailableException, InvalidDataException, \
+        IndexPriority
 
 import settings
 
+import jobstats
+import serialization
+from coalescer import IndexJobCoalescer
+from dependencies import DependencyFanout
+from documents.refcache import ReferenceCache
+from indexers.fingerprint import FingerprintStore
 from jobmonitor import IndexJobMonitor, IndexThreadPool
+from membership import IndexMembership
 from indexer_coordinator import IndexerCoordinator
 from indexop import IndexAction, IndexOp
+from notify import IndexJobListener, notify_index_job
+from priority import PriorityPolicy
+from processpool import IndexProcessPool
+from writebuffer import IndexJobWriteBuffer
 
 
 class IndexServiceHandler(TIndexService.Iface, ServiceHandler):
@@ -30,6 +41,10 @@ class IndexServiceHandler(TIndexService.Iface, ServiceHandler):
     SQLAlchemy.
 
     """
+
+    # Maximum number of IndexJobs inserted per INSERT statement
+    INSERT_BATCH_SIZE = 1000
+
     def __init__(self, service):
         super(IndexServiceHandler, self).__init__(
 		    service,
@@ -46,44 +61,256 @@ class IndexServiceHandler(TIndexService.Iface, ServiceHandler):
             size=settings.ES_POOL_SIZE
         )
 
-        # Create factory to return IndexerCoordinators
-        def indexer_coordinator_factory():
-            return IndexerCoordinator(
+        # Register this node in ZooKeeper, so that the nodes
+        # agree on which node claims each job.
+        if settings.INDEXER_MEMBERSHIP_PATH:
+            self.membership = IndexMembership(
+                zookeeper_client=self.zookeeper_client,
+                path=settings.INDEXER_MEMBERSHIP_PATH,
+                data="%s:%d" % (settings.THRIFT_SERVER_ADDRESS, settings.THRIFT_SERVER_PORT),
+                grace_seconds=settings.INDEXER_MEMBERSHIP_GRACE_SECONDS,
+                refresh_seconds=settings.INDEXER_MEMBERSHIP_REFRESH_SECONDS,
+                on_change=self._membership_changed)
+        else:
+            self.membership = None
+
+        # Create coalescer to merge pending jobs for the same index
+        if settings.INDEXER_COALESCE_JOBS:
+            self.job_coalescer = IndexJobCoalescer(
                 db_session_factory=self.get_database_session,
-                job_retry_seconds=settings.INDEXER_JOB_RETRY_SECONDS,
-                index_client_pool=self.es_client_pool
-            )
+                max_jobs=settings.INDEXER_COALESCE_MAX_JOBS,
+                membership=self.membership)
+        else:
+            self.job_coalescer = None
+
+        # Create fan-out to reindex documents which embed
+        # data from other indexes when that data changes.
+        if settings.INDEXER_DEPENDENCY_FANOUT:
+            self.dependency_fanout = DependencyFanout(
+                db_session_factory=self.get_database_session,
+                job_max_retry_attempts=settings.INDEXER_JOB_MAX_RETRY_ATTEMPTS,
+                max_keys=settings.INDEXER_DEPENDENCY_JOB_KEYS,
+                notify_channel=settings.INDEXER_NOTIFY_CHANNEL)
+        else:
+            self.dependency_fanout = None
+
+        # Create store of indexed document fingerprints
+        # used to skip sending unchanged documents.
+        if settings.INDEXER_FINGERPRINT_DIRECTORY:
+            self.fingerprint_store = FingerprintStore(
+                directory=settings.INDEXER_FINGERPRINT_DIRECTORY)
+        else:
+            self.fingerprint_store = None
+
+        # Create cache of reference rows shared by document generators
+        if settings.INDEXER_REFERENCE_CACHE:
+            self.reference_cache = ReferenceCache(
+                ttl_seconds=settings.INDEXER_REFERENCE_CACHE_TTL_SECONDS,
+                max_size=settings.INDEXER_REFERENCE_CACHE_MAX_SIZE)
+        else:
+            self.reference_cache = None
+
+        # Create aggregate stats of processed jobs, exported as
+        # service counters.
+        if settings.INDEXER_JOB_STATS:
+            self.index_stats = jobstats.IndexStats(
+                buckets_ms=settings.INDEXER_JOB_STATS_BUCKETS_MS)
+            jobstats.listen_queries()
+        else:
+            self.index_stats = None
+
+        # Create pool of worker processes to index partitions of
+        # operations on entire indexes.
+        if settings.INDEXER_PROCESSES:
+            self.process_pool = IndexProcessPool(
+                processes=settings.INDEXER_PROCESSES,
+                database_connection=settings.DATABASE_CONNECTION,
+                es_endpoint=settings.ES_ENDPOINT,
+                es_pool_size=max(1, settings.INDEXER_PIPELINE_SENDERS))
+        else:
+            self.process_pool = None
+
+        # Create factory to return IndexerCoordinators
+        def indexer_coordinator_factory(index_client_pool):
+            def factory():
+                return IndexerCoordinator(
+                    db_session_factory=self.get_database_session,
+                    job_retry_seconds=settings.INDEXER_JOB_RETRY_SECONDS,
+                    index_client_pool=index_client_pool,
+                    partitions=settings.INDEXER_JOB_PARTITIONS,
+                    partition_queue=self._put_partition_set,
+                    coalescer=self.job_coalescer,
+                    dependency_fanout=self.dependency_fanout,
+                    fingerprint_store=self.fingerprint_store,
+                    reference_cache=self.reference_cache,
+                    incremental_overlap_seconds=settings.INDEXER_INCREMENTAL_OVERLAP_SECONDS,
+                    incremental_max_keys=settings.INDEXER_INCREMENTAL_MAX_KEYS,
+                    index_stats=self.index_stats,
+                    process_pool=self.process_pool,
+                    notify_channel=settings.INDEXER_NOTIFY_CHANNEL
+                )
+            return factory
         self.indexer_coordinator_pool = QueuePool(
             size=settings.INDEXER_POOL_SIZE,
-            factory=Factory(indexer_coordinator_factory))
+            factory=Factory(indexer_coordinator_factory(self.es_client_pool)))
 
         # Create pool of threads to manage the work
         self.thread_pool = IndexThreadPool(
             num_threads=settings.INDEXER_THREADS,
             indexer_coordinator_pool=self.indexer_coordinator_pool)
 
+        # Create threads reserved for interactive jobs, with their
+        # own IndexerCoordinators and ES clients, so that interactive
+        # jobs do not wait on jobs updating entire indexes.
+        if settings.INDEXER_INTERACTIVE_THREADS:
+            self.priority_policy = PriorityPolicy(
+                interactive_max_keys=settings.INDEXER_INTERACTIVE_MAX_KEYS,
+                bulk_contexts=settings.INDEXER_BULK_CONTEXTS)
+            self.interactive_es_client_pool = ESClientPool(
+                es_client_factory=Factory(es_client_factory),
+                size=settings.INDEXER_INTERACTIVE_THREADS * max(1, settings.INDEXER_PIPELINE_SENDERS)
+            )
+            self.interactive_indexer_coordinator_pool = QueuePool(
+                size=settings.INDEXER_INTERACTIVE_THREADS,
+                factory=Factory(indexer_coordinator_factory(self.interactive_es_client_pool)))
+            self.interactive_thread_pool = IndexThreadPool(
+                num_threads=settings.INDEXER_INTERACTIVE_THREADS,
+                indexer_coordinator_pool=self.interactive_indexer_coordinator_pool)
+            lane_thread_pools = {IndexPriority.INTERACTIVE: self.interactive_thread_pool}
+        else:
+            self.priority_policy = None
+            self.interactive_thread_pool = None
+            lane_thread_pools = None
+
         # Create job monitor which scans for new jobs
-        # to process and delegates to the thread pool
+        # to process and delegates to the thread pools
         self.job_monitor = IndexJobMonitor(
             db_session_factory=self.get_database_session,
             thread_pool=self.thread_pool,
-            poll_seconds=settings.INDEXER_POLL_SECONDS)
+            poll_seconds=settings.INDEXER_POLL_SECONDS,
+            priority_policy=self.priority_policy,
+            lane_thread_pools=lane_thread_pools,
+            membership=self.membership)
+
+        # Create listener to wake up the job monitor as soon as
+        # new jobs are created. Polling remains as a fallback.
+        if settings.INDEXER_NOTIFY_CHANNEL:
+            self.job_listener = IndexJobListener(
+                database_connection=settings.DATABASE_CONNECTION,
+                channel=settings.INDEXER_NOTIFY_CHANNEL,
+                callback=self.job_monitor.wakeup)
+        else:
+            self.job_listener = None
+
+        # Create write-behind buffer so that index requests
+        # return without waiting on a db commit.
+        if settings.INDEXER_WRITE_BUFFER:
+            self.write_buffer = IndexJobWriteBuffer(
+                writer=self._write_index_jobs,
+                flush_seconds=settings.INDEXER_WRITE_BUFFER_FLUSH_SECONDS,
+                max_jobs=settings.INDEXER_WRITE_BUFFER_MAX_JOBS,
+                max_buffered=settings.INDEXER_WRITE_BUFFER_MAX_BUFFERED_JOBS,
+                max_retry_seconds=settings.INDEXER_WRITE_BUFFER_MAX_RETRY_SECONDS)
+        else:
+            self.write_buffer = None
+
+    def _put_partition_set(self, partition_set):
+        """Offer job partitions to the worker thread pool.
+
+        Args:
+            partition_set: IndexPartitionSet object
+        """
+        self.thread_pool.put(partition_set)
+
+    def _membership_changed(self):
+        """Claim the jobs of a new set of members immediately."""
+        self.job_monitor.wakeup()
 
     def start(self):
         """Start handler."""
+        # Fork worker processes before starting any threads
+        if self.process_pool:
+            self.process_pool.start()
         super(IndexServiceHandler, self).start()
+        if self.write_buffer:
+            self.write_buffer.start()
         self.thread_pool.start()
+        if self.interactive_thread_pool:
+            self.interactive_thread_pool.start()
+        if self.membership:
+            self.membership.start()
         self.job_monitor.start()
+        if self.job_listener:
+            self.job_listener.start()
 
     def stop(self):
         """Stop handler."""
+        if self.job_listener:
+            self.job_listener.stop()
+        if self.membership:
+            self.membership.stop()
         self.job_monitor.stop()
         self.thread_pool.stop()
+        if self.interactive_thread_pool:
+            self.interactive_thread_pool.stop()
+        if self.write_buffer:
+            self.write_buffer.stop()
+            self.write_buffer.join()
+        if self.process_pool:
+            self.process_pool.stop()
         super(IndexServiceHandler, self).stop()
 
     def join(self, timeout=None):
         """Join handler."""
-        join([self.thread_pool, self.job_monitor, super(IndexServiceHandler, self)], timeout)
+        threads = [self.thread_pool, self.job_monitor, super(IndexServiceHandler, self)]
+        if self.interactive_thread_pool:
+            threads.append(self.interactive_thread_pool)
+        if self.membership:
+            threads.append(self.membership)
+        if self.job_listener:
+            threads.append(self.job_listener)
+        join(threads, timeout)
+        if self.fingerprint_store:
+            self.fingerprint_store.close()
+
+    def getCounters(self, context):
+        """Return the service counters.
+
+        In addition to the base service counters, the counters include
+        the stage timings and counts of processed index jobs, and the
+        number of indexsvc members.
+
+        Args:
+            context: String to identify calling context
+        Returns:
+            dict of {counter name: integer value}
+        """
+        counters = super(IndexServiceHandler, self).getCounters(context)
+        counters.update(self._index_counters())
+        return counters
+
+    def getCounter(self, context, key):
+        """Return a service counter.
+
+        Args:
+            context: String to identify calling context
+            key: counter name
+        Returns:
+            integer counter value
+        """
+        counters = self._index_counters()
+        if key in counters:
+            return counters[key]
+        return super(IndexServiceHandler, self).getCounter(context, key)
+
+    def _index_counters(self):
+        """Return the index job and membership counters."""
+        counters = {}
+        if self.index_stats is not None:
+            counters.update(self.index_stats.counters())
+        if self.membership is not None:
+            counters.update(self.membership.counters())
+        return counters
 
     # For Future:
     # def create(self, context, index_data):
@@ -143,6 +370,85 @@ class IndexServiceHandler(TIndexService.Iface, ServiceHandler):
             self.log.exception(error)
             raise UnavailableException(str(error))
 
+    def indexBatch(self, context, index_data_list):
+        """Index a batch of data. Use to update an existing index.
+
+        This method creates a job to index each of the specified input
+        data, in a single transaction. Data without keys is indexed
+        for all keys, as with indexAll().
+
+        Args:
+            context: String to identify calling context
+            index_data_list: list of Thrift IndexData objects
+        Returns:
+            None
+        Raises:
+            InvalidDataException if any input data to index is invalid.
+            UnavailableException for any other unexpected error.
+        """
+        try:
+            return self._index_batch(context, IndexAction.Update, index_data_list)
+
+        except InvalidDataException as error:
+            self.log.exception(error)
+            raise InvalidDataException(str(error))
+        except Exception as error:
+            self.log.exception(error)
+            raise UnavailableException(str(error))
+
+    def rebuild(self, context, index_data):
+        """Rebuild the entire index without interrupting searches.
+
+        This method creates a job which loads a new version of the
+        index, and replaces the live index with it once complete.
+        Use to apply mapping changes.
+
+        Args:
+            context: String to identify calling context
+            index_data: Thrift IndexData object. Keys are not supported.
+        Returns:
+            None
+        Raises:
+            InvalidDataException if input data to index is invalid.
+            UnavailableException for any other unexpected error.
+        """
+        try:
+            return self._index(context, IndexAction.Rebuild, index_data, index_all=True)
+
+        except InvalidDataException as error:
+            self.log.exception(error)
+            raise InvalidDataException(str(error))
+        except Exception as error:
+            self.log.exception(error)
+            raise UnavailableException(str(error))
+
+    def indexIncremental(self, context, index_data):
+        """Index data changed since the last incremental index operation.
+
+        This method creates a job to update the documents whose source
+        data was modified since the last successful incremental job for
+        the index. If there's no previous incremental job, all documents
+        are updated. Deleted source rows are not detected.
+
+        Args:
+            context: String to identify calling context
+            index_data: Thrift IndexData object. Keys are not supported.
+        Returns:
+            None
+        Raises:
+            InvalidDataException if input data to index is invalid.
+            UnavailableException for any other unexpected error.
+        """
+        try:
+            return self._index(context, IndexAction.Incremental, index_data, index_all=True)
+
+        except InvalidDataException as error:
+            self.log.exception(error)
+            raise InvalidDataException(str(error))
+        except Exception as error:
+            self.log.exception(error)
+            raise UnavailableException(str(error))
+
     def _validate_index_params(self, context, index_action, index_data, index_all):
         """Validate input params of the index() and indexAll() methods
         Args:
@@ -162,7 +468,9 @@ class IndexServiceHandler(TIndexService.Iface, ServiceHandler):
 
         if (index_action != IndexAction.Create and
             index_action != IndexAction.Update and
-            index_action != IndexAction.Delete):
+            index_action != IndexAction.Delete and
+            index_action != IndexAction.Rebuild and
+            index_action != IndexAction.Incremental):
             raise InvalidDataException('Invalid index action')
 
         if not index_data.name:
@@ -175,10 +483,134 @@ class IndexServiceHandler(TIndexService.Iface, ServiceHandler):
         if not index_all and not len(index_data.keys):
             raise InvalidDataException('Invalid index keys')
 
+        if index_data.priority is not None and\
+           index_data.priority not in IndexPriority._VALUES_TO_NAMES:
+            raise InvalidDataException('Invalid index priority')
+
+        # Only updates may be restricted to fields
+        if index_data.fields and index_action != IndexAction.Update:
+            raise InvalidDataException('Invalid index fields')
+
+        # Rebuilds and incremental updates determine their own keys
+        if (index_action == IndexAction.Rebuild or
+            index_action == IndexAction.Incremental) and index_data.keys:
+            raise InvalidDataException('Invalid index keys')
+
+    def _index_job_values(self, context, index_action, index_data, index_all=False):
+        """Validate input data and return the column values of its IndexJob.
+
+        Args:
+            context: String to identify calling context
+            index_action: IndexAction object
+            index_data: Thrift IndexData object
+            index_all: Boolean indicating if all keys should be acted upon
+        Returns:
+            dict of IndexJob column values. not_before is None if
+            processing should start immediately.
+        Raises:
+            InvalidDataException if input data to index is invalid.
+        """
+        # Validate inputs
+        self._validate_index_params(
+            context,
+            index_action,
+            index_data,
+            index_all
+        )
+
+        # If input specified a start-processing-time
+        # convert it to UTC DateTime object.
+        if index_data.notBefore is not None:
+            processing_start_time = tz.timestamp_to_utc(index_data.notBefore)
+        else:
+            processing_start_time = None
+
+        # Massage input data into format for IndexJob
+        if index_data.keys is None:
+            index_data.keys = []
+        data = IndexOp(action=index_action, data=index_data)
+
+        return {
+            "context": context,
+            "not_before": processing_start_time,
+            "retries_remaining": settings.INDEXER_JOB_MAX_RETRY_ATTEMPTS,
+            "data": serialization.dumps(data.to_json())
+        }
+
+    def _create_index_jobs(self, db_session, jobs):
+        """Insert IndexJobs using multi-row inserts.
+
+        The jobs are created within the session's transaction, so
+        the caller is responsible for committing the session.
+
+        Args:
+            db_session: sqlalchemy db session
+            jobs: list of IndexJob column value dicts
+                returned by _index_job_values()
+        Returns:
+            None
+        """
+        table = IndexJobModel.__table__
+        columns = ", ".join([
+            table.c.created.name,
+            table.c.context.name,
+            table.c.not_before.name,
+            table.c.retries_remaining.name,
+            table.c.data.name
+        ])
+
+        for offset in range(0, len(jobs), self.INSERT_BATCH_SIZE):
+            rows = []
+            params = {}
+            for index, job in enumerate(jobs[offset:offset + self.INSERT_BATCH_SIZE]):
+                rows.append("(current_timestamp, :context_%d, "
+                            "coalesce(:not_before_%d, current_timestamp), "
+                            ":retries_remaining_%d, :data_%d)" % ((index,) * 4))
+                for name, value in job.items():
+                    params["%s_%d" % (name, index)] = value
+
+            statement = "INSERT INTO %s (%s) VALUES %s" %\
+                    (table.fullname, columns, ", ".join(rows))
+            db_session.execute(text(statement), params)
+
+        if settings.INDEXER_NOTIFY_CHANNEL:
+            notify_index_job(db_session, settings.INDEXER_NOTIFY_CHANNEL)
+
+    def _write_index_jobs(self, jobs):
+        """Write IndexJobs in a single transaction.
+
+        Args:
+            jobs: list of IndexJob column value dicts
+                returned by _index_job_values()
+        Returns:
+            None
+        """
+        try:
+            db_session = None
+            db_session = self.get_database_session()
+
+            # Bound the time the inserts wait on the db, so that a stalled
+            # db fails the request rather than tying up a server thread.
+            if settings.DATABASE_INSERT_STATEMENT_TIMEOUT:
+                db_session.execute("SET LOCAL statement_timeout = %d" %\
+                        (settings.DATABASE_INSERT_STATEMENT_TIMEOUT * 1000))
+
+            self._create_index_jobs(db_session, jobs)
+            db_session.commit()
+        except Exception:
+            if db_session:
+                db_session.rollback()
+            raise
+        finally:
+            if db_session:
+                db_session.close()
+
     def _index(self, context, index_action, index_data, index_all=False):
         """Helper function. Pulled out common code from index() & indexAll().
 
         This method creates a job to index the specified input data.
+        If the write-behind buffer is enabled, the job is written
+        asynchronously after this method returns.
 
         Args:
             context: String to identify calling context
@@ -191,39 +623,50 @@ class IndexServiceHandler(TIndexService.Iface, ServiceHandler):
             InvalidDataException if input data to index is invalid.
             UnavailableException for any other unexpected error.
         """
-        try:
-            # Get a db session
-            db_session = self.get_database_session()
+        # Validate inputs
+        job = self._index_job_values(
+            context,
+            index_action,
+            index_data,
+            index_all
+        )
 
-            # Validate inputs
-            self._validate_index_params(
+        if self.write_buffer:
+            self.write_buffer.put([job])
+        else:
+            self._write_index_jobs([job])
+
+    def _index_batch(self, context, index_action, index_data_list):
+        """Create jobs to index each of the specified input data.
+
+        All jobs are created in a single transaction. IndexData
+        objects without keys act upon all keys. If the write-behind
+        buffer is enabled, the jobs are written asynchronously.
+
+        Args:
+            context: String to identify calling context
+            index_action: IndexAction object
+            index_data_list: list of Thrift IndexData objects
+        Returns:
+            None
+        Raises:
+            InvalidDataException if any input data to index is invalid.
+            UnavailableException for any other unexpected error.
+        """
+        if not index_data_list:
+            raise InvalidDataException('Invalid index data list')
+
+        # Validate all inputs before creating any IndexJobs
+        jobs = []
+        for index_data in index_data_list:
+            jobs.append(self._index_job_values(
                 context,
                 index_action,
                 index_data,
-                index_all
-            )
+                index_all=not index_data.keys
+            ))
 
-            # If input specified a start-processing-time
-            # convert it to UTC DateTime object.
-            if index_data.notBefore is not None:
-                processing_start_time = tz.timestamp_to_utc(index_data.notBefore)
-            else:
-                processing_start_time = func.current_timestamp()
-
-            # Massage input data into format for IndexJob
-            data = IndexOp(action=index_action, data=index_data)
-
-            # Create IndexJob
-            job = IndexJobModel(
-                created=func.current_timestamp(),
-                context=context,
-                not_before=processing_start_time,
-                retries_remaining=settings.INDEXER_JOB_MAX_RETRY_ATTEMPTS,
-                data=json.dumps(data.to_json())
-            )
-            db_session.add(job)
-            db_session.commit()
-            return
-
-        finally:
-            db_session.close()
\ No newline at end of file
+        if self.write_buffer:
+            self.write_buffer.put(jobs)
+        else:
+            self._write_index_jobs(jobs)
@@ -1,14 +1,20 @@
 import datetime
 import logging
+import time
 
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, or_, text
 
 from trpycore.timezone import tz
 from trsvcscore.db.models import IndexJob
 from trsvcscore.db.job import JobOwned
+from trindexsvc.gen.ttypes import IndexData
 
+import jobstats
+import serialization
 from indexers.factory import IndexerFactory
-from indexop import IndexOp
+from indexop import IndexAction, IndexOp, IndexOpSQL
+from notify import notify_index_job
+from partition import IndexPartitionSet
 
 
 class IndexerCoordinator(object):
@@ -21,16 +27,62 @@ class IndexerCoordinator(object):
         index_client_pool: pool of index client objects
             Index clients are responsible for communicating with the
             search service (e.g. ElasticSearch)
+        partitions: number of key range partitions jobs operating on
+            an entire index are split into.
+        partition_queue: optional callable used to offer an
+            IndexPartitionSet to other worker threads, so that
+            partitions are processed concurrently.
+        coalescer: optional IndexJobCoalescer used to merge pending
+            jobs into the job being processed.
+        dependency_fanout: optional DependencyFanout used to reindex
+            documents which depend on the data of processed jobs.
+        fingerprint_store: optional FingerprintStore used to skip
+            unchanged documents.
+        reference_cache: optional ReferenceCache shared by document
+            generators. Cached rows of an index are invalidated when
+            a job for the index, or depending on the index, is processed.
+        incremental_overlap_seconds: number of seconds incremental
+            operations look back before the start of the previous
+            successful incremental operation, to allow for changes
+            committed while it was starting.
+        incremental_max_keys: maximum number of changed keys updated
+            individually by an incremental operation. If more keys
+            changed, the entire index is updated.
+        index_stats: optional IndexStats object. If provided, the
+            stages of each job are timed, recorded in index_stats,
+            and logged.
+        process_pool: optional IndexProcessPool. If provided,
+            operations on an entire index are split into key range
+            partitions which are indexed by worker processes, rather
+            than by worker threads.
+        notify_channel: optional Postgres notification channel
+            signalled when retry and replay IndexJobs are created.
     """
 
-    def __init__(self, db_session_factory, job_retry_seconds, index_client_pool):
+    def __init__(self, db_session_factory, job_retry_seconds, index_client_pool,
+                 partitions=1, partition_queue=None, coalescer=None,
+                 dependency_fanout=None, fingerprint_store=None,
+                 reference_cache=None, incremental_overlap_seconds=60,
+                 incremental_max_keys=10000, index_stats=None,
+                 process_pool=None, notify_channel=None):
         self.log = logging.getLogger(__name__)
         self.db_session_factory = db_session_factory
         self.job_retry_seconds = job_retry_seconds
         self.index_client_pool = index_client_pool
+        self.partitions = partitions
+        self.partition_queue = partition_queue
+        self.coalescer = coalescer
+        self.dependency_fanout = dependency_fanout
+        self.fingerprint_store = fingerprint_store
+        self.reference_cache = reference_cache
+        self.incremental_overlap_seconds = incremental_overlap_seconds
+        self.incremental_max_keys = incremental_max_keys
+        self.index_stats = index_stats
+        self.process_pool = process_pool
+        self.notify_channel = notify_channel
 
 
-    def _retry_job(self, failed_job):
+    def _retry_job(self, failed_job, data=None):
         """Create a new IndexJob from a failed job.
 
         This method creates a new IndexJob from a
@@ -38,6 +90,8 @@ class IndexerCoordinator(object):
 
         Args:
             failed_job: DatabaseJob object, or objected derived from DatabaseJob
+            data: optional IndexJob data to retry. Defaults to the
+                data of the failed job.
         Returns:
             None
         """
@@ -48,7 +102,7 @@ class IndexerCoordinator(object):
             if failed_job.retries_remaining > 0:
                 not_before = tz.utcnow() + datetime.timedelta(seconds=self.job_retry_seconds)
                 new_job = IndexJob(
-                    data=failed_job.data,
+                    data=data or failed_job.data,
                     context=failed_job.context,
                     created=func.current_timestamp(),
                     not_before=not_before,
@@ -57,6 +111,8 @@ class IndexerCoordinator(object):
                 # Add job to db
                 db_session = self.db_session_factory()
                 db_session.add(new_job)
+                if self.notify_channel:
+                    notify_index_job(db_session, self.notify_channel)
                 db_session.commit()
             else:
                 self.log.info("No retries remaining for job for index_job_id=%s"\
@@ -72,15 +128,331 @@ class IndexerCoordinator(object):
                 db_session.close()
 
 
+    def _retry_failed_keys(self, job, indexop, result):
+        """Create a new IndexJob for the documents which failed indexing.
+
+        Args:
+            job: IndexJob db model object which was processed
+            indexop: IndexOp object which was processed
+            result: IndexResult object with failed keys
+        Returns:
+            None
+        """
+        summary = "; ".join([str(error) for error in result.errors[:5]])
+        self.log.error("IndexJob with index_job_id=%d failed for %d of %d documents. Errors: %s"\
+                       % (job.id, len(result.failed_keys),
+                          result.count + len(result.failed_keys), summary))
+
+        retry_indexop = IndexOp(
+            action=indexop.action,
+            data=IndexData(
+                name=indexop.data.name,
+                type=indexop.data.type,
+                keys=result.failed_keys,
+                priority=indexop.data.priority),
+            sources=indexop.sources)
+        # Failed keys are retried as full updates, which also creates
+        # documents which were missing for partial updates.
+        self._retry_job(job, data=serialization.dumps(retry_indexop.to_json()))
+
+    def _fan_out(self, job, indexop):
+        """Create IndexJobs for documents depending on the processed job.
+
+        Failures are logged, but do not fail the processed job.
+
+        Args:
+            job: IndexJob db model object which was processed
+            indexop: IndexOp object which was processed
+        Returns:
+            None
+        """
+        try:
+            count = self.dependency_fanout.fan_out(indexop, job.context)
+            if count:
+                self.log.info("Created %d dependent IndexJobs for index_job_id=%d" % (count, job.id))
+        except Exception as e:
+            self.log.exception(e)
+
+    def _replay_jobs(self, job, indexop, started):
+        """Replay jobs processed while an index was being rebuilt.
+
+        Jobs for the index processed during a rebuild update the
+        previous index, and their changes may be missing from the
+        rebuilt index. New jobs are created to apply them again.
+
+        Args:
+            job: IndexJob db model object of the rebuild
+            indexop: IndexOp object of the rebuild
+            started: datetime the rebuild started
+        Returns:
+            None
+        """
+        try:
+            db_session = None
+            db_session = self.db_session_factory()
+
+            # Jobs started during the rebuild, or finished during it.
+            # Jobs started earlier which never finished, i.e. crashed,
+            # are ignored.
+            job_data = IndexOpSQL(IndexJob.__table__.c.data.name)
+            query = db_session.query(IndexJob.data)\
+                    .filter(IndexJob.id != job.id)\
+                    .filter(or_(IndexJob.start >= started, IndexJob.end >= started))\
+                    .filter(text("%s = :name AND %s = :type" % (job_data.name, job_data.type)))\
+                    .params(name=indexop.data.name, type=indexop.data.type)
+
+            keys = {IndexAction.Update: set(), IndexAction.Delete: set()}
+            update_all = False
+            for (data,) in query:
+                try:
+                    replay = IndexOp.from_json(data)
+                except Exception:
+                    continue
+                if replay.action == IndexAction.Rebuild:
+                    continue
+
+                # Changes of incremental jobs are not known, and
+                # are replayed by updating the entire index.
+                if replay.action == IndexAction.Delete:
+                    keys[IndexAction.Delete].update(replay.data.keys)
+                elif not len(replay.data.keys):
+                    update_all = True
+                else:
+                    keys[IndexAction.Update].update(replay.data.keys)
+
+            if update_all:
+                keys[IndexAction.Update] = []
+
+            jobs = []
+            for action, action_keys in keys.items():
+                if action_keys == set():
+                    continue
+                data = IndexOp(
+                    action=action,
+                    data=IndexData(
+                        name=indexop.data.name,
+                        type=indexop.data.type,
+                        keys=sorted(action_keys)))
+                jobs.append(IndexJob(
+                    data=serialization.dumps(data.to_json()),
+                    context=job.context,
+                    created=func.current_timestamp(),
+                    not_before=func.current_timestamp(),
+                    retries_remaining=job.retries_remaining))
+
+            if jobs:
+                self.log.info("Replaying %d IndexJobs processed during rebuild of index_job_id=%d" % (len(jobs), job.id))
+                db_session.add_all(jobs)
+                if self.notify_channel:
+                    notify_index_job(db_session, self.notify_channel)
+            db_session.commit()
+
+        except Exception as e:
+            self.log.exception(e)
+            if db_session:
+                db_session.rollback()
+        finally:
+            if db_session:
+                db_session.close()
+
+    def _incremental_mark(self, job, indexop):
+        """Return the high-water mark of incremental operations on an index.
+
+        The mark is the start of the most recent successful incremental
+        job for the index, less the configured overlap.
+
+        Args:
+            job: IndexJob db model object being processed
+            indexop: IndexOp object of the incremental operation
+        Returns:
+            datetime, or None if there's no previous successful
+            incremental job for the index.
+        """
+        try:
+            db_session = None
+            db_session = self.db_session_factory()
+
+            # Only the most recent matching job is read
+            data = IndexOpSQL(IndexJob.__table__.c.data.name)
+            start = db_session.query(IndexJob.start)\
+                    .filter(IndexJob.id != job.id)\
+                    .filter(IndexJob.successful == True)\
+                    .filter(IndexJob.start != None)\
+                    .filter(text("%s = :action AND %s = :name AND %s = :type" %\
+                                 (data.action, data.name, data.type)))\
+                    .params(action=IndexAction.Incremental,
+                            name=indexop.data.name,
+                            type=indexop.data.type)\
+                    .order_by(IndexJob.start.desc())\
+                    .limit(1)\
+                    .scalar()
+
+            mark = None
+            if start is not None:
+                mark = start - datetime.timedelta(seconds=self.incremental_overlap_seconds)
+            db_session.commit()
+            return mark
+
+        finally:
+            if db_session:
+                db_session.close()
+
+    def _incremental(self, job, indexop):
+        """Convert an incremental operation into an update operation.
+
+        Args:
+            job: IndexJob db model object being processed
+            indexop: IndexOp object of the incremental operation
+        Returns:
+            IndexOp object updating the documents changed since the
+            high-water mark, or None if no documents changed. The
+            entire index is updated if there's no high-water mark,
+            changes can not be determined, or too many keys changed.
+        """
+        update_all = IndexOp(
+            action=IndexAction.Update,
+            data=IndexData(name=indexop.data.name, type=indexop.data.type, keys=[]))
+
+        mark = self._incremental_mark(job, indexop)
+        if mark is None:
+            self.log.info("No previous incremental IndexJob for '%s/%s'. Updating entire index."\
+                          % (indexop.data.name, indexop.data.type))
+            return update_all
+
+        keys = self._create_indexer(indexop).changed_keys(mark)
+        if keys is None or len(keys) > self.incremental_max_keys:
+            self.log.info("Updating entire index '%s/%s' for IndexJob with index_job_id=%d"\
+                          % (indexop.data.name, indexop.data.type, job.id))
+            return update_all
+        if not keys:
+            return None
+
+        self.log.info("Updating %d documents of '%s/%s' changed since %s"\
+                      % (len(keys), indexop.data.name, indexop.data.type, mark))
+        return IndexOp(
+            action=IndexAction.Update,
+            data=IndexData(
+                name=indexop.data.name,
+                type=indexop.data.type,
+                keys=[str(key) for key in keys]))
+
+    def _queue_wait(self, job):
+        """Return the number of seconds a job waited to be claimed.
+
+        Args:
+            job: claimed IndexJob db model object
+        Returns:
+            number of seconds since the job became ready
+        """
+        ready = job.not_before or job.created
+        now = tz.utcnow()
+        if ready.tzinfo is None:
+            now = now.replace(tzinfo=None)
+        return max(0.0, (now - ready).total_seconds())
+
+    def _record_stats(self, job, stats, successful):
+        """Record and log the stats of a processed job.
+
+        Args:
+            job: IndexJob db model object which was processed
+            stats: JobStats object
+            successful: boolean indicating if the job succeeded
+        """
+        try:
+            self.index_stats.record(stats, successful)
+            indexop = IndexOp.from_json(job.data)
+            values = stats.to_json()
+            values.update({
+                "index_job_id": job.id,
+                "index": indexop.data.name,
+                "type": indexop.data.type,
+                "action": indexop.action,
+                "successful": successful
+            })
+            self.log.info("IndexJob stats: %s" % serialization.dumps(values, sort_keys=True))
+        except Exception as e:
+            self.log.exception(e)
+
+    def _create_indexer(self, indexop):
+        """Create an Indexer for the specified index operation.
+
+        Args:
+            indexop: IndexOp object
+        Returns:
+            Indexer object
+        """
+        factory = IndexerFactory(
+            self.db_session_factory,
+            self.index_client_pool,
+            indexop.data.name,
+            indexop.data.type,
+            fingerprint_store=self.fingerprint_store,
+            reference_cache=self.reference_cache
+        )
+        return factory.create()
+
+    def _index(self, indexop):
+        """Perform the specified index operation.
+
+        Operations on an entire index are split into key range
+        partitions when configured to do so. Partitions are indexed
+        by the process pool, if provided. Otherwise, partitions are
+        offered to the other worker threads and also processed by the
+        calling thread. This method returns once all partitions are
+        complete.
+
+        Args:
+            indexop: IndexOp object
+        Returns:
+            IndexResult object
+        Raises:
+            Exception if the index operation, or any partition, fails.
+        """
+        indexer = self._create_indexer(indexop)
+        if self.process_pool is not None:
+            indexops = indexer.partition(indexop,
+                    max(self.partitions, self.process_pool.processes))
+            if len(indexops) > 1:
+                self.log.info("Indexing '%s/%s' in %d partitions on worker processes" %\
+                              (indexop.data.name, indexop.data.type, len(indexops)))
+                try:
+                    return self.process_pool.index(indexops)
+                finally:
+                    # Worker processes do not record fingerprints, so
+                    # those stored may no longer match the documents.
+                    if self.fingerprint_store is not None:
+                        self.fingerprint_store.clear(indexop.data.name)
+
+        if self.partitions > 1 and self.partition_queue is not None:
+            indexops = indexer.partition(indexop, self.partitions)
+        else:
+            indexops = [indexop]
+
+        if len(indexops) == 1:
+            return indexer.index(indexop)
+
+        self.log.info("Splitting index operation on '%s/%s' into %d partitions" %\
+                      (indexop.data.name, indexop.data.type, len(indexops)))
+        partition_set = IndexPartitionSet(indexops, self._create_indexer)
+        for i in range(len(indexops) - 1):
+            self.partition_queue(partition_set)
+        partition_set.process()
+        return partition_set.wait()
+
     def index(self, database_job):
         """ Index the data specified by the input job.
 
         Args:
-            database_job: DatabaseJob object, or objected derived from DatabaseJob
+            database_job: DatabaseJob or ClaimedIndexJob object
         Returns:
             None
         """
         try:
+            merged_job_ids = []
+            retry_data = None
+            stats = None
+            successful = False
+
             with database_job as job:
 
                 # Claiming the job and finishing the job are
@@ -88,18 +460,57 @@ class IndexerCoordinator(object):
                 # specify how to process the job. The context
                 # manager returns 'job' as an IndexJob
                 # db model object.
-                indexop = IndexOp.from_json(job.data)
-                factory = IndexerFactory(
-                    self.db_session_factory,
-                    self.index_client_pool,
-                    indexop.data.name,
-                    indexop.data.type
-                )
-                indexer = factory.create()
-                indexer.index(indexop)
+                if self.index_stats is not None:
+                    stats = jobstats.JobStats()
+                    stats.add_time(jobstats.QUEUE_WAIT, self._queue_wait(job))
+                    start = time.time()
+
+                with jobstats.activate(stats):
+                    indexop = IndexOp.from_json(job.data)
+
+                    # Merge pending jobs for the same index into this job
+                    if self.coalescer is not None:
+                        indexop, merged_job_ids = self.coalescer.coalesce(job, indexop)
+                        if merged_job_ids:
+                            retry_data = serialization.dumps(indexop.to_json())
+
+                    # Reference rows indexed in this index, or in the
+                    # source indexes of a dependent update, may have
+                    # changed on another node.
+                    if self.reference_cache is not None:
+                        for name in [indexop.data.name] + indexop.sources:
+                            self.reference_cache.invalidate(name)
+
+                    # Determine the documents changed since the last
+                    # incremental operation on the index.
+                    if indexop.action == IndexAction.Incremental:
+                        indexop = self._incremental(job, indexop)
+
+                    if indexop is not None:
+                        started = tz.utcnow()
+                        result = self._index(indexop)
+                        if stats is not None and result is not None:
+                            stats.increment(jobstats.DOCS, result.count)
+                            stats.increment(jobstats.SKIPPED, result.skipped)
+
+                        # Apply changes made to the index during the rebuild
+                        if indexop.action == IndexAction.Rebuild:
+                            self._replay_jobs(job, indexop, started)
+
+                        # Only the documents which failed are retried
+                        if result is not None and result.failed_keys:
+                            self._retry_failed_keys(job, indexop, result)
+
+                        # Reindex documents embedding the indexed data
+                        if self.dependency_fanout is not None:
+                            self._fan_out(job, indexop)
                 self.log.info("IndexJob with index_job_id=%d successfully processed" % job.id)
                 # TODO return async object
 
+            successful = True
+            if merged_job_ids:
+                self.coalescer.finish(merged_job_ids, True)
+
         except JobOwned:
             # This means that the IndexJob was claimed just before
             # this thread claimed it. Stop processing the job. There's
@@ -109,4 +520,10 @@ class IndexerCoordinator(object):
         except Exception as e:
             #failure during processing.
             self.log.exception(e)
-            self._retry_job(job)
\ No newline at end of file
+            if merged_job_ids:
+                self.coalescer.finish(merged_job_ids, False)
+            self._retry_job(job, data=retry_data)
+        finally:
+            if stats is not None:
+                stats.add_time(jobstats.TOTAL, time.time() - start)
+                self._record_stats(job, stats, successful)
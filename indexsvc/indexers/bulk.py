@@ -0,0 +1,271 @@
+import logging
+import time
+from contextlib import contextmanager
+
+import jobstats
+import serialization
+from jobstats import Stage
+
+
+class BulkPolicy(object):
+    """Policy describing when buffered bulk operations are sent to the index.
+
+    A batch is flushed when it reaches max_docs documents, when adding
+    a document would take it over max_bytes serialized bytes, or when the
+    oldest document in the batch has been buffered for max_seconds.
+    max_seconds is not a timer: it is checked when documents are added,
+    and, in pipelined mode, while senders wait for documents (see
+    BulkIndex.flush_expired()).
+
+    In adaptive mode max_docs is only the initial batch size. The batch
+    size then grows while bulk requests complete within target_seconds,
+    and shrinks when requests are slow or rejected by the index, staying
+    between min_docs and max_adaptive_docs.
+    """
+    def __init__(self, max_docs=20, max_bytes=None, max_seconds=None,
+                 adaptive=False, min_docs=10, max_adaptive_docs=5000,
+                 target_seconds=1.0):
+        """BulkPolicy constructor.
+
+        Args:
+            max_docs: maximum number of documents per bulk request
+            max_bytes: optional maximum number of serialized
+                document bytes per bulk request
+            max_seconds: optional maximum number of seconds a document
+                is buffered before it is sent, checked when documents
+                are added or flush_expired() is invoked.
+            adaptive: boolean indicating if the batch size should be
+                adjusted based upon observed bulk request latency
+            min_docs: adaptive mode minimum batch size
+            max_adaptive_docs: adaptive mode maximum batch size
+            target_seconds: adaptive mode target bulk request latency
+        """
+        self.max_docs = max_docs
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.adaptive = adaptive
+        self.min_docs = min_docs
+        self.max_adaptive_docs = max_adaptive_docs
+        self.target_seconds = target_seconds
+
+    def adjust(self, batch_size, docs, seconds, rejected):
+        """Return the batch size to use for the next bulk request.
+
+        Args:
+            batch_size: current batch size
+            docs: number of documents sent in the last bulk request
+            seconds: latency of the last bulk request
+            rejected: boolean indicating if the index rejected
+                any of the operations due to load
+        Returns:
+            new batch size
+        """
+        if not self.adaptive:
+            return batch_size
+
+        if rejected or seconds > 2 * self.target_seconds:
+            batch_size = max(self.min_docs, batch_size // 2)
+        elif seconds < self.target_seconds and docs >= batch_size:
+            batch_size = min(self.max_adaptive_docs, batch_size * 2)
+        return batch_size
+
+
+class BulkIndex(object):
+    """Buffers bulk index operations and flushes them according to a BulkPolicy.
+
+    This class wraps an ElasticSearch client bulk index object, which
+    must be created with autoflush disabled, and exposes the same
+    put(), delete(), flushing() and errors interface. Wrapped objects
+    supporting partial updates also expose update().
+
+    If the wrapped object accepts serialized documents, indicated by a
+    true serialized attribute, documents are serialized once and passed
+    to it serialized. Otherwise the wrapped object serializes them, and
+    document sizes are estimated from the average size of measured
+    documents. Only the first document of each batch, and documents
+    added while the batch is close to max_bytes, are measured.
+    """
+
+    # Approximate size of the bulk action line preceding each document
+    ACTION_BYTES = 64
+
+    # Documents are measured while the batch is within this many
+    # estimated documents of max_bytes.
+    MEASURE_DOCS = 10
+
+    # Exception type of operations rejected by ElasticSearch due to load,
+    # lower cased and without underscores.
+    REJECTION = "esrejectedexecutionexception"
+
+    def __init__(self, index, policy):
+        """BulkIndex constructor.
+
+        Args:
+            index: ElasticSearch client bulk index object
+            policy: BulkPolicy object
+        """
+        self.log = logging.getLogger(__name__)
+        self.index = index
+        self.policy = policy
+        self.serialized = getattr(index, "serialized", False)
+        self.batch_size = policy.max_docs
+        self.docs = 0
+        self.bytes = 0
+        self.batch_start = None
+        self.measured_docs = 0
+        self.measured_bytes = 0
+
+    @property
+    def errors(self):
+        return self.index.errors
+
+    def put(self, key, doc, create=False):
+        """Add a document to the bulk request.
+
+        Args:
+            key: document key
+            doc: JSON dictionary
+            create: if True the operation fails if the document exists
+        """
+        doc, doc_bytes = self._serialize(doc)
+        self._before_add(doc_bytes)
+        self.index.put(key, doc, create=create)
+        self._after_add()
+
+    def update(self, key, doc):
+        """Add a partial document update to the bulk request.
+
+        Args:
+            key: document key
+            doc: JSON dictionary of the fields to update
+        """
+        doc, doc_bytes = self._serialize(doc)
+        self._before_add(doc_bytes)
+        self.index.update(key, doc)
+        self._after_add()
+
+    def delete(self, key):
+        """Add a document delete to the bulk request.
+
+        Args:
+            key: document key
+        """
+        self._before_add(0)
+        self.index.delete(key)
+        self._after_add()
+
+    def flush(self):
+        """Send buffered operations to the index."""
+        if not self.docs:
+            return
+
+        errors = len(self.index.errors)
+        start = time.time()
+        with Stage(jobstats.BULK):
+            self.index.flush()
+        elapsed = time.time() - start
+        jobstats.increment(jobstats.BULK_REQUESTS)
+        jobstats.increment(jobstats.BULK_BYTES, self.bytes)
+
+        rejected = any(self._is_rejection(error) for error in self.index.errors[errors:])
+        batch_size = self.policy.adjust(self.batch_size, self.docs, elapsed, rejected)
+        if batch_size != self.batch_size:
+            self.log.debug("Bulk batch size changed from %d to %d (%d docs in %.3fs)" %\
+                           (self.batch_size, batch_size, self.docs, elapsed))
+            self.batch_size = batch_size
+
+        self.docs = 0
+        self.bytes = 0
+        self.batch_start = None
+
+    def flush_expired(self):
+        """Send buffered operations if the batch is older than max_seconds.
+
+        Used by threads which own the BulkIndex to flush partial batches
+        while no documents are being added, i.e. when generation is slow.
+        """
+        if self.batch_start is not None and\
+           self.policy.max_seconds is not None and\
+           time.time() - self.batch_start >= self.policy.max_seconds:
+            self.flush()
+
+    @contextmanager
+    def flushing(self):
+        """Context manager which flushes buffered operations on exit."""
+        yield self
+        self.flush()
+
+    def _serialize(self, doc):
+        """Serialize a document, or estimate its serialized size.
+
+        Returns:
+            (document, serialized size in bytes) tuple. The document
+            is returned serialized if the wrapped object accepts
+            serialized documents.
+        """
+        if self.serialized:
+            with Stage(jobstats.SERIALIZE):
+                data = serialization.dumps(doc)
+            return data, len(data)
+
+        if not self._measure():
+            return doc, self.measured_bytes // self.measured_docs
+
+        with Stage(jobstats.SERIALIZE):
+            doc_bytes = len(serialization.dumps(doc))
+        self.measured_docs += 1
+        self.measured_bytes += doc_bytes
+        return doc, doc_bytes
+
+    def _measure(self):
+        """Check if the size of the next document should be measured."""
+        if not self.docs or not self.measured_docs:
+            return True
+        if self.policy.max_bytes is None:
+            return False
+        estimate = self.measured_bytes // self.measured_docs + self.ACTION_BYTES
+        return self.bytes + self.MEASURE_DOCS * estimate > self.policy.max_bytes
+
+    def _before_add(self, doc_bytes):
+        doc_bytes += self.ACTION_BYTES
+        if self.docs and self.policy.max_bytes is not None and\
+           self.bytes + doc_bytes > self.policy.max_bytes:
+            self.flush()
+
+        if self.batch_start is None:
+            self.batch_start = time.time()
+        self.docs += 1
+        self.bytes += doc_bytes
+
+    def _after_add(self):
+        if self.docs >= self.batch_size:
+            self.flush()
+        else:
+            self.flush_expired()
+
+    def _is_rejection(self, error):
+        """Check if a bulk error is a rejection due to load.
+
+        Bulk response items report rejections with status 429 and,
+        depending on the ElasticSearch version, an error naming the
+        EsRejectedExecutionException type.
+
+        Args:
+            error: bulk error, i.e. {<action>: {"_id": <key>, "status": 429, ...}}
+        Returns:
+            True if the operation was rejected
+        """
+        if not isinstance(error, dict):
+            return self.REJECTION in str(error)
+
+        for value in [error] + error.values():
+            if not isinstance(value, dict):
+                continue
+            if value.get("status") == 429:
+                return True
+            reason = value.get("error")
+            if isinstance(reason, dict):
+                reason = reason.get("type")
+            if reason is not None and self.REJECTION in str(reason).replace("_", "").lower():
+                return True
+        return False
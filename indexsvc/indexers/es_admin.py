@@ -0,0 +1,225 @@
+import logging
+import urllib2
+
+import serialization
+
+
+class ESAdminError(Exception):
+    """ElasticSearch admin request failed."""
+    pass
+
+
+class ESAdminClient(object):
+    """Client for ElasticSearch index administration requests.
+
+    The bulk index client does not support managing indexes, settings,
+    aliases and partial updates, so these requests are made directly
+    over HTTP.
+
+    Request bodies may be provided as strings, which are sent as is.
+    This allows mapping files, which ElasticSearch accepts in a relaxed
+    JSON syntax, to be sent without being parsed.
+    """
+    def __init__(self, endpoint, timeout=60):
+        """Constructor.
+
+        Args:
+            endpoint: ElasticSearch endpoint, i.e. http://localhost:9200
+            timeout: request timeout in seconds
+        """
+        self.log = logging.getLogger(__name__)
+        self.endpoint = endpoint.rstrip("/")
+        self.timeout = timeout
+
+    def _request(self, method, path, body=None, missing_ok=False):
+        """Send a request to ElasticSearch.
+
+        Args:
+            method: HTTP method
+            path: request path
+            body: optional request body string or JSON object
+            missing_ok: if True, 404 responses return None
+        Returns:
+            JSON response object
+        Raises:
+            ESAdminError if the request fails
+        """
+        if body is not None and not isinstance(body, basestring):
+            body = serialization.dumps(body)
+
+        request = urllib2.Request("%s%s" % (self.endpoint, path), data=body)
+        request.get_method = lambda: method
+        try:
+            response = urllib2.urlopen(request, timeout=self.timeout)
+            data = response.read()
+            return serialization.loads(data) if data else None
+        except urllib2.HTTPError as error:
+            if missing_ok and error.code == 404:
+                return None
+            raise ESAdminError("%s %s failed (%d): %s" % \
+                    (method, path, error.code, error.read()))
+        except urllib2.URLError as error:
+            raise ESAdminError("%s %s failed: %s" % (method, path, error.reason))
+
+    def index_exists(self, name):
+        """Check if an index or alias exists."""
+        try:
+            self._request("HEAD", "/%s" % name)
+            return True
+        except ESAdminError:
+            return False
+
+    def create_index(self, name, body):
+        """Create an index.
+
+        Args:
+            name: index name
+            body: index settings and mappings string or JSON object
+        """
+        return self._request("PUT", "/%s" % name, body)
+
+    def delete_index(self, name):
+        """Delete an index."""
+        return self._request("DELETE", "/%s" % name, missing_ok=True)
+
+    def get_settings(self, name):
+        """Return the settings of an index.
+
+        Args:
+            name: index name
+        Returns:
+            dict of flattened settings, i.e. {"index.number_of_replicas": "1"}
+        """
+        response = self._request("GET", "/%s/_settings" % name)
+        return response[name]["settings"]
+
+    def update_settings(self, name, settings):
+        """Update the dynamic settings of an index.
+
+        Args:
+            name: index name
+            settings: dict of index settings
+        """
+        return self._request("PUT", "/%s/_settings" % name, {"index": settings})
+
+    def refresh(self, name):
+        """Refresh an index, making all operations visible to search."""
+        return self._request("POST", "/%s/_refresh" % name)
+
+    def search(self, name, query):
+        """Search an index.
+
+        Args:
+            name: index name
+            query: query string or JSON object
+        Returns:
+            JSON search response
+        """
+        return self._request("POST", "/%s/_search" % name, query)
+
+    def bulk(self, body):
+        """Send a bulk request.
+
+        Args:
+            body: newline delimited bulk request string
+        Returns:
+            JSON bulk response
+        """
+        return self._request("POST", "/_bulk", body)
+
+    def get_bulk_update_index(self, name, type):
+        """Return a bulk index object for partial document updates.
+
+        Args:
+            name: index name
+            type: document type
+        Returns:
+            ESBulkUpdateIndex object
+        """
+        return ESBulkUpdateIndex(self, name, type)
+
+    def get_alias_indexes(self, alias):
+        """Return the names of the indexes an alias refers to.
+
+        Args:
+            alias: alias name
+        Returns:
+            list of index names. The list is empty if the alias does not exist.
+        """
+        response = self._request("GET", "/_aliases")
+        return sorted([index for index, value in response.items()
+                       if alias in value.get("aliases", {})])
+
+    def swap_alias(self, alias, old_indexes, new_index, remove_indexes=None):
+        """Atomically point an alias at a new index.
+
+        Args:
+            alias: alias name
+            old_indexes: list of index names the alias is removed from
+            new_index: index name the alias is added to
+            remove_indexes: optional list of index names deleted in the
+                same request, i.e. a concrete index named after the alias.
+                Requires an ElasticSearch version supporting the
+                "remove_index" alias action.
+        """
+        actions = [{"remove_index": {"index": index}} for index in remove_indexes or []]
+        actions.extend([{"remove": {"index": index, "alias": alias}} for index in old_indexes])
+        actions.append({"add": {"index": new_index, "alias": alias}})
+        return self._request("POST", "/_aliases", {"actions": actions})
+
+
+class ESBulkUpdateIndex(object):
+    """Bulk index object sending partial document updates.
+
+    Operations are buffered until flush() is invoked, and are sent as
+    bulk "update" actions, which merge the provided fields into the
+    existing documents. Documents are serialized with the serialization
+    module, and may be provided already serialized, in which case they
+    are sent as is. Errors are reported per document in the same form
+    as bulk response items, i.e. {"update": {"_id": <key>, ...}}.
+    """
+
+    # Documents may be provided as JSON formatted strings
+    serialized = True
+
+    def __init__(self, client, name, type):
+        """Constructor.
+
+        Args:
+            client: ESAdminClient object
+            name: index name
+            type: document type
+        """
+        self.client = client
+        self.name = name
+        self.type = type
+        self.actions = []
+        self.errors = []
+
+    def update(self, key, doc):
+        """Add a partial update of a document.
+
+        Args:
+            key: document key
+            doc: JSON dictionary of the fields to update,
+                or JSON formatted string of the dictionary.
+        """
+        if not isinstance(doc, basestring):
+            doc = serialization.dumps(doc)
+        self.actions.append(serialization.dumps({
+            "update": {"_index": self.name, "_type": self.type, "_id": str(key)}
+        }))
+        self.actions.append('{"doc":%s}' % doc)
+
+    def flush(self):
+        """Send buffered updates."""
+        if not self.actions:
+            return
+
+        body = "\n".join(self.actions) + "\n"
+        self.actions = []
+        response = self.client.bulk(body)
+        for item in response.get("items", []):
+            for value in item.values():
+                if "error" in value:
+                    self.errors.append(item)
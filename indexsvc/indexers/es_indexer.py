@@ -1,8 +1,14 @@
 import logging
+import sys
+
+from trpycore.timezone import tz
 
 from documents.factory import DocumentGeneratorFactory
-from indexer import Indexer
-from indexop import IndexAction
+from jobstats import Stage, BUILD
+from bulk import BulkIndex, BulkPolicy
+from pipeline import BulkPipeline
+from indexer import Indexer, IndexResult
+from indexop import IndexAction, IndexOp
 
 
 class ESIndexer(Indexer):
@@ -15,8 +21,18 @@ class ESIndexer(Indexer):
     This Indexer subclass has no special functionality in
     its index() method.  It simply iterates through the list of
     specified keys and invokes the underlying ElasticSearch client.
+
+    Rebuild operations load a new, timestamped version of the index
+    and then atomically point the index name, which is an alias, at
+    the new version. Searches never see a partially loaded index.
+
+    In pipelined mode, documents are generated on the calling thread
+    while sender threads send the bulk requests (see BulkPipeline).
     """
-    def __init__(self, db_session_factory, index_client_pool, index_name, doc_type):
+    def __init__(self, db_session_factory, index_client_pool, index_name, doc_type,
+                 bulk_policy=None, fingerprint_store=None, reference_cache=None,
+                 admin_client=None, mapping_file=None, warm_queries=None,
+                 pipeline_senders=0, pipeline_queue_size=1000):
         """ ESIndexer Constructor
 
          Args:
@@ -24,71 +40,458 @@ class ESIndexer(Indexer):
             index_client_pool: pool of index client objects
             index_name: index name
             doc_type: document type
+            bulk_policy: optional BulkPolicy object describing when
+                bulk requests are sent to ElasticSearch.
+            fingerprint_store: optional FingerprintStore object. If
+                provided, updates skip documents which are unchanged
+                since they were last indexed.
+            reference_cache: optional ReferenceCache object shared
+                by document generators.
+            admin_client: optional ESAdminClient object. Required
+                for rebuild operations.
+            mapping_file: optional path of the file containing the
+                index settings and mappings. Required for rebuild
+                operations.
+            warm_queries: optional list of paths of files containing
+                queries run against a rebuilt index before it is
+                made live.
+            pipeline_senders: number of threads sending bulk requests
+                while documents are generated. 0 disables pipelining.
+                Each sender beyond the first holds an additional index
+                client from the pool.
+            pipeline_queue_size: maximum number of documents generated
+                ahead of the senders in pipelined mode.
         """
         super(ESIndexer, self).__init__(db_session_factory, index_client_pool)
         self.log = logging.getLogger(__name__)
+        self.bulk_policy = bulk_policy or BulkPolicy()
+        self.fingerprint_store = fingerprint_store
+        self.admin_client = admin_client
+        self.mapping_file = mapping_file
+        self.warm_queries = warm_queries or []
+        self.pipeline_senders = pipeline_senders
+        self.pipeline_queue_size = pipeline_queue_size
+        self.fingerprints = {}
+        self.skipped = 0
+        self.partial = False
         factory = DocumentGeneratorFactory(
             self.db_session_factory,
             index_name,
-            doc_type
+            doc_type,
+            reference_cache=reference_cache
         )
         self.document_generator = factory.create()
 
 
+    def partition(self, indexop, count):
+        # Only operations on the entire index can be partitioned
+        if count <= 1 or len(indexop.data.keys) or\
+           indexop.key_range is not None or\
+           indexop.action not in (IndexAction.Create, IndexAction.Update):
+            return [indexop]
+
+        key_range = self.document_generator.key_range()
+        if key_range is None:
+            return [indexop]
+
+        min_key, max_key = key_range
+        step = max(1, (max_key - min_key + 1) // count)
+        bounds = [min_key + step * i for i in range(1, count)
+                  if min_key + step * i <= max_key]
+
+        # Leave the first and last partitions open, so that
+        # documents created while indexing are not skipped.
+        starts = [None] + bounds
+        ends = bounds + [None]
+        return [IndexOp(indexop.action, indexop.data, (start, end))
+                for start, end in zip(starts, ends)]
+
+    def changed_keys(self, since):
+        return self.document_generator.changed_keys(since)
+
     def index(self, indexop):
+        """ Perform indexing.
+
+        Documents which ElasticSearch fails to index do not abort
+        the operation. Their keys are reported in the result.
+
+        Args:
+            indexop: IndexOp object
+        Returns:
+            IndexResult object
+        Raises:
+            Exception if the operation fails as a whole, or errors
+            are reported which can not be attributed to a key.
+        """
+        self.fingerprints = {}
+        self.skipped = 0
+        self.partial = False
+
+        # get bulk index. Flushing is managed by BulkIndex
+        # according to the bulk policy.
+        def index_factory(es_client):
+            return BulkIndex(
+                es_client.get_bulk_index(
+                    indexop.data.name,
+                    indexop.data.type,
+                    autoflush=None
+                ),
+                self.bulk_policy
+            )
+
+        def update_index_factory(es_client):
+            return BulkIndex(
+                self.admin_client.get_bulk_update_index(indexop.data.name, indexop.data.type),
+                self.bulk_policy
+            )
+
         # Get an ESClient and perform indexing
         with self.index_client_pool.get() as es_client:
-            # get bulk index
-            index = es_client.get_bulk_index(
-                indexop.data.name,
-                indexop.data.type,
-                autoflush=20
-            )
+            index = index_factory(es_client)
             # perform index operation
             if indexop.action == IndexAction.Create:
-                count = self.create(indexop, index)
-                self.log.info("ESIndexer successfully created %d documents for index '%s/%s'" % (count, indexop.data.name, indexop.data.type))
+                count = self.create(indexop, index, index_factory)
+                result = self._result(count, index.errors)
+                self.log.info("ESIndexer successfully created %d documents for index '%s/%s'" % (result.count, indexop.data.name, indexop.data.type))
+            elif indexop.action == IndexAction.Update and\
+                 self._partial(indexop):
+                index = update_index_factory(es_client)
+                self.partial = True
+                count = self.update_fields(indexop, index, update_index_factory)
+                result = self._result(count, index.errors)
+                self.log.info("ESIndexer successfully updated fields %s of %d documents for index '%s/%s'" % (indexop.data.fields, result.count, indexop.data.name, indexop.data.type))
             elif indexop.action == IndexAction.Update:
-                count = self.update(indexop, index)
-                self.log.info("ESIndexer successfully updated %d documents for index '%s/%s'" % (count, indexop.data.name, indexop.data.type))
+                count = self.update(indexop, index, index_factory)
+                result = self._result(count, index.errors)
+                self.log.info("ESIndexer successfully updated %d documents for index '%s/%s' (%d unchanged)" % (result.count, indexop.data.name, indexop.data.type, result.skipped))
             elif indexop.action == IndexAction.Delete:
                 count = self.delete(indexop, index)
-                self.log.info("ESIndexer successfully deleted %d documents for index '%s/%s'" % (count, indexop.data.name, indexop.data.type))
+                result = self._result(count, index.errors)
+                self.log.info("ESIndexer successfully deleted %d documents for index '%s/%s'" % (result.count, indexop.data.name, indexop.data.type))
+            elif indexop.action == IndexAction.Rebuild:
+                result = self.rebuild(indexop, es_client)
+                self.log.info("ESIndexer successfully rebuilt index '%s/%s' with %d documents" % (indexop.data.name, indexop.data.type, result.count))
             else:
                 raise Exception("ESIndexerIndex action not supported")
 
+            if result.failed_keys:
+                self.log.error("ESIndexer failed to process %d documents for index '%s/%s'" % (len(result.failed_keys), indexop.data.name, indexop.data.type))
+
+            self._store_fingerprints(indexop, result)
+            return result
+
+    def _store_fingerprints(self, indexop, result):
+        """Record the fingerprints of successfully indexed documents.
+
+        This must only be invoked once the bulk requests have been sent,
+        so that fingerprints are only stored for documents in the index.
+
+        Args:
+            indexop: IndexOp object
+            result: IndexResult object
+        """
+        if self.fingerprint_store is None:
+            return
+
+        failed_keys = set(result.failed_keys)
+        if self.partial:
+            # Partial updates change documents, but fingerprints
+            # are only known for full documents.
+            if len(indexop.data.keys):
+                self.fingerprint_store.remove(indexop.data.name, indexop.data.keys)
+            else:
+                self.fingerprint_store.clear(indexop.data.name)
+        elif indexop.action == IndexAction.Rebuild:
+            # The live index has been replaced
+            self.fingerprint_store.clear(indexop.data.name)
+            self.fingerprint_store.update(indexop.data.name, self.fingerprints)
+        elif indexop.action == IndexAction.Delete:
+            keys = [key for key in indexop.data.keys if str(key) not in failed_keys]
+            self.fingerprint_store.remove(indexop.data.name, keys)
+        else:
+            fingerprints = dict([(key, fingerprint)
+                    for key, fingerprint in self.fingerprints.items()
+                    if str(key) not in failed_keys])
+            self.fingerprint_store.update(indexop.data.name, fingerprints)
+
+    def _error_key(self, error):
+        """Return the document key of a bulk error.
+
+        Args:
+            error: bulk error reported by the ElasticSearch client.
+                Bulk response items have the form
+                {<action>: {"_id": <key>, "error": <error>}}
+        Returns:
+            document key, or None if the key can not be determined
+        """
+        if not isinstance(error, dict):
+            return None
+        if "_id" in error:
+            return error["_id"]
+        for value in error.values():
+            if isinstance(value, dict) and "_id" in value:
+                return value["_id"]
+        return None
+
+    def _result(self, count, errors):
+        """Create an IndexResult from the bulk errors of an operation.
+
+        Args:
+            count: number of documents sent to the index
+            errors: list of bulk errors
+        Returns:
+            IndexResult object
+        Raises:
+            Exception if an error can not be attributed to a key
+        """
+        failed_keys = []
+        for error in errors:
+            key = self._error_key(error)
+            if key is None:
+                raise Exception("ElasticSearch client error: %s" % error)
+            failed_keys.append(str(key))
+
+        failed_keys = sorted(set(failed_keys))
+        return IndexResult(
+            count=count - len(failed_keys),
+            failed_keys=failed_keys,
+            errors=list(errors),
+            skipped=self.skipped)
+
+
+    def _timed(self, documents):
+        """Iterate over generated documents, timing their generation.
+
+        Args:
+            documents: iterable of (key, JSON dictionary) tuples
+        Returns:
+            Uses a generator to return a tuple of (key, JSON dictionary)
+        """
+        documents = iter(documents)
+        while True:
+            with Stage(BUILD):
+                try:
+                    key, doc = next(documents)
+                except StopIteration:
+                    return
+            yield (key, doc)
+
+    def _send(self, index, index_factory, operations):
+        """Send bulk operations to the index.
+
+        Operations are sent by the calling thread, or, in pipelined
+        mode, by sender threads while the calling thread produces them.
 
-    def create(self, indexop, index):
-        createdDocsCount = 0
+        Args:
+            index: BulkIndex object
+            index_factory: optional callable taking an index client and
+                returning a new BulkIndex to the same index. Required
+                for more than one pipeline sender.
+            operations: iterable of (BulkIndex method name, args) tuples
+        Returns:
+            number of operations sent
+        """
+        if self.pipeline_senders > 0:
+            pipeline = BulkPipeline(
+                index,
+                index_client_pool=self.index_client_pool,
+                index_factory=index_factory,
+                senders=self.pipeline_senders,
+                queue_size=self.pipeline_queue_size)
+            return pipeline.send(operations)
+
+        count = 0
         with index.flushing():
-            for key,doc in self.document_generator.generate(indexop.data.keys):
+            for method, args in operations:
+                getattr(index, method)(*args)
+                count += 1
+        return count
+
+    def create(self, indexop, index, index_factory=None):
+        def operations():
+            for key,doc in self._timed(self.document_generator.generate(indexop.data.keys, indexop.key_range)):
                 # setting create=True flag means that the index operation will
                 # fail if the document already exists
-                index.put(key, doc, create=True)
-                if len(index.errors):
-                    raise Exception("ElasticSearch client error")
-                createdDocsCount += 1
-        return createdDocsCount
-
-    def update(self, indexop, index):
-        updatedDocsCount = 0
-        with index.flushing():
-            for key,doc in self.document_generator.generate(indexop.data.keys):
+                if self.fingerprint_store is not None:
+                    self.fingerprints[key] = self.fingerprint_store.fingerprint(doc)
+                yield ("put", (key, doc, True))
+        return self._send(index, index_factory, operations())
+
+    def update(self, indexop, index, index_factory=None):
+        def operations():
+            for key,doc in self._timed(self.document_generator.generate(indexop.data.keys, indexop.key_range)):
                 # setting create=False means that the index operation will
                 # succeed if the document already exists.  It also means that
                 # the document *will be* created if it doesn't already exist.
-                index.put(key, doc, create=False)
-                if len(index.errors):
-                    raise Exception("ElasticSearch client error")
-                updatedDocsCount += 1
-        return updatedDocsCount
+                if self._unchanged(indexop, key, doc):
+                    self.skipped += 1
+                    continue
+                yield ("put", (key, doc, False))
+        return self._send(index, index_factory, operations())
+
+    def _partial(self, indexop):
+        """Check if an update should be performed with partial updates.
+
+        Updates restricted to fields which the document generator does
+        not support fall back to full updates.
+
+        Args:
+            indexop: IndexOp object
+        Returns:
+            True if partial updates should be used
+        """
+        if not indexop.data.fields or self.admin_client is None:
+            return False
+        if not self.document_generator.supports_fields(indexop.data.fields):
+            self.log.warning("Partial updates of fields %s not supported for index '%s/%s'" % (indexop.data.fields, indexop.data.name, indexop.data.type))
+            return False
+        return True
+
+    def update_fields(self, indexop, index, index_factory=None):
+        def operations():
+            for key,doc in self._timed(self.document_generator.generate_fields(indexop.data.keys, indexop.data.fields, indexop.key_range)):
+                # partial updates fail if the document does not exist
+                yield ("update", (key, doc))
+        return self._send(index, index_factory, operations())
+
+    def _unchanged(self, indexop, key, doc):
+        """Check if a document is unchanged since it was last indexed.
+
+        The document's fingerprint is recorded so that it can be
+        stored once the document has been indexed.
+
+        Args:
+            indexop: IndexOp object
+            key: document key
+            doc: JSON dictionary
+        Returns:
+            True if the document is known to be unchanged.
+        """
+        if self.fingerprint_store is None:
+            return False
+
+        fingerprint = self.fingerprint_store.fingerprint(doc)
+        if self.fingerprint_store.get(indexop.data.name, key) == fingerprint:
+            return True
+        self.fingerprints[key] = fingerprint
+        return False
 
     def delete(self, indexop, index):
         deletedKeysCount = 0
         with index.flushing():
             for key in indexop.data.keys:
                 index.delete(key)
-                if len(index.errors):
-                    raise Exception("ElasticSearch client error")
                 deletedKeysCount += 1
-        return deletedKeysCount
\ No newline at end of file
+        return deletedKeysCount
+
+    def _setting(self, settings, name, default):
+        """Return an index setting from an ElasticSearch settings response.
+
+        Depending on the ElasticSearch version, settings are returned
+        flattened, i.e. {"index.number_of_replicas": "1"}, or nested.
+        """
+        if "index.%s" % name in settings:
+            return settings["index.%s" % name]
+        return settings.get("index", {}).get(name, default)
+
+    def rebuild(self, indexop, es_client):
+        """Rebuild the entire index.
+
+        A new index, named after the index and the current time, is
+        created from the mapping file and loaded with refreshes disabled
+        and no replicas. Once loaded, these settings are restored, the
+        index is optionally warmed, and the index name, an alias, is
+        atomically moved to the new index. The previous index is then
+        deleted.
+
+        Args:
+            indexop: IndexOp object
+            es_client: ESClient object
+        Returns:
+            IndexResult object
+        Raises:
+            Exception if any document fails to index, or an
+            ElasticSearch admin request fails. The new index
+            is deleted and the live index is unchanged, unless
+            the live index was already deleted to be replaced.
+        """
+        if self.admin_client is None or self.mapping_file is None:
+            raise Exception("ESIndexer rebuild not supported for index '%s'" % indexop.data.name)
+
+        alias = indexop.data.name
+        name = "%s_%s" % (alias, tz.utcnow().strftime("%Y%m%d%H%M%S"))
+        with open(self.mapping_file) as f:
+            mapping = f.read()
+
+        self.admin_client.create_index(name, mapping)
+        live_deleted = False
+        try:
+            settings = self.admin_client.get_settings(name)
+            refresh_interval = self._setting(settings, "refresh_interval", "1s")
+            replicas = self._setting(settings, "number_of_replicas", 1)
+
+            # Disable refreshes and replication while loading
+            self.admin_client.update_settings(name, {
+                "refresh_interval": "-1",
+                "number_of_replicas": 0
+            })
+
+            def index_factory(es_client):
+                return BulkIndex(
+                    es_client.get_bulk_index(name, indexop.data.type, autoflush=None),
+                    self.bulk_policy
+                )
+            index = index_factory(es_client)
+            count = self.create(indexop, index, index_factory)
+            result = self._result(count, index.errors)
+            if result.failed_keys:
+                raise Exception("ESIndexer failed to load %d documents into index '%s'" % (len(result.failed_keys), name))
+
+            self.admin_client.update_settings(name, {
+                "refresh_interval": refresh_interval,
+                "number_of_replicas": replicas
+            })
+            self.admin_client.refresh(name)
+
+            for query_file in self.warm_queries:
+                with open(query_file) as f:
+                    self.admin_client.search(name, f.read())
+
+            old_indexes = self.admin_client.get_alias_indexes(alias)
+            if not old_indexes and self.admin_client.index_exists(alias):
+                # The live index predates rebuilds and is not an alias.
+                # It's deleted in the request creating the alias, if
+                # ElasticSearch supports it, or else just before.
+                self.log.warning("Replacing index '%s' with an alias" % alias)
+                try:
+                    self.admin_client.swap_alias(alias, [], name, remove_indexes=[alias])
+                except Exception as e:
+                    self.log.warning("Failed to replace index '%s' atomically: %s" % (alias, e))
+                    live_deleted = True
+                    self.admin_client.delete_index(alias)
+                    self.admin_client.swap_alias(alias, [], name)
+            else:
+                self.admin_client.swap_alias(alias, old_indexes, name)
+
+        except Exception:
+            exc_info = sys.exc_info()
+            if live_deleted:
+                # The new index is all that's left, so it's kept
+                # for the alias to be pointed at it.
+                self.log.error("Index '%s' was deleted, keeping new index '%s'" % (alias, name))
+            else:
+                try:
+                    self.admin_client.delete_index(name)
+                except Exception as e:
+                    self.log.exception(e)
+            raise exc_info[0], exc_info[1], exc_info[2]
+
+        # Previous indexes are only deleted once the alias is confirmed
+        # to refer to the new index.
+        if self.admin_client.get_alias_indexes(alias) != [name]:
+            self.log.error("Alias '%s' does not refer to new index '%s', keeping indexes: %s" %\
+                           (alias, name, old_indexes))
+            return result
+        for old_index in old_indexes:
+            self.admin_client.delete_index(old_index)
+        return result
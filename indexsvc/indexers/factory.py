@@ -1,12 +1,19 @@
+import os
+
 from trpycore.factory.base import Factory
 
+import settings
+
+from bulk import BulkPolicy
+from es_admin import ESAdminClient
 from es_indexer import ESIndexer
 
 
 class IndexerFactory(Factory):
     """Factory for creating Indexer objects."""
 
-    def __init__(self, db_session_factory, index_client_pool, index_name, doc_type):
+    def __init__(self, db_session_factory, index_client_pool, index_name, doc_type,
+                 fingerprint_store=None, reference_cache=None):
         """IndexerFactory constructor.
 
         Args:
@@ -14,11 +21,15 @@ class IndexerFactory(Factory):
             index_client_pool: pool of index client objects
             index_name: index name
             doc_type: document type
+            fingerprint_store: optional FingerprintStore object
+            reference_cache: optional ReferenceCache object
         """
         self.db_session_factory = db_session_factory
         self.index_client_pool = index_client_pool
         self.index_name = index_name
         self.doc_type = doc_type
+        self.fingerprint_store = fingerprint_store
+        self.reference_cache = reference_cache
 
     def create(self):
         """Create an instance of Indexer based upon input name and type
@@ -32,10 +43,22 @@ class IndexerFactory(Factory):
            self.index_name == 'technologies' and self.doc_type == 'technology' or\
            self.index_name == 'topics' and self.doc_type == 'topic' or\
            self.index_name == 'locations' and self.doc_type == 'location':
+            bulk_policy = dict(settings.INDEXER_BULK_POLICY)
+            bulk_policy.update(settings.INDEXER_BULK_POLICIES.get(self.index_name, {}))
+            mapping_file = os.path.join(settings.INDEXER_MAPPINGS_DIRECTORY,
+                    "%s.json" % self.index_name)
             ret = ESIndexer(
                 self.db_session_factory,
                 self.index_client_pool,
                 self.index_name,
-                self.doc_type
+                self.doc_type,
+                bulk_policy=BulkPolicy(**bulk_policy),
+                fingerprint_store=self.fingerprint_store,
+                reference_cache=self.reference_cache,
+                admin_client=ESAdminClient(settings.ES_ENDPOINT),
+                mapping_file=mapping_file,
+                warm_queries=settings.INDEXER_REBUILD_WARM_QUERIES.get(self.index_name),
+                pipeline_senders=settings.INDEXER_PIPELINE_SENDERS,
+                pipeline_queue_size=settings.INDEXER_PIPELINE_QUEUE_SIZE
             )
         return ret
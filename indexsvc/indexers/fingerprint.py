@@ -0,0 +1,137 @@
+import anydbm
+import glob
+import hashlib
+import logging
+import os
+import threading
+
+import serialization
+
+
+class FingerprintStore(object):
+    """Persistent store of the fingerprints of indexed documents.
+
+    A fingerprint is a stable hash of a document's JSON. The store keeps
+    the fingerprint of the last document successfully indexed for each key,
+    per index, which allows indexers to skip documents that are unchanged.
+
+    Fingerprints are stored in a dbm file per index in the specified
+    directory. Since the store is local to this process, it is only
+    accurate if the documents of an index are written solely by this
+    process. Clear the store for an index whenever the index is
+    modified by other means, i.e. deleted or rebuilt.
+    """
+    def __init__(self, directory):
+        """Constructor.
+
+        Args:
+            directory: directory containing the fingerprint files
+        """
+        self.log = logging.getLogger(__name__)
+        self.directory = directory
+        self.databases = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint(doc):
+        """Return the fingerprint of a document.
+
+        Args:
+            doc: JSON dictionary
+        Returns:
+            fingerprint string
+        """
+        return hashlib.sha1(serialization.dumps(doc, sort_keys=True)).hexdigest()
+
+    def _path(self, index_name):
+        """Return the path of the dbm file of an index."""
+        return os.path.join(self.directory, "%s.fingerprints" % index_name)
+
+    def _database(self, index_name, flag="c"):
+        """Return the dbm database of an index. Caller must hold the lock.
+
+        Args:
+            index_name: index name
+            flag: anydbm open flag used if the database is not open,
+                i.e. "n" to create a new, empty database.
+        Returns:
+            dbm database object
+        """
+        database = self.databases.get(index_name)
+        if database is None:
+            if not os.path.exists(self.directory):
+                os.makedirs(self.directory)
+            database = anydbm.open(self._path(index_name), flag)
+            self.databases[index_name] = database
+        return database
+
+    def get(self, index_name, key):
+        """Return the fingerprint of a document, or None if unknown.
+
+        Args:
+            index_name: index name
+            key: document key
+        Returns:
+            fingerprint string or None
+        """
+        with self.lock:
+            # gdbm databases have no get()
+            database = self._database(index_name)
+            key = str(key)
+            return database[key] if key in database else None
+
+    def update(self, index_name, fingerprints):
+        """Store document fingerprints.
+
+        Args:
+            index_name: index name
+            fingerprints: dict of {key: fingerprint}
+        """
+        if not fingerprints:
+            return
+        with self.lock:
+            database = self._database(index_name)
+            for key, fingerprint in fingerprints.items():
+                database[str(key)] = fingerprint
+            if hasattr(database, "sync"):
+                database.sync()
+
+    def remove(self, index_name, keys):
+        """Remove document fingerprints.
+
+        Args:
+            index_name: index name
+            keys: list of document keys
+        """
+        with self.lock:
+            database = self._database(index_name)
+            for key in keys:
+                key = str(key)
+                if key in database:
+                    del database[key]
+            if hasattr(database, "sync"):
+                database.sync()
+
+    def clear(self, index_name):
+        """Remove all fingerprints of an index.
+
+        Args:
+            index_name: index name
+        """
+        with self.lock:
+            # Recreate the file rather than deleting keys one at a
+            # time, which rewrites the index file of dumbdbm databases.
+            # dumbdbm ignores the "n" flag, so its files are removed.
+            database = self.databases.pop(index_name, None)
+            if database is not None:
+                database.close()
+            for path in glob.glob("%s*" % self._path(index_name)):
+                os.remove(path)
+            self._database(index_name, "n")
+
+    def close(self):
+        """Close all fingerprint files."""
+        with self.lock:
+            for database in self.databases.values():
+                database.close()
+            self.databases = {}
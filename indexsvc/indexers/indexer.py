@@ -1,6 +1,37 @@
 import abc
 
 
+class IndexResult(object):
+    """Result of an index operation.
+
+    Indexers report documents which could not be indexed via
+    failed_keys, rather than failing the entire operation, so that
+    only the failed documents need to be retried.
+
+    Args:
+        count: number of documents successfully processed
+        failed_keys: list of keys of documents which failed
+        errors: list of errors reported by the index
+        skipped: number of unchanged documents which were not sent
+    """
+    def __init__(self, count=0, failed_keys=None, errors=None, skipped=0):
+        self.count = count
+        self.failed_keys = failed_keys or []
+        self.errors = errors or []
+        self.skipped = skipped
+
+    def merge(self, result):
+        """Combine another IndexResult into this result.
+
+        Args:
+            result: IndexResult object
+        """
+        self.count += result.count
+        self.failed_keys.extend(result.failed_keys)
+        self.errors.extend(result.errors)
+        self.skipped += result.skipped
+
+
 class Indexer(object):
     """Indexer abstract base class.
 
@@ -28,6 +59,35 @@ class Indexer(object):
             indexop: IndexOp object
 
         Returns:
-            None
+            IndexResult object
+        """
+        return
+
+    def partition(self, indexop, count):
+        """ Split an index operation into key range partitions.
+
+        The returned IndexOp objects may be indexed concurrently
+        and together cover the same documents as the input indexop.
+        Indexers which do not support partitioning return the
+        input indexop unchanged.
+
+        Args:
+            indexop: IndexOp object
+            count: desired number of partitions
+
+        Returns:
+            list of IndexOp objects
+        """
+        return [indexop]
+
+    def changed_keys(self, since):
+        """ Return the keys of documents whose source data changed.
+
+        Args:
+            since: datetime
+
+        Returns:
+            list of keys, or None if the Indexer is not able to
+            determine changed documents.
         """
-        return
\ No newline at end of file
+        return None
\ No newline at end of file
@@ -0,0 +1,146 @@
+import logging
+import Queue
+import sys
+import threading
+
+import jobstats
+
+
+class BulkPipeline(object):
+    """Sends bulk operations on sender threads while they are produced.
+
+    The producing thread puts operations on a bounded queue, which is
+    drained by sender threads into bulk requests. Documents are thus
+    generated while bulk requests are in flight, and the time to index
+    approaches the slower of generating and sending, rather than their
+    sum. The queue bounds the number of documents held in memory.
+
+    The first sender uses the provided BulkIndex. Additional senders
+    each get a client from the index client pool, which must be large
+    enough for them, and create their own BulkIndex.
+
+    If a sender fails, the remaining operations are not sent and the
+    sender's exception is raised by send().
+    """
+
+    # Marks the end of the operations
+    END = object()
+
+    # Seconds between checks for failed senders while waiting on the queue
+    POLL_SECONDS = 0.1
+
+    def __init__(self, index, index_client_pool=None, index_factory=None,
+                 senders=1, queue_size=1000):
+        """Constructor.
+
+        Args:
+            index: BulkIndex object used by the first sender
+            index_client_pool: optional pool of index client objects
+                used by additional senders.
+            index_factory: optional callable taking an index client and
+                returning a BulkIndex to the same index as index. Required
+                for additional senders.
+            senders: number of sender threads
+            queue_size: maximum number of queued operations
+        """
+        self.log = logging.getLogger(__name__)
+        self.index = index
+        self.index_client_pool = index_client_pool
+        self.index_factory = index_factory
+        self.senders = senders
+        if index_client_pool is None or index_factory is None:
+            self.senders = 1
+        self.queue = Queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock()
+        self.failures = []
+        self.indexes = []
+
+    def send(self, operations):
+        """Send operations.
+
+        Args:
+            operations: iterable of (method name, args) tuples. Each
+                operation is sent by invoking the BulkIndex method, i.e.
+                ("put", (key, doc, False)) invokes index.put(key, doc, False).
+        Returns:
+            number of operations produced
+        Raises:
+            Exception raised by a sender, or while producing operations.
+            Errors reported by the index for additional senders are
+            added to the errors of index.
+        """
+        stats = jobstats.current()
+        threads = []
+        for number in range(self.senders):
+            thread = threading.Thread(target=self._run, args=(number, stats))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+        count = 0
+        try:
+            for operation in operations:
+                if not self._put(operation):
+                    break
+                count += 1
+        finally:
+            for thread in threads:
+                self._put(self.END)
+            for thread in threads:
+                thread.join()
+
+        for index in self.indexes:
+            self.index.errors.extend(index.errors)
+
+        if self.failures:
+            exc_info = self.failures[0]
+            raise exc_info[0], exc_info[1], exc_info[2]
+        return count
+
+    def _put(self, item):
+        """Put an item on the queue.
+
+        Returns:
+            True if the item was queued, False if a sender failed.
+        """
+        while not self.failures:
+            try:
+                self.queue.put(item, timeout=self.POLL_SECONDS)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    def _run(self, number, stats):
+        """Sender thread run method."""
+        try:
+            with jobstats.activate(stats):
+                if number == 0:
+                    self._drain(self.index)
+                else:
+                    with self.index_client_pool.get() as index_client:
+                        index = self.index_factory(index_client)
+                        self._drain(index)
+                        with self.lock:
+                            self.indexes.append(index)
+        except Exception as error:
+            self.log.exception(error)
+            with self.lock:
+                self.failures.append(sys.exc_info())
+
+    def _drain(self, index):
+        """Send queued operations until the end of the operations."""
+        with index.flushing():
+            while True:
+                try:
+                    item = self.queue.get(timeout=self.POLL_SECONDS)
+                except Queue.Empty:
+                    if self.failures:
+                        return
+                    # Documents are slow to arrive
+                    index.flush_expired()
+                    continue
+                if item is self.END:
+                    break
+                method, args = item
+                getattr(index, method)(*args)
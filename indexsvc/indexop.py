@@ -1,12 +1,20 @@
-import json
 import logging
 
 from trindexsvc.gen.ttypes import IndexData
 
+import serialization
+
 
 class IndexAction:
-    """ Class to represent allowed index actions."""
-    Create, Update, Delete = range(3)
+    """ Class to represent allowed index actions.
+
+    Rebuild creates a new version of the entire index, and
+    replaces the live index with it once complete.
+
+    Incremental updates the documents whose source data changed
+    since the last successful incremental operation on the index.
+    """
+    Create, Update, Delete, Rebuild, Incremental = range(5)
 
 
 class IndexOp(object):
@@ -20,34 +28,121 @@ class IndexOp(object):
         keys: <list of keys to perform index operation on>
               If keys is empty, the index action is to be performed on the
               entire index.
+        key_range: <optional [start, end] list of keys>
+              Restricts an index operation on the entire index to keys
+              >= start and < end. Either bound may be null.
+        fields: <optional list of top-level document fields>
+              Restricts an update to the specified fields of
+              existing documents.
+        priority: <optional IndexPriority>
+              Priority lane of the operation's job. If absent, the
+              lane is derived when the job is queued.
+        sources: <optional list of source index names>
+              Names of the indexes whose changes caused the operation,
+              i.e. for dependent document updates. Cached reference rows
+              of the source indexes are invalidated before indexing.
     }
     """
-    def __init__(self, action, data):
+    def __init__(self, action, data, key_range=None, sources=None):
         """Constructor
 
         Args:
             action: IndexAction enum
             data: Thrift IndexData object
+            key_range: optional (start, end) tuple of keys
+            sources: optional list of source index names
         """
         self.log = logging.getLogger(__name__)
         self.action = action
         self.data = data
+        self.key_range = key_range
+        self.sources = sources or []
 
     def to_json(self):
         """ Return IndexOp as JSON formatted string"""
-        return {
+        ret = {
             "action": self.action,
             "name": self.data.name,
             "type": self.data.type,
             "keys": [key for key in self.data.keys]
         }
+        if self.key_range is not None:
+            ret["key_range"] = list(self.key_range)
+        if self.data.fields:
+            ret["fields"] = list(self.data.fields)
+        if self.data.priority is not None:
+            ret["priority"] = self.data.priority
+        if self.sources:
+            ret["sources"] = list(self.sources)
+        return ret
 
     @staticmethod
     def from_json(data):
         """ Return IndexOp object from JSON formatted string"""
-        data_obj = json.loads(data)
+        data_obj = serialization.loads(data)
         action = data_obj['action']
         name = data_obj['name']
         type = data_obj['type']
         keys = data_obj['keys']
-        return IndexOp(action, IndexData(name=name, type=type, keys=keys))
\ No newline at end of file
+        fields = data_obj.get('fields')
+        priority = data_obj.get('priority')
+        key_range = data_obj.get('key_range')
+        if key_range is not None:
+            key_range = tuple(key_range)
+        sources = data_obj.get('sources')
+        return IndexOp(action, IndexData(name=name, type=type, keys=keys, fields=fields, priority=priority), key_range, sources)
+
+
+class IndexOpSQL(object):
+    """ Postgres expressions of the fields of IndexOps serialized in a column.
+
+    IndexOps are serialized as JSON (see IndexOp.to_json), which allows
+    jobs to be filtered on their operation in SQL with the Postgres json
+    operators, rather than by reading and deserializing every job.
+    Expressions are SQL fragments for use with sqlalchemy text(). Values
+    compared against them should be bound as parameters.
+    """
+    def __init__(self, column):
+        """Constructor
+
+        Args:
+            column: name of the column holding serialized IndexOps,
+                optionally qualified by its table name.
+        """
+        self.column = column
+
+    def field(self, name):
+        """Return the expression of a top-level field as text."""
+        return "(%s::json->>'%s')" % (self.column, name)
+
+    @property
+    def action(self):
+        """IndexAction expression."""
+        return "(%s::integer)" % self.field("action")
+
+    @property
+    def name(self):
+        """Index name expression."""
+        return self.field("name")
+
+    @property
+    def type(self):
+        """Document type expression."""
+        return self.field("type")
+
+    @property
+    def num_keys(self):
+        """Number of keys expression."""
+        return "json_array_length(coalesce(%s::json->'keys', '[]'::json))" % self.column
+
+    @property
+    def priority(self):
+        """IndexPriority expression, 0 if the priority is absent."""
+        return "coalesce((%s::integer), 0)" % self.field("priority")
+
+    @property
+    def token(self):
+        """Ownership token expression (see IndexMembership.token)."""
+        return "(CASE WHEN %s > 0 THEN %s || '/' || (%s::json->'keys'->>0) ELSE %s END)" %\
+                (self.num_keys, self.name, self.column, self.name)
+
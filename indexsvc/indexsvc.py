@@ -34,7 +34,7 @@ class IndexService(DefaultService):
             port=settings.THRIFT_SERVER_PORT,
             handler=handler,
             processor=TIndexService.Processor(handler),
-            threads=1)
+            threads=settings.THRIFT_SERVER_THREADS)
 
         super(IndexService, self).__init__(
             name=settings.SERVICE,
@@ -4,16 +4,22 @@ import threading
 
 from trpycore.thread.util import join
 from trpycore.thread.threadpool import ThreadPool
-from trsvcscore.db.models import IndexJob
-from trsvcscore.db.job import DatabaseJobQueue, QueueEmpty, QueueStopped
+from trsvcscore.db.job import QueueStopped
 
+from jobqueue import IndexJobQueue
+from partition import IndexPartitionSet
 
 
 class IndexThreadPool(ThreadPool):
     """Thread pool used to index documents.
 
     Given a work item (a databasejob), this class will process the
-    job and delegate the work to do the indexing.
+    job and delegate the work to do the indexing. Work items may also
+    be IndexPartitionSet objects, in which case the worker helps to
+    index the remaining partitions of a job owned by another worker.
+
+    The pool keeps track of its idle worker threads, so that jobs
+    are only claimed when there are workers to process them.
     """
     def __init__(self, num_threads, indexer_coordinator_pool):
         """Constructor.
@@ -26,6 +32,33 @@ class IndexThreadPool(ThreadPool):
         super(IndexThreadPool, self).__init__(num_threads)
         self.log = logging.getLogger(__name__)
         self.indexer_coordinator_pool = indexer_coordinator_pool
+        self.num_threads = num_threads
+        self.pending = 0
+        self.idle_condition = threading.Condition()
+
+    def put(self, work_item):
+        """Put a work item on the queue.
+
+        Args:
+            work_item: DatabaseJob or IndexPartitionSet object
+        """
+        with self.idle_condition:
+            self.pending += 1
+        super(IndexThreadPool, self).put(work_item)
+
+    def wait_idle(self, timeout=None):
+        """Wait until a worker thread is idle.
+
+        Args:
+            timeout: maximum number of seconds to wait
+        Returns:
+            number of idle worker threads, 0 if none became
+            idle before the timeout.
+        """
+        with self.idle_condition:
+            if self.pending >= self.num_threads:
+                self.idle_condition.wait(timeout)
+            return max(0, self.num_threads - self.pending)
 
 
     def process(self, database_job):
@@ -36,13 +69,22 @@ class IndexThreadPool(ThreadPool):
 
         Args:
             database_job: DatabaseJob object, or objected derived from DatabaseJob
+                or IndexPartitionSet object.
         """
         try:
+            if isinstance(database_job, IndexPartitionSet):
+                database_job.process()
+                return
+
             with self.indexer_coordinator_pool.get() as indexer_coordinator:
                 indexer_coordinator.index(database_job)
 
         except Exception as e:
             self.log.exception(e)
+        finally:
+            with self.idle_condition:
+                self.pending -= 1
+                self.idle_condition.notify_all()
 
 
 
@@ -51,27 +93,56 @@ class IndexJobMonitor(object):
 
     This class monitors for new index jobs,
     and delegates work items to a thread pool.
+    New jobs are detected by polling the db, and immediately
+    upon invocation of wakeup().
+
+    Jobs are claimed in batches, as many as there are idle worker
+    threads, and handed straight to the idle workers.
+
+    Given a PriorityPolicy, jobs are assigned to priority lanes.
+    Lanes with a thread pool of their own have reserved worker
+    capacity: a monitor thread per lane claims the jobs of the
+    lane, in the order they became ready, for the lane's thread pool.
+    Jobs of the other lanes are claimed for the default thread pool.
+
+    Given an IndexMembership, the monitor only claims the jobs owned
+    by this node, or jobs whose owner has not claimed them in time.
     """
-    def __init__(self, db_session_factory, thread_pool, poll_seconds=60):
+
+    # Seconds between checks for stop while waiting for idle workers
+    IDLE_WAIT_SECONDS = 1
+    def __init__(self, db_session_factory, thread_pool, poll_seconds=60,
+                 priority_policy=None, lane_thread_pools=None, membership=None):
         """Constructor.
 
         Arguments:
             db_session_factory: callable returning a new sqlalchemy db session
-            thread_pool: pool of worker threads
+            thread_pool: default pool of worker threads
             poll_seconds: number of seconds between db queries to detect
                 new jobs.
+            priority_policy: optional PriorityPolicy object assigning
+                jobs to priority lanes.
+            lane_thread_pools: optional dict of {IndexPriority: thread pool}
+                of lanes with reserved worker threads. Requires
+                priority_policy.
+            membership: optional IndexMembership object determining
+                the jobs owned by this node.
         """
         self.log = logging.getLogger(__name__)
-        self.thread_pool = thread_pool
+        self.thread_pools = {None: thread_pool}
+        if priority_policy is not None:
+            self.thread_pools.update(lane_thread_pools or {})
 
-        self.db_job_queue = DatabaseJobQueue(
+        self.db_job_queue = IndexJobQueue(
             owner='indexsvc',
-            model_class=IndexJob,
             db_session_factory=db_session_factory,
             poll_seconds=poll_seconds,
+            priority_policy=priority_policy,
+            lanes=[lane for lane in self.thread_pools if lane is not None],
+            membership=membership
         )
 
-        self.monitor_thread = None
+        self.monitor_threads = []
         self.running = False
 
 
@@ -80,23 +151,39 @@ class IndexJobMonitor(object):
         if not self.running:
             self.running = True
             self.db_job_queue.start()
-            self.monitor_thread = threading.Thread(target=self.run)
-            self.monitor_thread.start()
+            for lane in self.thread_pools:
+                thread = threading.Thread(target=self.run, args=(lane,))
+                thread.start()
+                self.monitor_threads.append(thread)
+
 
+    def run(self, lane=None):
+        """Monitor thread run method.
 
-    def run(self):
-        """Monitor thread run method."""
+        Args:
+            lane: IndexPriority lane monitored by the thread,
+                or None for the default lane.
+        """
+        thread_pool = self.thread_pools[lane]
         while self.running:
             try:
-                self.log.info("IndexJobMonitor is checking for new jobs to process...")
-
-                # Grab jobs as they arrive and delegate
-                # jobs to threadpool for processing
-                job = self.db_job_queue.get()
-                self.thread_pool.put(job)
+                idle = thread_pool.wait_idle(self.IDLE_WAIT_SECONDS)
+                if not idle:
+                    continue
+
+                # Claim jobs for the idle workers as they arrive
+                # and delegate jobs to threadpool for processing
+                jobs = self.db_job_queue.claim(idle, lane=lane)
+                self.log.info("IndexJobMonitor claimed IndexJobs %s" %\
+                              [job.model_id for job in jobs])
+                for index, job in enumerate(jobs):
+                    try:
+                        thread_pool.put(job)
+                    except Exception:
+                        for unprocessed_job in jobs[index:]:
+                            unprocessed_job.release()
+                        raise
 
-            except QueueEmpty:
-                pass
             except QueueStopped:
                 break
             except Exception as error:
@@ -105,6 +192,11 @@ class IndexJobMonitor(object):
         self.running = False
 
 
+    def wakeup(self):
+        """Check for new jobs immediately."""
+        self.db_job_queue.wakeup()
+
+
     def stop(self):
         """Stop monitor."""
         if self.running:
@@ -114,7 +206,4 @@ class IndexJobMonitor(object):
 
     def join(self, timeout):
         """Join all threads."""
-        threads = [self.db_job_queue]
-        if self.monitor_thread is not None:
-            threads.append(self.monitor_thread)
-        join(threads, timeout)
+        join(self.monitor_threads, timeout)
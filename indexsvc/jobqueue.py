@@ -0,0 +1,270 @@
+import logging
+import threading
+
+from sqlalchemy.sql import func, text
+
+from trsvcscore.db.models import IndexJob
+from trsvcscore.db.job import QueueStopped
+
+from indexop import IndexOpSQL
+
+
+class ClaimedIndexJob(object):
+    """Context manager for an IndexJob claimed by IndexJobQueue.
+
+    Used in place of a DatabaseJob: the job has already been claimed,
+    so entering the context only reads the IndexJob. Exiting the context
+    marks the job finished, and successful if no exception was raised.
+    """
+    def __init__(self, db_session_factory, model_id):
+        """Constructor.
+
+        Args:
+            db_session_factory: callable returning a new sqlalchemy db session
+            model_id: IndexJob id
+        """
+        self.log = logging.getLogger(__name__)
+        self.db_session_factory = db_session_factory
+        self.model_id = model_id
+
+    def __enter__(self):
+        """Return the claimed IndexJob db model object."""
+        try:
+            db_session = None
+            db_session = self.db_session_factory()
+            job = db_session.query(IndexJob).get(self.model_id)
+            db_session.expunge(job)
+            db_session.commit()
+            return job
+        finally:
+            if db_session:
+                db_session.close()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._update({
+            IndexJob.end: func.current_timestamp(),
+            IndexJob.successful: exc_type is None
+        })
+        return False
+
+    def release(self):
+        """Release the claim of a job which will not be processed."""
+        self._update({
+            IndexJob.owner: None,
+            IndexJob.start: None
+        })
+
+    def _update(self, values):
+        try:
+            db_session = None
+            db_session = self.db_session_factory()
+            db_session.query(IndexJob)\
+                    .filter(IndexJob.id == self.model_id)\
+                    .update(values, synchronize_session=False)
+            db_session.commit()
+        except Exception as error:
+            self.log.exception(error)
+            if db_session:
+                db_session.rollback()
+        finally:
+            if db_session:
+                db_session.close()
+
+
+class IndexJobQueue(object):
+    """Queue of IndexJobs which are ready to be processed.
+
+    Jobs are claimed in batches: a single transaction locks as many
+    ready, unclaimed IndexJobs as requested with SELECT ... FOR UPDATE
+    SKIP LOCKED, and claims them. Rows locked by other claimers, i.e.
+    other indexsvc instances, are skipped rather than waited on or
+    claimed twice. Claimed jobs are returned as ClaimedIndexJob objects.
+
+    When no jobs are ready, claim() waits poll_seconds, or less if a
+    job is scheduled to become ready before then. Invoking wakeup()
+    triggers an immediate claim attempt, which allows new jobs to be
+    picked up as soon as they're created, i.e. via IndexJobListener.
+
+    Jobs may be claimed by priority lane. The lane of a job is
+    determined by a PriorityPolicy, in SQL, so that only the jobs of
+    the lane are locked. Jobs whose lane is not one of the queue's lanes
+    belong to the default lane, None. Within a lane, jobs are claimed
+    in the order they became ready.
+
+    Given an IndexMembership, only the jobs owned by this node are
+    claimed, until they have been ready for the membership's grace
+    period, after which any node may claim them. Ownership is also
+    determined in SQL, so that jobs owned by other nodes are not locked.
+    """
+    def __init__(self, owner, db_session_factory, poll_seconds=60,
+                 priority_policy=None, lanes=None, membership=None):
+        """Constructor.
+
+        Args:
+            owner: owner to record for claimed jobs
+            db_session_factory: callable returning a new sqlalchemy db session
+            poll_seconds: maximum number of seconds between db queries
+                to detect new jobs.
+            priority_policy: optional PriorityPolicy object. If not
+                provided all jobs belong to the default lane.
+            lanes: optional list of IndexPriority lanes, in addition
+                to the default lane.
+            membership: optional IndexMembership object. If not
+                provided all jobs are claimed by this node.
+        """
+        self.log = logging.getLogger(__name__)
+        self.owner = owner
+        self.db_session_factory = db_session_factory
+        self.poll_seconds = poll_seconds
+        self.priority_policy = priority_policy
+        self.lanes = sorted(lanes or [])
+        self.membership = membership
+        self.wakeup_events = dict([(lane, threading.Event())
+                                   for lane in [None] + list(lanes or [])])
+        self.running = False
+
+    def start(self):
+        """Start queue."""
+        self.running = True
+
+    def claim(self, max_jobs, lane=None):
+        """Claim ready jobs, waiting until at least one is claimed.
+
+        Args:
+            max_jobs: maximum number of jobs to claim
+            lane: IndexPriority lane, or None for the default lane
+        Returns:
+            list of ClaimedIndexJob objects
+        Raises:
+            QueueStopped if the queue has been stopped.
+        """
+        wakeup_event = self.wakeup_events[lane]
+        while self.running:
+            wakeup_event.clear()
+            wait_seconds = self.poll_seconds
+            try:
+                job_ids, wait_seconds = self._claim(max_jobs, lane)
+                if job_ids:
+                    return [ClaimedIndexJob(self.db_session_factory, job_id)
+                            for job_id in job_ids]
+            except Exception as error:
+                self.log.exception(error)
+            wakeup_event.wait(wait_seconds)
+        raise QueueStopped()
+
+    def _claim(self, max_jobs, lane):
+        """Claim ready jobs of a lane.
+
+        Returns:
+            (list of claimed IndexJob ids, number of seconds to wait
+            before the next claim if no jobs were claimed) tuple
+        """
+        table = IndexJob.__table__
+        columns = {
+            "table": table.fullname,
+            "id": table.c.id.name,
+            "owner": table.c.owner.name,
+            "not_before": table.c.not_before.name
+        }
+        params = {"max_jobs": max_jobs}
+
+        # Jobs of the lane, which are owned by this node, or
+        # have been ready for the membership's grace period.
+        predicates = ["%(owner)s IS NULL" % columns]
+        lane_clause, lane_params = self._lane_clause(lane)
+        if lane_clause is not None:
+            predicates.append(lane_clause)
+            params.update(lane_params)
+
+        owned_clause = None
+        ready = "%(not_before)s" % columns
+        if self.membership is not None:
+            owned_clause, owned_params = self.membership.clause(
+                    IndexOpSQL(table.c.data.name))
+            params.update(owned_params)
+            params["grace_seconds"] = self.membership.grace_seconds
+        if owned_clause is not None:
+            ready = "(CASE WHEN %s THEN %s ELSE %s + :grace_seconds * interval '1 second' END)" %\
+                    (owned_clause, columns["not_before"], columns["not_before"])
+
+        statement = "SELECT %(id)s FROM %(table)s WHERE %(predicates)s "\
+                "AND %(ready)s <= current_timestamp "\
+                "ORDER BY %(not_before)s, %(id)s LIMIT :max_jobs "\
+                "FOR UPDATE SKIP LOCKED" % dict(columns,
+                        predicates=" AND ".join(predicates), ready=ready)
+
+        try:
+            db_session = None
+            db_session = self.db_session_factory()
+
+            rows = db_session.execute(text(statement), params).fetchall()
+            job_ids = [job_id for (job_id,) in rows]
+
+            if job_ids:
+                db_session.query(IndexJob)\
+                        .filter(IndexJob.id.in_(job_ids))\
+                        .update({
+                            IndexJob.owner: self.owner,
+                            IndexJob.start: func.current_timestamp()
+                        }, synchronize_session=False)
+                next_seconds = None
+            else:
+                # Wake up in time for the next job which may be claimed,
+                # including jobs of other members once their grace ends.
+                statement = "SELECT extract(epoch from min(%(ready)s) - current_timestamp) "\
+                        "FROM %(table)s WHERE %(predicates)s "\
+                        "AND %(ready)s > current_timestamp" % dict(columns,
+                                predicates=" AND ".join(predicates), ready=ready)
+                next_seconds = db_session.execute(text(statement), params).scalar()
+            db_session.commit()
+        except Exception:
+            if db_session:
+                db_session.rollback()
+            raise
+        finally:
+            if db_session:
+                db_session.close()
+
+        wait_seconds = self.poll_seconds
+        if next_seconds is not None:
+            wait_seconds = min(wait_seconds, float(next_seconds))
+        return job_ids, max(0.1, wait_seconds)
+
+    def _lane_clause(self, lane):
+        """Return the SQL predicate selecting the jobs of a lane.
+
+        Jobs of the default lane are the jobs which belong to none
+        of the queue's other lanes.
+
+        Args:
+            lane: IndexPriority lane, or None for the default lane
+        Returns:
+            (SQL text fragment, dict of bind params) tuple. The
+            fragment is None if all jobs belong to the lane.
+        """
+        if self.priority_policy is None or not self.lanes:
+            return None, {}
+
+        data = IndexOpSQL(IndexJob.__table__.c.data.name)
+        context = IndexJob.__table__.c.context.name
+        if lane is not None:
+            return self.priority_policy.clause(data, context, lane)
+
+        clauses = []
+        params = {}
+        for reserved_lane in self.lanes:
+            clause, clause_params = self.priority_policy.clause(data, context, reserved_lane)
+            clauses.append(clause)
+            params.update(clause_params)
+        return "NOT (%s)" % " OR ".join(clauses), params
+
+    def wakeup(self):
+        """Claim new jobs immediately."""
+        for wakeup_event in self.wakeup_events.values():
+            wakeup_event.set()
+
+    def stop(self):
+        """Stop queue."""
+        if self.running:
+            self.running = False
+            self.wakeup()
@@ -0,0 +1,259 @@
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Job stages
+QUEUE_WAIT = "queue_wait"
+DB = "db"
+HYDRATE = "hydrate"
+BUILD = "build"
+SERIALIZE = "serialize"
+BULK = "bulk"
+TOTAL = "total"
+STAGES = [QUEUE_WAIT, DB, HYDRATE, BUILD, SERIALIZE, BULK, TOTAL]
+
+# Job counters
+QUERIES = "queries"
+DOCS = "docs"
+SKIPPED = "skipped"
+BULK_REQUESTS = "bulk_requests"
+BULK_BYTES = "bulk_bytes"
+COUNTERS = [QUERIES, DOCS, SKIPPED, BULK_REQUESTS, BULK_BYTES]
+
+# The stats of the job being processed by the current thread
+_local = threading.local()
+_listening = False
+_listening_lock = threading.Lock()
+
+
+class JobStats(object):
+    """Stage timings and counters of a single index job.
+
+    Stages are timed as self time: the time spent in a stage nested
+    within another stage, i.e. db queries made while hydrating model
+    objects, is only attributed to the nested stage. Job partitions
+    may be processed by several threads at once, so the stage times
+    of a job may add up to more than its total time.
+
+    Stages:
+        queue_wait: time between the job becoming ready and being claimed
+        db: execution of db queries
+        hydrate: reading query results into model objects and rows
+        build: building documents from model objects
+        serialize: serializing documents for bulk requests
+        bulk: ElasticSearch bulk requests
+        total: processing of the job, from claim to finish
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.seconds = defaultdict(float)
+        self.counts = defaultdict(int)
+
+    def add_time(self, stage, seconds):
+        """Add time spent in a stage.
+
+        Args:
+            stage: stage name
+            seconds: number of seconds
+        """
+        with self.lock:
+            self.seconds[stage] += seconds
+
+    def increment(self, counter, value=1):
+        """Increment a counter.
+
+        Args:
+            counter: counter name
+            value: amount to increment by
+        """
+        with self.lock:
+            self.counts[counter] += value
+
+    def merge(self, seconds, counts):
+        """Add stage times and counters, i.e. of another process.
+
+        Args:
+            seconds: dict of {stage: seconds}
+            counts: dict of {counter: value}
+        """
+        with self.lock:
+            for stage, value in seconds.items():
+                self.seconds[stage] += value
+            for counter, value in counts.items():
+                self.counts[counter] += value
+
+    def to_json(self):
+        """Return stage milliseconds and counters as a JSON dictionary."""
+        with self.lock:
+            result = dict([("%s_ms" % stage, int(self.seconds[stage] * 1000))
+                           for stage in STAGES])
+            result.update([(counter, self.counts[counter]) for counter in COUNTERS])
+        return result
+
+
+class Stage(object):
+    """Context manager timing a stage of the current thread's job.
+
+    Stages are only timed while JobStats are active on the
+    current thread. A Stage object must not be reused.
+
+    Args:
+        name: stage name
+    """
+    def __init__(self, name):
+        self.name = name
+        self.stats = None
+        self.nested = 0.0
+        self.start = None
+
+    def __enter__(self):
+        self.stats = getattr(_local, "stats", None)
+        if self.stats is not None:
+            _local.stack.append(self)
+            self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.stats is not None:
+            elapsed = time.time() - self.start
+            _local.stack.pop()
+            self.stats.add_time(self.name, elapsed - self.nested)
+            if _local.stack:
+                _local.stack[-1].nested += elapsed
+        return False
+
+
+@contextmanager
+def activate(stats):
+    """Context manager making JobStats the current thread's job stats.
+
+    Args:
+        stats: JobStats object, or None to disable stats
+    """
+    previous = (getattr(_local, "stats", None), getattr(_local, "stack", None))
+    _local.stats = stats
+    _local.stack = []
+    try:
+        yield stats
+    finally:
+        _local.stats, _local.stack = previous
+
+def current():
+    """Return the current thread's JobStats, or None."""
+    return getattr(_local, "stats", None)
+
+def increment(counter, value=1):
+    """Increment a counter of the current thread's job, if any.
+
+    Args:
+        counter: counter name
+        value: amount to increment by
+    """
+    stats = getattr(_local, "stats", None)
+    if stats is not None:
+        stats.increment(counter, value)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if getattr(_local, "stats", None) is not None:
+        _local.query_start = time.time()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = getattr(_local, "stats", None)
+    start = getattr(_local, "query_start", None)
+    if stats is None or start is None:
+        return
+
+    # Queries are not nested, so there's no stack of query timers.
+    # A start time left behind by a failed query is overwritten.
+    _local.query_start = None
+    elapsed = time.time() - start
+    stats.add_time(DB, elapsed)
+    stats.increment(QUERIES)
+    if _local.stack:
+        _local.stack[-1].nested += elapsed
+
+def listen_queries():
+    """Time and count the db queries of jobs.
+
+    Listens to the queries of all sqlalchemy engines. Queries are
+    only recorded for threads with active JobStats. Safe to invoke
+    more than once.
+    """
+    global _listening
+    with _listening_lock:
+        if not _listening:
+            event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+            _listening = True
+
+
+class IndexStats(object):
+    """Aggregate stage timings and counters of processed index jobs.
+
+    Exported as service counters. For each stage, the total number of
+    milliseconds, and a histogram of the per-job milliseconds, are
+    kept. Histogram buckets are cumulative: index_<stage>_ms_le_<n>
+    counts the jobs which spent at most n milliseconds in the stage.
+    """
+    def __init__(self, buckets_ms=None):
+        """Constructor.
+
+        Args:
+            buckets_ms: optional list of histogram bucket upper bounds,
+                in milliseconds.
+        """
+        self.lock = threading.Lock()
+        self.buckets_ms = sorted(buckets_ms or [10, 100, 1000, 10000, 60000, 600000])
+        self.jobs = 0
+        self.failed_jobs = 0
+        self.stage_ms = defaultdict(int)
+        self.histograms = defaultdict(lambda: [0] * (len(self.buckets_ms) + 1))
+        self.counts = defaultdict(int)
+
+    def record(self, stats, successful):
+        """Add the stats of a processed job.
+
+        Args:
+            stats: JobStats object
+            successful: boolean indicating if the job succeeded
+        """
+        values = stats.to_json()
+        with self.lock:
+            self.jobs += 1
+            if not successful:
+                self.failed_jobs += 1
+            for stage in STAGES:
+                ms = values["%s_ms" % stage]
+                self.stage_ms[stage] += ms
+                histogram = self.histograms[stage]
+                for i, bound in enumerate(self.buckets_ms):
+                    if ms <= bound:
+                        histogram[i] += 1
+                histogram[-1] += 1
+            for counter in COUNTERS:
+                self.counts[counter] += values[counter]
+
+    def counters(self):
+        """Return the service counters.
+
+        Returns:
+            dict of {counter name: integer value}
+        """
+        with self.lock:
+            counters = {
+                "index_jobs": self.jobs,
+                "index_jobs_failed": self.failed_jobs
+            }
+            for counter in COUNTERS:
+                counters["index_%s" % counter] = self.counts[counter]
+            for stage in STAGES:
+                counters["index_%s_ms" % stage] = self.stage_ms[stage]
+                histogram = self.histograms[stage]
+                for bound, count in zip(self.buckets_ms, histogram):
+                    counters["index_%s_ms_le_%d" % (stage, bound)] = count
+                counters["index_%s_ms_le_inf" % stage] = histogram[-1]
+        return counters
@@ -0,0 +1,211 @@
+import hashlib
+import logging
+import os
+import threading
+
+
+class IndexMembership(object):
+    """Membership of indexsvc nodes, registered in ZooKeeper.
+
+    Each node registers an ephemeral sequential node under path, and
+    watches the registered nodes, which are the members. Index jobs are
+    owned by a single member, chosen by rendezvous hashing of the job's
+    ownership token: jobs on entire indexes are owned by index name, and
+    keyed jobs by index name and key hash. When a member joins or leaves,
+    only the jobs owned by that member change owners.
+
+    Nodes which are not registered, i.e. while ZooKeeper is unavailable,
+    own all jobs. Jobs which remain unclaimed for grace_seconds after
+    they became ready may be claimed by any node, so jobs of a failed or
+    overloaded member are not held up until the member leaves.
+    """
+    def __init__(self, zookeeper_client, path, data=None, grace_seconds=30,
+                 refresh_seconds=30, on_change=None):
+        """Constructor.
+
+        Args:
+            zookeeper_client: ZookeeperClient object
+            path: ZooKeeper path of the member nodes
+            data: optional data of this node's member node,
+                i.e. its address.
+            grace_seconds: number of seconds after which ready jobs
+                may be claimed by any node.
+            refresh_seconds: maximum number of seconds between checks
+                of the registration and members.
+            on_change: optional callable invoked when the members change
+        """
+        self.log = logging.getLogger(__name__)
+        self.zookeeper_client = zookeeper_client
+        self.path = path.rstrip("/")
+        self.data = data
+        self.grace_seconds = grace_seconds
+        self.refresh_seconds = refresh_seconds
+        self.on_change = on_change
+        self.lock = threading.Lock()
+        self.node = None
+        self.members = []
+        self.refresh_event = threading.Event()
+        self.thread = None
+        self.running = False
+
+    def start(self):
+        """Start registering and watching members."""
+        if not self.running:
+            self.running = True
+            self.thread = threading.Thread(target=self.run)
+            self.thread.daemon = True
+            self.thread.start()
+
+    def run(self):
+        """Membership thread run method."""
+        while self.running:
+            self.refresh_event.clear()
+            try:
+                self._refresh()
+            except Exception as error:
+                self.log.exception(error)
+                # Own all jobs until the members are known again
+                self._set_members(self.node, [])
+            self.refresh_event.wait(self.refresh_seconds)
+
+    def _refresh(self):
+        """Register this node if needed, and read the members."""
+        node = self.node
+        if node is None or not self.zookeeper_client.exists("%s/%s" % (self.path, node)):
+            # Ephemeral nodes are removed when the session expires
+            self._create_path(self.path)
+            created = self.zookeeper_client.create(
+                    "%s/member-" % self.path, self.data or "",
+                    sequence=True, ephemeral=True)
+            node = os.path.basename(created)
+            self.log.info("Registered indexsvc member '%s/%s'" % (self.path, node))
+
+        members = self.zookeeper_client.get_children(self.path, self._watch)
+        self._set_members(node, members)
+
+    def _create_path(self, path):
+        """Create the persistent nodes of a path which do not exist."""
+        current = ""
+        for part in path.strip("/").split("/"):
+            current = "%s/%s" % (current, part)
+            if not self.zookeeper_client.exists(current):
+                try:
+                    self.zookeeper_client.create(current, "")
+                except Exception:
+                    # Created concurrently by another node
+                    if not self.zookeeper_client.exists(current):
+                        raise
+
+    def _set_members(self, node, members):
+        members = sorted(members)
+        with self.lock:
+            changed = members != self.members
+            self.node = node
+            self.members = members
+        if changed:
+            self.log.info("indexsvc members changed to %s" % members)
+            if self.on_change is not None:
+                self.on_change()
+
+    def _watch(self, *args):
+        """Members watch callback."""
+        self.refresh_event.set()
+
+    def token(self, indexop):
+        """Return the ownership token of an index operation.
+
+        Args:
+            indexop: IndexOp object
+        Returns:
+            ownership token string
+        """
+        if indexop.data.keys:
+            return "%s/%s" % (indexop.data.name, indexop.data.keys[0])
+        return indexop.data.name
+
+    def owns(self, token):
+        """Check if this node owns a job.
+
+        Args:
+            token: ownership token of the job's IndexOp
+        Returns:
+            True if this node owns the job, or is not a member.
+        """
+        with self.lock:
+            node = self.node
+            members = self.members
+        if node is None or node not in members:
+            return True
+        return self._owner(token, members) == node
+
+    def _owner(self, token, members):
+        return max(members, key=lambda member: (self._hash(member, token), member))
+
+    def _hash(self, member, token):
+        # Computed identically by clause(), with the Postgres md5()
+        return hashlib.md5((u"%s:%s" % (member, token)).encode("utf-8")).hexdigest()
+
+    def clause(self, data):
+        """Return a SQL predicate selecting the jobs owned by this node.
+
+        The predicate matches the jobs for which owns() is True, by
+        comparing the hash of this node and each other member in SQL.
+
+        Args:
+            data: IndexOpSQL object of the IndexJob data column
+        Returns:
+            (SQL text fragment, dict of bind params) tuple. The
+            fragment is None if this node owns all jobs.
+        """
+        with self.lock:
+            node = self.node
+            members = self.members
+        if node is None or node not in members:
+            return None, {}
+
+        def md5(param):
+            return "md5(:%s || ':' || %s) COLLATE \"C\"" % (param, data.token)
+
+        params = {"membership_node": node}
+        clauses = []
+        for index, member in enumerate([m for m in members if m != node]):
+            params["membership_member_%d" % index] = member
+            # Hash ties are won by the greater member name
+            clauses.append("%s %s %s" % (md5("membership_node"),
+                    ">=" if node > member else ">", md5("membership_member_%d" % index)))
+        if not clauses:
+            return "TRUE", {}
+        return "(%s)" % " AND ".join(clauses), params
+
+    def counters(self):
+        """Return membership service counters.
+
+        Returns:
+            dict of {counter name: integer value}. The slot of
+            this node is -1 if it is not a member.
+        """
+        with self.lock:
+            members = self.members
+            slot = members.index(self.node) if self.node in members else -1
+        return {
+            "index_members": len(members),
+            "index_member_slot": slot
+        }
+
+    def stop(self):
+        """Stop membership and deregister this node."""
+        if self.running:
+            self.running = False
+            self.refresh_event.set()
+            node = self.node
+            self._set_members(None, [])
+            if node is not None:
+                try:
+                    self.zookeeper_client.delete("%s/%s" % (self.path, node))
+                except Exception as error:
+                    self.log.exception(error)
+
+    def join(self, timeout=None):
+        """Join membership thread."""
+        if self.thread is not None:
+            self.thread.join(timeout)
@@ -0,0 +1,103 @@
+import logging
+import select
+import threading
+
+from sqlalchemy import create_engine
+from sqlalchemy.pool import NullPool
+
+from trpycore.thread.util import join
+
+
+def notify_index_job(db_session, channel):
+    """Signal listeners that a new IndexJob has been created.
+
+    Postgres delivers the notification when the session's transaction
+    commits, so this should be invoked before committing the new job.
+
+    Args:
+        db_session: sqlalchemy db session
+        channel: notification channel name
+    """
+    db_session.execute('NOTIFY "%s"' % channel)
+
+
+class IndexJobListener(object):
+    """Listens for IndexJob notifications using Postgres LISTEN/NOTIFY.
+
+    A dedicated db connection listens on the notification channel,
+    and the specified callback is invoked whenever notifications arrive.
+    If the connection is lost, it is reestablished after reconnect_seconds.
+    """
+    def __init__(self, database_connection, channel, callback, reconnect_seconds=10):
+        """Constructor.
+
+        Args:
+            database_connection: sqlalchemy database connection url
+            channel: notification channel name
+            callback: callable invoked, with no arguments, when
+                notifications are received.
+            reconnect_seconds: number of seconds to wait before
+                reconnecting after a connection failure.
+        """
+        self.log = logging.getLogger(__name__)
+        self.engine = create_engine(database_connection, poolclass=NullPool)
+        self.channel = channel
+        self.callback = callback
+        self.reconnect_seconds = reconnect_seconds
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.running = False
+
+    def start(self):
+        """Start listener thread."""
+        if not self.running:
+            self.running = True
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self.run)
+            self.thread.start()
+
+    def run(self):
+        """Listener thread run method."""
+        while self.running:
+            try:
+                self._listen()
+            except Exception as error:
+                self.log.exception(error)
+                self.stop_event.wait(self.reconnect_seconds)
+
+    def _listen(self):
+        """Listen for notifications until stopped or the connection fails."""
+        connection = self.engine.raw_connection()
+        try:
+            # Use the underlying psycopg2 connection in autocommit mode
+            # so notifications are delivered as they arrive.
+            pg_connection = connection.connection
+            pg_connection.set_isolation_level(0)
+            cursor = pg_connection.cursor()
+            cursor.execute('LISTEN "%s"' % self.channel)
+            self.log.info("IndexJobListener listening on channel '%s'" % self.channel)
+
+            # A notification may have been missed while not listening
+            self.callback()
+
+            while self.running:
+                readable, writable, errors = select.select([pg_connection], [], [], 1.0)
+                if not readable:
+                    continue
+                pg_connection.poll()
+                if pg_connection.notifies:
+                    del pg_connection.notifies[:]
+                    self.callback()
+        finally:
+            connection.close()
+
+    def stop(self):
+        """Stop listener."""
+        if self.running:
+            self.running = False
+            self.stop_event.set()
+
+    def join(self, timeout=None):
+        """Join listener thread."""
+        if self.thread is not None:
+            join([self.thread], timeout)
@@ -0,0 +1,83 @@
+import logging
+import threading
+
+import jobstats
+from indexers.indexer import IndexResult
+
+
+class IndexPartitionSet(object):
+    """Set of key range partitions of a single index operation.
+
+    Partitions are indexed by any thread which invokes process().
+    This allows idle IndexThreadPool workers to help with a job while
+    the thread which owns the job processes partitions as well, so the
+    job always completes, even if no other workers are available.
+
+    The partitions succeed or fail as a unit. wait() blocks until
+    all partitions have been processed and raises an exception if
+    any of them failed. Documents which failed within a partition
+    are combined into a single IndexResult.
+
+    The job stats active on the thread creating the set are also
+    active while any thread processes its partitions.
+    """
+    def __init__(self, indexops, indexer_factory):
+        """Constructor.
+
+        Args:
+            indexops: list of IndexOp partitions
+            indexer_factory: callable taking an IndexOp and returning
+                a new Indexer to process it.
+        """
+        self.log = logging.getLogger(__name__)
+        self.indexer_factory = indexer_factory
+        self.pending = list(indexops)
+        self.count = len(indexops)
+        self.remaining = len(indexops)
+        self.errors = []
+        self.result = IndexResult()
+        self.stats = jobstats.current()
+        self.condition = threading.Condition()
+
+    def process(self):
+        """Index pending partitions until none remain."""
+        while True:
+            with self.condition:
+                if not self.pending or self.errors:
+                    return
+                indexop = self.pending.pop(0)
+
+            try:
+                with jobstats.activate(self.stats):
+                    indexer = self.indexer_factory(indexop)
+                    result = indexer.index(indexop)
+                if result is not None:
+                    with self.condition:
+                        self.result.merge(result)
+            except Exception as error:
+                self.log.exception(error)
+                with self.condition:
+                    self.errors.append(error)
+            finally:
+                with self.condition:
+                    self.remaining -= 1
+                    self.condition.notify_all()
+
+    def wait(self):
+        """Wait for all partitions to be processed.
+
+        Returns:
+            IndexResult object combining the partition results
+        Raises:
+            Exception if any partition failed.
+        """
+        with self.condition:
+            # Partitions which were never started due to a failure
+            # will not be processed.
+            while self.remaining > len(self.pending):
+                self.condition.wait()
+
+            if self.errors:
+                raise Exception("%d of %d index partitions failed: %s" %\
+                        (len(self.errors), self.count, self.errors[0]))
+            return self.result
@@ -0,0 +1,92 @@
+import logging
+
+from trindexsvc.gen.ttypes import IndexPriority
+
+from indexop import IndexAction
+
+
+class PriorityPolicy(object):
+    """Policy assigning index jobs to priority lanes.
+
+    Jobs with an explicit IndexData priority are assigned to its lane.
+    Other jobs are assigned to the interactive lane if they index a
+    limited number of keys and were not created by a bulk context,
+    i.e. the index job scheduler. Jobs on entire indexes, rebuilds and
+    incremental updates are assigned to the bulk lane.
+    """
+
+    # Actions whose jobs are assigned to the bulk lane
+    BULK_ACTIONS = (IndexAction.Rebuild, IndexAction.Incremental)
+
+    def __init__(self, interactive_max_keys=100, bulk_contexts=None):
+        """Constructor.
+
+        Args:
+            interactive_max_keys: maximum number of keys of
+                interactive jobs.
+            bulk_contexts: optional list of IndexJob contexts
+                whose jobs are always assigned to the bulk lane,
+                unless they have an explicit priority.
+        """
+        self.log = logging.getLogger(__name__)
+        self.interactive_max_keys = interactive_max_keys
+        self.bulk_contexts = set(bulk_contexts or [])
+
+    def priority(self, indexop, context=None):
+        """Return the priority lane of an index operation.
+
+        Args:
+            indexop: IndexOp object
+            context: optional context of the operation's IndexJob
+        Returns:
+            IndexPriority value
+        """
+        if indexop.data.priority in IndexPriority._VALUES_TO_NAMES:
+            return indexop.data.priority
+
+        keys = indexop.data.keys or []
+        if indexop.action in self.BULK_ACTIONS or\
+           not keys or\
+           len(keys) > self.interactive_max_keys or\
+           context in self.bulk_contexts:
+            return IndexPriority.BULK
+        return IndexPriority.INTERACTIVE
+
+    def clause(self, data, context, priority):
+        """Return a SQL predicate selecting the jobs of a priority lane.
+
+        The predicate matches the jobs whose IndexOps are assigned to
+        the lane by priority(), so that jobs can be claimed by lane.
+
+        Args:
+            data: IndexOpSQL object of the IndexJob data column
+            context: name of the IndexJob context column
+            priority: IndexPriority value
+        Returns:
+            (SQL text fragment, dict of bind params) tuple
+        """
+        params = {"priority_max_keys": self.interactive_max_keys}
+        interactive = ["%s NOT IN (%s)" % (data.action, self._values(self.BULK_ACTIONS)),
+                       "%s BETWEEN 1 AND :priority_max_keys" % data.num_keys]
+        if self.bulk_contexts:
+            names = []
+            for index, bulk_context in enumerate(sorted(self.bulk_contexts)):
+                names.append(":priority_context_%d" % index)
+                params["priority_context_%d" % index] = bulk_context
+            interactive.append("coalesce(%s, '') NOT IN (%s)" % (context, ", ".join(names)))
+
+        derived = " AND ".join(interactive)
+        if priority == IndexPriority.BULK:
+            derived = "NOT (%s)" % derived
+        elif priority != IndexPriority.INTERACTIVE:
+            derived = "FALSE"
+        statement = "(%(priority)s = %(lane)d OR (%(priority)s NOT IN (%(lanes)s) AND %(derived)s))" % {
+            "priority": data.priority,
+            "lane": priority,
+            "lanes": self._values(IndexPriority._VALUES_TO_NAMES),
+            "derived": derived
+        }
+        return statement, params
+
+    def _values(self, values):
+        return ", ".join([str(value) for value in sorted(values)])
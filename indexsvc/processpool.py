@@ -0,0 +1,160 @@
+import logging
+import multiprocessing
+import signal
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from tres.client import ESClient
+from tres.pool import ESClientPool
+from trpycore.factory.base import Factory
+
+import jobstats
+import serialization
+from documents.refcache import ReferenceCache
+from indexers.factory import IndexerFactory
+from indexers.indexer import IndexResult
+from indexop import IndexOp
+
+# Worker process state, created by _init_worker()
+_db_session_factory = None
+_es_client_pool = None
+
+
+def _init_worker(database_connection, es_endpoint, es_pool_size):
+    """Worker process initializer.
+
+    Each worker process owns a db engine and ES clients. Connections
+    inherited from the parent process are not used.
+    """
+    global _db_session_factory, _es_client_pool
+
+    # Shutdown is managed by the parent process
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    engine = create_engine(database_connection)
+    _db_session_factory = sessionmaker(bind=engine)
+
+    def es_client_factory():
+        return ESClient(es_endpoint)
+    _es_client_pool = ESClientPool(
+        es_client_factory=Factory(es_client_factory),
+        size=es_pool_size
+    )
+    jobstats.listen_queries()
+
+def _index(data):
+    """Worker process task indexing a single index operation.
+
+    Args:
+        data: JSON formatted IndexOp
+    Returns:
+        (count, failed keys, errors, skipped, stage seconds, counters) tuple
+    Raises:
+        Exception describing the failure. Exceptions are converted,
+        since not all exceptions can be returned to the parent process.
+    """
+    log = logging.getLogger(__name__)
+    try:
+        indexop = IndexOp.from_json(data)
+        stats = jobstats.JobStats()
+        with jobstats.activate(stats):
+            # Reference rows are cached for the duration of the task only,
+            # since invalidations in the parent process are not seen here.
+            indexer = IndexerFactory(
+                _db_session_factory,
+                _es_client_pool,
+                indexop.data.name,
+                indexop.data.type,
+                reference_cache=ReferenceCache()
+            ).create()
+            result = indexer.index(indexop)
+
+        errors = [error if isinstance(error, dict) else str(error)
+                  for error in result.errors]
+        return (result.count, result.failed_keys, errors, result.skipped,
+                dict(stats.seconds), dict(stats.counts))
+    except Exception as error:
+        log.exception(error)
+        raise Exception("%s: %s" % (error.__class__.__name__, str(error)))
+
+
+class IndexProcessPool(object):
+    """Pool of worker processes used to index key range partitions.
+
+    Document generation and serialization are CPU bound, and threads
+    of a single process share one core. Partitions of operations on an
+    entire index are therefore indexed by worker processes, each with
+    its own db engine and ES clients. Partitions are sent to workers as
+    JSON formatted IndexOps. Documents are not fingerprinted by workers.
+    """
+    def __init__(self, processes, database_connection, es_endpoint, es_pool_size=1):
+        """Constructor.
+
+        Args:
+            processes: number of worker processes
+            database_connection: db connection string
+            es_endpoint: ElasticSearch endpoint
+            es_pool_size: number of ES clients per worker process
+        """
+        self.log = logging.getLogger(__name__)
+        self.processes = processes
+        self.database_connection = database_connection
+        self.es_endpoint = es_endpoint
+        self.es_pool_size = es_pool_size
+        self.pool = None
+
+    def start(self):
+        """Start worker processes.
+
+        Worker processes are forked, so this should be invoked
+        before the other threads of the service are started.
+        """
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(
+                processes=self.processes,
+                initializer=_init_worker,
+                initargs=(self.database_connection, self.es_endpoint, self.es_pool_size))
+
+    def stop(self):
+        """Stop worker processes. Partitions in progress are abandoned."""
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+    def index(self, indexops):
+        """Index partitions on the worker processes.
+
+        The stats of the partitions are merged into the
+        current thread's job stats.
+
+        Args:
+            indexops: list of IndexOp partitions
+        Returns:
+            IndexResult object combining the partition results
+        Raises:
+            Exception if any partition failed.
+        """
+        async_results = [
+            self.pool.apply_async(_index, (serialization.dumps(indexop.to_json()),))
+            for indexop in indexops]
+
+        result = IndexResult()
+        stats = jobstats.current()
+        failures = []
+        for async_result in async_results:
+            try:
+                count, failed_keys, errors, skipped, seconds, counts = async_result.get()
+            except Exception as error:
+                failures.append(error)
+                continue
+            result.merge(IndexResult(count, failed_keys, errors, skipped))
+            if stats is not None:
+                stats.merge(seconds, counts)
+
+        if failures:
+            raise Exception("%d of %d index partitions failed: %s" %\
+                    (len(failures), len(indexops), failures[0]))
+        return result
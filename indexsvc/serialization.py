@@ -0,0 +1,224 @@
+import datetime
+import decimal
+import json
+import logging
+
+
+def _default(obj):
+    """Encode objects which are not JSON types.
+
+    Dates and times are encoded in ISO 8601 format, i.e.
+    "2013-01-02T03:04:05". Other objects, i.e. Decimals, are
+    encoded as strings.
+    """
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    return str(obj)
+
+
+class JSONBackend(object):
+    """Standard library json backend.
+
+    This backend defines the serialized form: compact separators,
+    ASCII only, with dates and times encoded by _default(). Other
+    backends are only used if they produce identical output.
+    """
+    name = "json"
+
+    def __init__(self):
+        self.encoder = json.JSONEncoder(separators=(",", ":"), default=_default)
+        self.sorted_encoder = json.JSONEncoder(separators=(",", ":"),
+                sort_keys=True, default=_default)
+        self.decoder = json.JSONDecoder()
+
+    def dumps(self, obj, sort_keys=False):
+        if sort_keys:
+            return self.sorted_encoder.encode(obj)
+        return self.encoder.encode(obj)
+
+    def loads(self, data):
+        return self.decoder.decode(data)
+
+
+class SimpleJSONBackend(JSONBackend):
+    """simplejson backend.
+
+    Not used by default: the C speedups of the Python 2.7 standard
+    library json module encode faster, and decode as fast.
+
+    Raises:
+        ImportError if simplejson is not installed.
+    """
+    name = "simplejson"
+
+    def __init__(self):
+        import simplejson
+        options = {
+            "separators": (",", ":"),
+            "default": _default,
+            "use_decimal": False,
+            "namedtuple_as_object": False,
+            "tuple_as_array": True
+        }
+        self.encoder = simplejson.JSONEncoder(**options)
+        self.sorted_encoder = simplejson.JSONEncoder(sort_keys=True, **options)
+        self.decoder = simplejson.JSONDecoder()
+
+
+class UJSONBackend(object):
+    """ujson backend.
+
+    Versions of ujson which do not support default() encode
+    dates as timestamps, and fail the probe of Serializer.
+
+    Raises:
+        ImportError if ujson is not installed.
+    """
+    name = "ujson"
+
+    def __init__(self):
+        import ujson
+        self.ujson = ujson
+        self.options = {
+            "ensure_ascii": True,
+            "escape_forward_slashes": False,
+            "double_precision": 15
+        }
+        try:
+            ujson.dumps({}, default=_default, **self.options)
+            self.options["default"] = _default
+        except TypeError:
+            pass
+
+    def dumps(self, obj, sort_keys=False):
+        return self.ujson.dumps(obj, sort_keys=sort_keys, **self.options)
+
+    def loads(self, data):
+        return self.ujson.loads(data, precise_float=True)
+
+
+# Backends in order of preference
+BACKENDS = [UJSONBackend, JSONBackend]
+
+# Documents encoded and decoded by backends to verify that their
+# output is identical to the standard library json backend.
+PROBES = [
+    {
+        "id": 1,
+        "joined": datetime.datetime(2013, 1, 2, 3, 4, 5, 6),
+        "date": datetime.date(2013, 1, 2),
+        "location": u"Montr\xe9al, QC / Canada",
+        "quote": "\"quoted\"\t\\ \n\x01",
+        "emoji": u"\U0001f600",
+        "actively_seeking": True,
+        "demo": False,
+        "yrs_experience": None,
+        "score": 4.5,
+        "floats": [0.1, 1.0 / 3, 1e20, 1e-7, -2.5, 123456789.125],
+        "salary": decimal.Decimal("50000.00"),
+        "big": 2 ** 53 + 1,
+        "skills": [{"id": 1, "name": "C++", "yrs_experience": 5}],
+        "tuple": (1, 2),
+        "empty": [{}, [], ""]
+    },
+    [1, u"two", 3.0, [None]],
+    u"string"
+]
+
+
+class Serializer(object):
+    """JSON serializer selecting the fastest exact backend available.
+
+    The encoding and decoding backends are selected separately, as the
+    first backend, in order of preference, whose output for the probe
+    documents is identical to that of the standard library json
+    backend. Serialized documents are thus the same, byte for byte,
+    whichever backends are installed. Values a selected backend fails
+    to handle are serialized by the standard library backend.
+    """
+    def __init__(self, backends=None):
+        """Constructor.
+
+        Args:
+            backends: optional list of backend classes in order of
+                preference. Defaults to BACKENDS.
+        """
+        self.log = logging.getLogger(__name__)
+        self.reference = JSONBackend()
+        self.encoder = self.reference
+        self.decoder = self.reference
+
+        candidates = []
+        for backend_class in backends or BACKENDS:
+            try:
+                candidates.append(backend_class())
+            except ImportError:
+                continue
+
+        for backend in candidates:
+            if self._encodes_exactly(backend):
+                self.encoder = backend
+                break
+        for backend in candidates:
+            if self._decodes_exactly(backend):
+                self.decoder = backend
+                break
+
+    def _encodes_exactly(self, backend):
+        try:
+            return all([backend.dumps(probe, sort_keys) == self.reference.dumps(probe, sort_keys)
+                        for probe in PROBES for sort_keys in (False, True)])
+        except Exception:
+            return False
+
+    def _decodes_exactly(self, backend):
+        try:
+            for probe in PROBES:
+                data = self.reference.dumps(probe)
+                if backend.loads(data) != self.reference.loads(data):
+                    return False
+            return True
+        except Exception:
+            return False
+
+    def dumps(self, obj, sort_keys=False):
+        """Serialize an object to a JSON formatted string.
+
+        Args:
+            obj: JSON object, which may contain dates and times
+            sort_keys: if True, object keys are sorted
+        Returns:
+            JSON formatted string
+        """
+        try:
+            return self.encoder.dumps(obj, sort_keys)
+        except (TypeError, ValueError, OverflowError):
+            if self.encoder is self.reference:
+                raise
+            return self.reference.dumps(obj, sort_keys)
+
+    def loads(self, data):
+        """Deserialize a JSON formatted string.
+
+        Args:
+            data: JSON formatted string
+        Returns:
+            JSON object
+        """
+        try:
+            return self.decoder.loads(data)
+        except (ValueError, OverflowError):
+            if self.decoder is self.reference:
+                raise
+            return self.reference.loads(data)
+
+
+serializer = Serializer()
+
+def dumps(obj, sort_keys=False):
+    """Serialize an object using the default Serializer."""
+    return serializer.dumps(obj, sort_keys)
+
+def loads(data):
+    """Deserialize a JSON formatted string using the default Serializer."""
+    return serializer.loads(data)
@@ -12,6 +12,7 @@ SERVICE_JOIN_TIMEOUT = 1
 THRIFT_SERVER_ADDRESS = socket.gethostname()
 THRIFT_SERVER_INTERFACE = "0.0.0.0"
 THRIFT_SERVER_PORT = 9096
+THRIFT_SERVER_THREADS = 1
 
 #Database settings
 DATABASE_HOST = "localdev"
@@ -19,6 +20,9 @@ DATABASE_NAME = "localdev_techresidents"
 DATABASE_USERNAME = "techresidents"
 DATABASE_PASSWORD = "techresidents"
 DATABASE_CONNECTION = "postgresql+psycopg2://%s:%s@/%s?host=%s" % (DATABASE_USERNAME, DATABASE_PASSWORD, DATABASE_NAME, DATABASE_HOST)
+#Postgres statement_timeout, in seconds, of the inserts of new IndexJobs.
+#Bounds db statements only, not requests as a whole. None disables it.
+DATABASE_INSERT_STATEMENT_TIMEOUT = 10
 
 #Zookeeper settings
 ZOOKEEPER_HOSTS = ["localdev:2181"]
@@ -29,6 +33,96 @@ INDEXER_POOL_SIZE = 1
 INDEXER_POLL_SECONDS = 60
 INDEXER_JOB_RETRY_SECONDS = 300
 INDEXER_JOB_MAX_RETRY_ATTEMPTS = 3
+INDEXER_CHUNK_SIZE = 500
+INDEXER_JOB_PARTITIONS = 1
+INDEXER_COALESCE_JOBS = True
+INDEXER_COALESCE_MAX_JOBS = 1000
+INDEXER_DEPENDENCY_FANOUT = True
+INDEXER_DEPENDENCY_JOB_KEYS = 1000
+#Postgres LISTEN/NOTIFY channel used to signal new jobs, i.e. "index_job".
+#None relies on polling alone.
+INDEXER_NOTIFY_CHANNEL = None
+#Write-behind buffering of new jobs. When enabled, index requests
+#return before their jobs are committed to the db. Requests write
+#synchronously once MAX_BUFFERED_JOBS are buffered.
+INDEXER_WRITE_BUFFER = False
+INDEXER_WRITE_BUFFER_FLUSH_SECONDS = 0.01
+INDEXER_WRITE_BUFFER_MAX_JOBS = 500
+INDEXER_WRITE_BUFFER_MAX_BUFFERED_JOBS = 10000
+INDEXER_WRITE_BUFFER_MAX_RETRY_SECONDS = 10
+#Directory of the local store of indexed document fingerprints.
+#Updates skip documents whose content is unchanged. The store is
+#local to the process, so only enable it when a single indexsvc
+#instance writes to the index. Set to None to disable.
+INDEXER_FINGERPRINT_DIRECTORY = None
+#Cache of reference rows (technologies, locations, types) embedded
+#in documents. Rows of an index are invalidated when a job for the
+#index is processed, but only in the processing process, so only
+#enable it when a single indexsvc process (INDEXER_PROCESSES = 0,
+#no INDEXER_MEMBERSHIP_PATH) indexes all jobs.
+INDEXER_REFERENCE_CACHE = False
+INDEXER_REFERENCE_CACHE_TTL_SECONDS = 300
+INDEXER_REFERENCE_CACHE_MAX_SIZE = 10000
+#Index rebuild settings. Rebuilt indexes are created from the
+#<index name>.json file in INDEXER_MAPPINGS_DIRECTORY. Rebuilt indexes
+#may be warmed, before they're made live, by running the queries in the
+#files listed per index name in INDEXER_REBUILD_WARM_QUERIES.
+INDEXER_MAPPINGS_DIRECTORY = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../mappings"))
+INDEXER_REBUILD_WARM_QUERIES = {}
+#Incremental index settings. Incremental jobs look back this many
+#seconds before the start of the previous successful incremental job,
+#and update the entire index if more than INDEXER_INCREMENTAL_MAX_KEYS
+#documents changed.
+INDEXER_INCREMENTAL_OVERLAP_SECONDS = 60
+INDEXER_INCREMENTAL_MAX_KEYS = 10000
+#Per-job stage timings (queue wait, db, hydrate, build, serialize, bulk)
+#and counts, exported as service counters and logged for each job.
+#Histogram bucket upper bounds of per-job stage times, in milliseconds.
+INDEXER_JOB_STATS = True
+INDEXER_JOB_STATS_BUCKETS_MS = [10, 100, 1000, 10000, 60000, 600000]
+#Pipelined indexing. Documents are generated while this many threads
+#send bulk requests, with up to INDEXER_PIPELINE_QUEUE_SIZE documents
+#generated ahead of the senders. 0 generates and sends on the same
+#thread. Each sender beyond the first uses an additional ES client,
+#so ES_POOL_SIZE should be at least INDEXER_THREADS * INDEXER_PIPELINE_SENDERS.
+INDEXER_PIPELINE_SENDERS = 0
+INDEXER_PIPELINE_QUEUE_SIZE = 1000
+#Worker processes indexing key range partitions of full reindexes.
+#0 indexes partitions on worker threads (INDEXER_JOB_PARTITIONS).
+INDEXER_PROCESSES = 0
+#Priority lanes. Threads reserved for interactive jobs (see PriorityPolicy).
+#0 processes all jobs in a single lane.
+INDEXER_INTERACTIVE_THREADS = 0
+INDEXER_INTERACTIVE_MAX_KEYS = 100
+INDEXER_BULK_CONTEXTS = ["index_job_scheduler"]
+#Cluster membership. ZooKeeper path of the nodes sharing jobs by owner,
+#i.e. "/indexsvc/members" (see IndexMembership). None lets every node claim any job.
+INDEXER_MEMBERSHIP_PATH = None
+INDEXER_MEMBERSHIP_GRACE_SECONDS = 30
+INDEXER_MEMBERSHIP_REFRESH_SECONDS = 30
+
+#Bulk request settings. INDEXER_BULK_POLICY applies to all indexes
+#and may be overridden per index name in INDEXER_BULK_POLICIES.
+#See indexers.bulk.BulkPolicy for the available options.
+INDEXER_BULK_POLICY = {
+    "max_docs": 500,
+    "max_bytes": 5 * 1024 * 1024,
+    "max_seconds": 5,
+    "adaptive": False
+}
+INDEXER_BULK_POLICIES = {
+    "users": {
+        "max_docs": 200,
+        "adaptive": True,
+        "max_adaptive_docs": 1000
+    },
+    "technologies": {
+        "max_docs": 5000
+    },
+    "locations": {
+        "max_docs": 5000
+    }
+}
 
 #ElasticSearch settings
 ES_ENDPOINT = "http://localdev:9200"
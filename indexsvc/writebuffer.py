@@ -0,0 +1,185 @@
+import logging
+import threading
+import time
+
+from trpycore.thread.util import join
+
+
+class WriteBufferStopped(Exception):
+    """IndexJobWriteBuffer is not accepting jobs."""
+    pass
+
+
+class IndexJobWriteBuffer(object):
+    """Write-behind buffer for new IndexJobs.
+
+    Jobs put on the buffer are written by a background flusher thread
+    using the specified writer callable. A flush happens every
+    flush_seconds, or sooner if max_jobs jobs are buffered.
+
+    If a batch fails to be written, its jobs are written one at a time,
+    so that a job which can not be written does not hold up the others.
+    Jobs which fail are kept and retried, with the delay between flushes
+    doubling up to max_retry_seconds, and are discarded after failing
+    max_attempts times while other jobs were written. If no job can be
+    written, the db is assumed to be unavailable and attempts are not
+    counted.
+
+    The buffer holds at most max_buffered jobs. Beyond that, put()
+    writes jobs synchronously, on the calling thread. Stopping the
+    buffer writes any remaining jobs, after which put() raises
+    WriteBufferStopped.
+    """
+    def __init__(self, writer, flush_seconds=0.01, max_jobs=500,
+                 max_buffered=10000, max_retry_seconds=10, max_attempts=3):
+        """Constructor.
+
+        Args:
+            writer: callable taking a list of IndexJob column value dicts
+                and writing them to the db in a single transaction.
+            flush_seconds: maximum number of seconds a job is buffered
+            max_jobs: number of buffered jobs which triggers a flush
+            max_buffered: maximum number of buffered jobs
+            max_retry_seconds: maximum number of seconds between
+                flushes while writes fail.
+            max_attempts: number of failed writes after which
+                a job is discarded.
+        """
+        self.log = logging.getLogger(__name__)
+        self.writer = writer
+        self.flush_seconds = flush_seconds
+        self.max_jobs = max_jobs
+        self.max_buffered = max_buffered
+        self.max_retry_seconds = max_retry_seconds
+        self.max_attempts = max_attempts
+        self.jobs = []
+        self.failures = 0
+        self.delay = flush_seconds
+        self.condition = threading.Condition()
+        self.thread = None
+        self.running = False
+
+    def start(self):
+        """Start flusher thread."""
+        if not self.running:
+            self.running = True
+            self.thread = threading.Thread(target=self.run)
+            self.thread.start()
+
+    def put(self, jobs):
+        """Buffer jobs to be written.
+
+        Args:
+            jobs: list of IndexJob column value dicts
+        Raises:
+            WriteBufferStopped if the buffer is not running.
+            Exception raised by the writer if the buffer is full
+            and the jobs fail to be written synchronously.
+        """
+        with self.condition:
+            if not self.running:
+                raise WriteBufferStopped("IndexJob write buffer is not running")
+            if len(self.jobs) + len(jobs) <= self.max_buffered:
+                # Jobs are buffered with the number of failed attempts
+                self.jobs.extend([(0, job) for job in jobs])
+                if len(self.jobs) >= self.max_jobs and not self.failures:
+                    self.condition.notify()
+                return
+
+        self.log.warning("IndexJob write buffer full, writing %d IndexJobs synchronously" % len(jobs))
+        self.writer(jobs)
+
+    def run(self):
+        """Flusher thread run method."""
+        while self.running:
+            with self.condition:
+                if self.running and (self.failures or len(self.jobs) < self.max_jobs):
+                    self.condition.wait(self.delay)
+            self.flush()
+
+        # Drain the buffer on stop
+        for attempt in range(self.max_attempts):
+            if self.flush():
+                break
+            time.sleep(self.delay)
+
+        with self.condition:
+            entries = self.jobs
+            self.jobs = []
+        if entries:
+            self.log.error("Discarding %d buffered IndexJobs not written on stop: %s" %\
+                           (len(entries), [job for attempts, job in entries]))
+
+    def flush(self):
+        """Write all buffered jobs.
+
+        Returns:
+            True if all jobs were written, False otherwise.
+        """
+        with self.condition:
+            entries = self.jobs
+            self.jobs = []
+
+        if not entries:
+            return True
+
+        try:
+            start = time.time()
+            self.writer([job for attempts, job in entries])
+            self.log.debug("Wrote %d buffered IndexJobs in %.3fs" % (len(entries), time.time() - start))
+            failed = []
+        except Exception as error:
+            self.log.warning("Failed to write %d buffered IndexJobs: %s" % (len(entries), error))
+            failed = self._write_each(entries)
+
+        with self.condition:
+            self.jobs = failed + self.jobs
+            if failed:
+                self.failures += 1
+                self.delay = min(self.max_retry_seconds,
+                                 self.flush_seconds * 2 ** self.failures)
+            else:
+                self.failures = 0
+                self.delay = self.flush_seconds
+        return not failed
+
+    def _write_each(self, entries):
+        """Write jobs one at a time, after their batch failed.
+
+        Args:
+            entries: list of (failed attempts, job) tuples
+        Returns:
+            list of (failed attempts, job) tuples to retry
+        """
+        written = 0
+        failed = []
+        for index, (attempts, job) in enumerate(entries):
+            try:
+                self.writer([job])
+                written += 1
+            except Exception as error:
+                if not written:
+                    # Nothing can be written, the db is likely unavailable.
+                    # The job is retried last, in case it's the cause.
+                    self.log.exception(error)
+                    return entries[index + 1:] + [(attempts, job)]
+
+                attempts += 1
+                if attempts >= self.max_attempts:
+                    self.log.error("Discarding IndexJob after %d failed writes: %s (%s)" %\
+                                   (attempts, job, error))
+                else:
+                    failed.append((attempts, job))
+        return failed
+
+    def stop(self):
+        """Stop buffer, writing remaining jobs."""
+        if self.running:
+            with self.condition:
+                self.running = False
+                self.condition.notify()
+
+    def join(self, timeout=None):
+        """Join flusher thread."""
+        if self.thread is not None:
+            join([self.thread], timeout)
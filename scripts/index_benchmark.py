@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+
+"""index_benchmark.py
+This script measures how index() throughput scales with the number of
+concurrent clients. For each client count, the specified number of
+client threads each make index() requests against the index service for
+the given duration. Jobs are scheduled a year out so that they aren't
+processed, and are tagged with the benchmark context.
+options:
+    -c --clients=CLIENTS  comma separated list of client counts (Optional. Defaults to 1,2,4,8,16)
+    -s --seconds=SECONDS  number of seconds to run each client count (Optional. Defaults to 10)
+    -i --index=INDEX      index name (Optional. Defaults to 'users')
+    -t --type=TYPE        document type (Optional. Defaults to 'user')
+    -x --context=CONTEXT  index job context (Optional. Defaults to 'index_benchmark')
+    -C --cleanup          Flag to delete the benchmark's IndexJobs when done (Optional. Defaults to False)
+"""
+import datetime
+import getopt
+import os
+import sys
+import threading
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from trindexsvc.gen import TIndexService
+from trindexsvc.gen.ttypes import IndexData
+from trpycore.timezone import tz
+from trpycore.zookeeper.client import ZookeeperClient
+from trsvcscore.db.models import IndexJob
+from trsvcscore.proxy.zoo import ZookeeperServiceProxy
+
+PROJECT_DIRECTORY = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SERVICE =  os.path.basename(PROJECT_DIRECTORY)
+SERVICE_DIRECTORY = os.path.join(PROJECT_DIRECTORY, SERVICE)
+sys.path.insert(0, SERVICE_DIRECTORY)
+
+import settings
+
+
+class Usage(Exception):
+    def __str__(self):
+        return __doc__
+
+class Config(object):
+
+    def __init__(self, argv):
+        self.clients = [1, 2, 4, 8, 16]
+        self.seconds = 10
+        self.index_name = "users"
+        self.doc_type = "user"
+        self.indexjob_context = "index_benchmark"
+        self.cleanup = False
+        try:
+            options, arguments = getopt.getopt(argv, "hCc:s:i:t:x:",["help", "cleanup", "clients=", "seconds=", "index=", "type=", "context="])
+
+            for option, argument in options:
+                if option in ("-h", "--help"):
+                    raise Usage()
+                elif option in ("-C", "--cleanup"):
+                    self.cleanup = True
+                elif option in ("-c", "--clients"):
+                    self.clients = [int(c) for c in argument.replace(" ", "").split(',')]
+                elif option in ("-s", "--seconds"):
+                    self.seconds = int(argument)
+                elif option in ("-i", "--index"):
+                    self.index_name = argument
+                elif option in ("-t", "--type"):
+                    self.doc_type = argument
+                elif option in ("-x", "--context"):
+                    self.indexjob_context = argument
+                else:
+                    raise Usage()
+
+        except Exception as e:
+            raise Usage()
+
+
+class BenchmarkClient(threading.Thread):
+    """Client thread making index() requests until the deadline."""
+
+    def __init__(self, zookeeper_client, config, deadline):
+        super(BenchmarkClient, self).__init__()
+        self.config = config
+        self.deadline = deadline
+        self.latencies = []
+        self.errors = 0
+        self.proxy = ZookeeperServiceProxy(
+            zookeeper_client,
+            service_name="indexsvc",
+            service_class=TIndexService,
+            keepalive=True
+        )
+
+    def run(self):
+        not_before = tz.utc_to_timestamp(tz.utcnow() + datetime.timedelta(days=365))
+        key = 0
+        while time.time() < self.deadline:
+            key += 1
+            index_data = IndexData(
+                notBefore=not_before,
+                name=self.config.index_name,
+                type=self.config.doc_type,
+                keys=[str(key)]
+            )
+            start = time.time()
+            try:
+                self.proxy.index(self.config.indexjob_context, index_data)
+                self.latencies.append(time.time() - start)
+            except Exception:
+                self.errors += 1
+
+
+def percentile(values, percent):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(len(values) * percent / 100.0))
+    return values[index]
+
+def cleanup(config):
+    engine = create_engine(settings.DATABASE_CONNECTION)
+    db_session = sessionmaker(bind=engine)()
+    try:
+        count = db_session.query(IndexJob)\
+                .filter(IndexJob.context == config.indexjob_context)\
+                .delete(synchronize_session=False)
+        db_session.commit()
+        print "Deleted %d benchmark IndexJobs" % count
+    finally:
+        db_session.close()
+
+def main(argv):
+
+    def get_zookeeper_client():
+        zookeeper_client = ZookeeperClient(settings.ZOOKEEPER_HOSTS)
+        zookeeper_client.start()
+        time.sleep(1)
+        return zookeeper_client
+
+    try:
+        zookeeper_client = None
+        config = Config(argv)
+        zookeeper_client = get_zookeeper_client()
+
+        print '################################################'
+        print "%8s %10s %10s %10s %10s %8s" % ("clients", "requests", "req/sec", "p50 (ms)", "p99 (ms)", "errors")
+        for clients in config.clients:
+            deadline = time.time() + config.seconds
+            threads = [BenchmarkClient(zookeeper_client, config, deadline) for i in range(clients)]
+            start = time.time()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.time() - start
+
+            latencies = []
+            errors = 0
+            for thread in threads:
+                latencies.extend(thread.latencies)
+                errors += thread.errors
+
+            print "%8d %10d %10.1f %10.1f %10.1f %8d" % (
+                clients,
+                len(latencies),
+                len(latencies) / elapsed,
+                percentile(latencies, 50) * 1000,
+                percentile(latencies, 99) * 1000,
+                errors)
+        print '################################################'
+
+        if config.cleanup:
+            cleanup(config)
+
+        return 0
+
+    except Usage, error:
+        print str(error)
+    except Exception, error:
+        print '**************************************************'
+        print 'Exception'
+        print '%s' % str(error)
+        print '**************************************************'
+    finally:
+        if zookeeper_client:
+            zookeeper_client.stop()
+            zookeeper_client.join()
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
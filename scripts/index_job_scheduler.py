@@ -12,6 +12,9 @@ options:
     -d --days=DAYS       number of days to schedule an IndexJob (Optional. Defaults to 1. Max of 90. First job is scheduled for today)
     -T --time=HH:MM      time string that specifies when the job will be run (Optional. Defaults to midnight)
     -c --context=CONTEXT index job context (Optional. Defaults to 'index_job_scheduler')
+    -P --priority=LANE   priority lane, 'interactive' or 'bulk' (Optional. Defaults to the lane derived by the service)
+    -I --incremental     Flag to only update documents changed since the last incremental update (Optional. Defaults to False. Not supported with --keys)
+    -r --rebuild         Flag to rebuild the entire index into a new version, which replaces the live index once complete (Optional. Defaults to False. Not supported with --keys)
     -p --preview         Flag to preview your configuration options (Optional. Defaults to False)
 """
 import datetime
@@ -21,7 +24,7 @@ import sys
 import time
 
 from trindexsvc.gen import TIndexService
-from trindexsvc.gen.ttypes import IndexData
+from trindexsvc.gen.ttypes import IndexData, IndexPriority
 from trpycore.timezone import tz
 from trpycore.zookeeper.client import ZookeeperClient
 from trsvcscore.proxy.zoo import ZookeeperServiceProxy
@@ -43,22 +46,31 @@ class Config(object):
     def __init__(self, argv):
         self.MAX_DAYS = 90
         self.preview = False
+        self.rebuild = False
+        self.incremental = False
         self.indexjob_context = "index_job_scheduler"
         self.days = 1
         self.time = tz.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
         self.index_name = None
         self.doc_type = None
         self.keys = []
+        self.priority = None
         try:
-            options, arguments = getopt.getopt(argv, "hpc:i:t:k:d:T:",["help", "preview", "context=", "index=", "type=", "keys=", "days=", "time="])
+            options, arguments = getopt.getopt(argv, "hprIc:P:i:t:k:d:T:",["help", "preview", "rebuild", "incremental", "context=", "priority=", "index=", "type=", "keys=", "days=", "time="])
 
             for option, argument in options:
                 if option in ("-h", "--help"):
                     raise Usage()
                 elif option in ("-p", "--preview"):
                     self.preview = True
+                elif option in ("-r", "--rebuild"):
+                    self.rebuild = True
+                elif option in ("-I", "--incremental"):
+                    self.incremental = True
                 elif option in ("-c", "--context"):
                     self.indexjob_context = argument
+                elif option in ("-P", "--priority"):
+                    self.priority = IndexPriority._NAMES_TO_VALUES[argument.upper()]
                 elif option in ("-i", "--index"):
                     self.index_name = argument
                 elif option in ("-t", "--type"):
@@ -78,7 +90,9 @@ class Config(object):
 
             if (not self.index_name or
                 not self.doc_type or
-                self.days > self.MAX_DAYS):
+                self.days > self.MAX_DAYS or
+                (self.rebuild and self.keys) or
+                (self.incremental and (self.keys or self.rebuild))):
                 raise Usage()
 
         except Exception as e:
@@ -92,7 +106,8 @@ def main(argv):
             notBefore=not_before,
             name=config.index_name,
             type=config.doc_type,
-            keys=config.keys
+            keys=config.keys,
+            priority=config.priority
         )
 
     def get_zookeeper_client():
@@ -117,9 +132,12 @@ def main(argv):
         print "Index name: %s" % config.index_name
         print "Document type: %s" % config.doc_type
         print "Db keys: %s" % config.keys
+        print "Rebuild: %s" % config.rebuild
+        print "Incremental: %s" % config.incremental
         print "Number of days: %s" % config.days
         print "IndexJob start time (HH:MM): %s:%s" % (config.time.hour, config.time.minute)
         print "IndexJob context: %s" % config.indexjob_context
+        print "IndexJob priority: %s" % IndexPriority._VALUES_TO_NAMES.get(config.priority, "derived")
         print '################################################'
 
         if not config.preview:
@@ -128,18 +146,24 @@ def main(argv):
             index_svc_proxy = get_index_svc_proxy(zookeeper_client)
 
             # Create a job for each day
+            index_data_list = []
             for day in range(config.days):
                 # after first iteration, add one day to start time
                 # range() is zero-based
                 if day:
                     config.time = config.time + datetime.timedelta(days=1)
-                index_data = get_index_data(config)
-
-                # invoke index() or indexAll() depending if we have a list of keys
-                if len(config.keys):
-                    index_svc_proxy.index(config.indexjob_context, index_data)
-                else:
-                    index_svc_proxy.indexAll(config.indexjob_context, index_data)
+                index_data_list.append(get_index_data(config))
+
+            if config.rebuild:
+                for index_data in index_data_list:
+                    index_svc_proxy.rebuild(config.indexjob_context, index_data)
+            elif config.incremental:
+                for index_data in index_data_list:
+                    index_svc_proxy.indexIncremental(config.indexjob_context, index_data)
+            else:
+                # Submit all jobs at once. IndexData without keys
+                # is processed like indexAll().
+                index_svc_proxy.indexBatch(config.indexjob_context, index_data_list)
 
         # Boom. Done.
         return 0
@@ -41,6 +41,13 @@ class BasicTest(IntegrationTestCase):
         self.assertIsInstance(result, dict)
         self.assertEqual(result["open_requests"], 1)
 
+    def test_getIndexCounters(self):
+        result = self.service_proxy.getCounters(self.request_context)
+        self.assertIsInstance(result["index_jobs"], int)
+        self.assertIsInstance(result["index_total_ms_le_inf"], int)
+        result = self.service_proxy.getCounter(self.request_context, "index_docs")
+        self.assertIsInstance(result, int)
+
     def test_getOptions(self):
         result = self.service_proxy.getOptions(self.request_context)
         self.assertIsInstance(result, dict)
@@ -0,0 +1,116 @@
+import os
+import sys
+import time
+import unittest
+
+SERVICE_NAME = "indexsvc"
+#Add SERVICE_ROOT to python path, for imports.
+SERVICE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", SERVICE_NAME))
+sys.path.insert(0, SERVICE_ROOT)
+
+from indexers.bulk import BulkIndex, BulkPolicy
+
+
+class FakeBulkIndex(object):
+    """Bulk index object recording flushed requests."""
+    def __init__(self, errors=None):
+        self.pending = []
+        self.requests = []
+        self.errors = []
+        self.flush_errors = list(errors or [])
+
+    def put(self, key, doc, create=False):
+        self.pending.append(key)
+
+    def delete(self, key):
+        self.pending.append(key)
+
+    def flush(self):
+        self.requests.append(self.pending)
+        self.pending = []
+        if self.flush_errors:
+            self.errors.append(self.flush_errors.pop(0))
+
+
+class BulkIndexTest(unittest.TestCase):
+    """Test the flushing of BulkIndex."""
+
+    def test_maxDocs(self):
+        index = FakeBulkIndex()
+        bulk_index = BulkIndex(index, BulkPolicy(max_docs=2))
+        with bulk_index.flushing():
+            for key in range(5):
+                bulk_index.put(key, {"id": key})
+        self.assertEqual(index.requests, [[0, 1], [2, 3], [4]])
+
+    def test_maxBytes(self):
+        index = FakeBulkIndex()
+        # Each document is 21 bytes serialized
+        bulk_index = BulkIndex(index, BulkPolicy(max_docs=100,
+                max_bytes=2 * (BulkIndex.ACTION_BYTES + 21)))
+        with bulk_index.flushing():
+            for key in range(3):
+                bulk_index.put(key, {"name": "x" * 10})
+        self.assertEqual(index.requests, [[0, 1], [2]])
+
+    def test_estimatedBytes(self):
+        index = FakeBulkIndex()
+        # Each document is 21 bytes serialized
+        bulk_index = BulkIndex(index, BulkPolicy(max_docs=100,
+                max_bytes=100 * (BulkIndex.ACTION_BYTES + 21)))
+        bulk_index.put(0, {"name": "x" * 10})
+
+        # Documents far from max_bytes are not measured
+        bulk_index.put(1, {"name": "x" * 1000})
+        self.assertEqual(bulk_index.bytes, 2 * (BulkIndex.ACTION_BYTES + 21))
+
+    def test_flushExpired(self):
+        index = FakeBulkIndex()
+        bulk_index = BulkIndex(index, BulkPolicy(max_docs=100, max_seconds=0.05))
+        bulk_index.put(1, {"id": 1})
+        bulk_index.flush_expired()
+        self.assertEqual(index.requests, [])
+
+        time.sleep(0.1)
+        bulk_index.flush_expired()
+        self.assertEqual(index.requests, [[1]])
+
+        # Nothing buffered
+        bulk_index.flush_expired()
+        self.assertEqual(index.requests, [[1]])
+
+    def test_isRejection(self):
+        bulk_index = BulkIndex(FakeBulkIndex(), BulkPolicy())
+        self.assertTrue(bulk_index._is_rejection(
+            {"index": {"_id": "1", "status": 429, "error": "rejected"}}))
+        self.assertTrue(bulk_index._is_rejection(
+            {"index": {"_id": "1", "error": "EsRejectedExecutionException[rejected execution]"}}))
+        self.assertTrue(bulk_index._is_rejection(
+            {"index": {"_id": "1", "error": {"type": "es_rejected_execution_exception"}}}))
+
+        # Errors mentioning 429 are not rejections
+        self.assertFalse(bulk_index._is_rejection(
+            {"index": {"_id": "429", "status": 400, "error": "MapperParsingException[429]"}}))
+        self.assertFalse(bulk_index._is_rejection(
+            {"index": {"_id": "1", "status": 409, "error": "offset 4290"}}))
+        self.assertFalse(bulk_index._is_rejection("document 429 failed"))
+
+    def test_adaptive(self):
+        index = FakeBulkIndex(errors=[
+            {"index": {"_id": "1", "status": 429, "error": "rejected"}}
+        ])
+        policy = BulkPolicy(max_docs=4, adaptive=True, min_docs=1, target_seconds=10)
+        bulk_index = BulkIndex(index, policy)
+
+        # Rejections shrink the batch size
+        for key in range(4):
+            bulk_index.put(key, {"id": key})
+        self.assertEqual(bulk_index.batch_size, 2)
+
+        # Fast, full batches without rejections grow it
+        for key in range(2):
+            bulk_index.put(key, {"id": key})
+        self.assertEqual(bulk_index.batch_size, 4)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import os
+import sys
+import unittest
+
+SERVICE_NAME = "indexsvc"
+#Add SERVICE_ROOT to python path, for imports.
+SERVICE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", SERVICE_NAME))
+sys.path.insert(0, SERVICE_ROOT)
+
+from trindexsvc.gen.ttypes import IndexData, IndexPriority
+
+import serialization
+from coalescer import IndexJobCoalescer
+from indexop import IndexAction, IndexOp
+
+from fakes import FakeMembership, FakeSession
+
+
+class FakeJob(object):
+    def __init__(self, id):
+        self.id = id
+
+
+def indexop(keys, action=IndexAction.Update, fields=None, priority=None, sources=None):
+    return IndexOp(action, IndexData(name="users", type="user", keys=keys,
+            fields=fields, priority=priority), sources=sources)
+
+
+class IndexJobCoalescerTest(unittest.TestCase):
+    """Test the merging of pending IndexJobs."""
+
+    def coalescer(self, candidates, claimed=0, **kwargs):
+        rows = [(id, serialization.dumps(op.to_json())) for id, op in candidates]
+        self.session = FakeSession(rows, claimed=claimed)
+        return IndexJobCoalescer(lambda: self.session, max_jobs=10, **kwargs)
+
+    def test_mergeable(self):
+        coalescer = IndexJobCoalescer(None)
+        op = indexop(["1"], fields=["skills", "chats"])
+        self.assertTrue(coalescer._mergeable(op, indexop(["2"], fields=["chats", "skills"])))
+        self.assertTrue(coalescer._mergeable(op, indexop([], fields=["chats", "skills"])))
+
+        self.assertFalse(coalescer._mergeable(op, indexop(["2"])))
+        self.assertFalse(coalescer._mergeable(op, indexop(["2"], IndexAction.Delete, ["skills", "chats"])))
+        self.assertFalse(coalescer._mergeable(op, indexop(["2"], fields=["skills", "chats"],
+                priority=IndexPriority.BULK)))
+        partition = indexop([], fields=["skills", "chats"])
+        partition.key_range = (None, 10)
+        self.assertFalse(coalescer._mergeable(op, partition))
+
+    def test_coalesce(self):
+        coalescer = self.coalescer([
+            (2, indexop(["2", "1"], sources=["technologies"])),
+            (3, indexop(["3"], IndexAction.Delete)),
+            (4, indexop(["4"], sources=["locations", "technologies"]))
+        ], claimed=2)
+        merged, job_ids = coalescer.coalesce(FakeJob(1), indexop(["1"]))
+        self.assertEqual(job_ids, [2, 4])
+        self.assertEqual(merged.data.keys, ["1", "2", "4"])
+        self.assertEqual(merged.sources, ["technologies", "locations"])
+
+        # Mergeable jobs are claimed with a single update
+        self.assertEqual(self.session.updates, 1)
+        self.assertTrue(self.session.committed)
+
+    def test_entireIndex(self):
+        coalescer = self.coalescer([(2, indexop([])), (3, indexop(["3"]))], claimed=2)
+        merged, job_ids = coalescer.coalesce(FakeJob(1), indexop(["1"]))
+        self.assertEqual(job_ids, [2, 3])
+        self.assertEqual(merged.data.keys, [])
+
+    def test_notClaimed(self):
+        coalescer = self.coalescer([(2, indexop(["2"])), (3, indexop(["3"]))], claimed=1)
+        op = indexop(["1"])
+        self.assertEqual(coalescer.coalesce(FakeJob(1), op), (op, []))
+        self.assertFalse(self.session.committed)
+
+    def test_candidates(self):
+        coalescer = self.coalescer([], membership=FakeMembership())
+        op = indexop(["1"])
+        self.assertEqual(coalescer.coalesce(FakeJob(1), op), (op, []))
+        self.assertEqual(self.session.updates, 0)
+
+        # Candidates are selected by operation and ownership in SQL
+        statement, params = self.session.statements[0]
+        self.assertEqual(params, {
+            "job_id": 1,
+            "action": IndexAction.Update,
+            "name": "users",
+            "type": "user",
+            "max_jobs": 10,
+            "grace_seconds": 30,
+            "membership_node": "member-0000000001"
+        })
+        self.assertTrue("(owned(data) OR not_before <= current_timestamp - "
+                        ":grace_seconds * interval '1 second')" in statement)
+        self.assertTrue(statement.endswith("LIMIT :max_jobs FOR UPDATE SKIP LOCKED"))
+
+if __name__ == '__main__':
+    unittest.main()
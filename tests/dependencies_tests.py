@@ -0,0 +1,99 @@
+import os
+import sys
+import unittest
+
+SERVICE_NAME = "indexsvc"
+#Add SERVICE_ROOT to python path, for imports.
+SERVICE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", SERVICE_NAME))
+sys.path.insert(0, SERVICE_ROOT)
+
+from trindexsvc.gen.ttypes import IndexData
+
+from dependencies import DependencyFanout, DocumentDependency
+from indexop import IndexAction, IndexOp
+
+
+class FakeDependency(DocumentDependency):
+    """Dependency resolving keys from a dict of {source key: [keys]}."""
+    def __init__(self, name, type, source_name, references):
+        super(FakeDependency, self).__init__(name, type, source_name, None, None)
+        self.references = references
+
+    def affected_keys(self, db_session, source_keys):
+        return [key for source_key in source_keys
+                for key in self.references.get(source_key, [])]
+
+
+class FakeSession(object):
+    """db session recording added model objects."""
+    def __init__(self):
+        self.added = []
+        self.committed = False
+
+    def add_all(self, objects):
+        self.added.extend(objects)
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class DependencyFanoutTest(unittest.TestCase):
+    """Test the creation of IndexJobs for dependent documents."""
+
+    def setUp(self):
+        self.sessions = []
+        def db_session_factory():
+            self.sessions.append(FakeSession())
+            return self.sessions[-1]
+
+        self.fanout = DependencyFanout(db_session_factory, 3, max_keys=2, dependencies=[
+            FakeDependency("users", "user", "technologies", {"1": [10, 11], "2": [11, 12]}),
+            FakeDependency("users", "user", "technologies", {"2": [13]}),
+            FakeDependency("users", "user", "locations", {"1": [20]})
+        ])
+
+    def indexop(self, name, keys, action=IndexAction.Update):
+        return IndexOp(action, IndexData(name=name, type="any", keys=keys))
+
+    def jobs(self):
+        return [IndexOp.from_json(job.data)
+                for session in self.sessions for job in session.added]
+
+    def test_keyed(self):
+        count = self.fanout.fan_out(self.indexop("technologies", ["1", "2"]), "context")
+        self.assertEqual(count, 2)
+
+        # Keys of all dependencies on the source are combined and chunked
+        jobs = self.jobs()
+        self.assertEqual([job.data.keys for job in jobs], [["10", "11"], ["12", "13"]])
+        for job in jobs:
+            self.assertEqual(job.action, IndexAction.Update)
+            self.assertEqual((job.data.name, job.data.type), ("users", "user"))
+            self.assertEqual(job.sources, ["technologies"])
+        self.assertEqual(set([job.context for job in self.sessions[0].added]), set(["context"]))
+
+    def test_noAffectedKeys(self):
+        self.assertEqual(self.fanout.fan_out(self.indexop("locations", ["2"]), "context"), 0)
+        self.assertEqual(self.jobs(), [])
+
+    def test_entireIndex(self):
+        # Full source jobs, i.e. scheduled reindexes, create no dependent jobs
+        self.assertEqual(self.fanout.fan_out(self.indexop("technologies", []), "context"), 0)
+        self.assertEqual(self.fanout.fan_out(
+            self.indexop("technologies", [], IndexAction.Rebuild), "context"), 0)
+        self.assertEqual(self.sessions, [])
+
+    def test_ignored(self):
+        self.assertEqual(self.fanout.fan_out(
+            self.indexop("technologies", ["1"], IndexAction.Delete), "context"), 0)
+        self.assertEqual(self.fanout.fan_out(self.indexop("users", ["1"]), "context"), 0)
+        self.assertEqual(self.sessions, [])
+
+if __name__ == '__main__':
+    unittest.main()
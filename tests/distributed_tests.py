@@ -0,0 +1,46 @@
+import time
+import unittest
+
+from testbase import DistributedTestCase
+
+
+class DistributedTest(DistributedTestCase):
+    """
+        Test the work partitioning of two Index Service instances.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        DistributedTestCase.setUpClass()
+
+        # Allow both instances to see each other
+        time.sleep(2)
+
+    @classmethod
+    def tearDownClass(cls):
+        DistributedTestCase.tearDownClass()
+
+    def test_getMemberCounters(self):
+        result = self.service_proxy.getCounter(self.request_context, "index_members")
+        self.assertEqual(result, 2)
+
+        slots = [service.handler.membership.counters()["index_member_slot"]
+                 for service in (self.service, self.service2)]
+        self.assertEqual(sorted(slots), [0, 1])
+
+    def test_ownership(self):
+        memberships = [self.service.handler.membership, self.service2.handler.membership]
+        tokens = ["users"] + ["users/%d" % key for key in range(100)]
+        owned = [len([token for token in tokens if membership.owns(token)])
+                 for membership in memberships]
+
+        # Each job is owned by exactly one instance
+        self.assertEqual(sum(owned), len(tokens))
+        for token in tokens:
+            self.assertEqual(1, len([m for m in memberships if m.owns(token)]))
+
+        # Jobs are spread over both instances
+        self.assertTrue(all(owned))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+from contextlib import contextmanager
+
+
+class FakeBulkIndex(object):
+    """Bulk index object recording sent keys.
+
+    Operations on failing keys are reported as errors when flushed,
+    and operations on the raising key raise an exception.
+    """
+    def __init__(self, sent=None, failing=None, raising=None, errors=None):
+        self.sent = sent if sent is not None else []
+        self.failing = failing if failing is not None else set()
+        self.raising = raising
+        self.pending = []
+        self.errors = list(errors or [])
+
+    @contextmanager
+    def flushing(self):
+        yield self
+        self.flush()
+
+    def flush_expired(self):
+        pass
+
+    def put(self, key, doc, create=False):
+        self._add(key)
+
+    def delete(self, key):
+        self._add(key)
+
+    def flush(self):
+        for key in self.pending:
+            if key in self.failing:
+                self.errors.append({"index": {"_id": key, "error": "MapperParsingException"}})
+            else:
+                self.sent.append(key)
+        self.pending = []
+
+    def _add(self, key):
+        if key == self.raising:
+            raise RuntimeError("send failed: %s" % key)
+        self.pending.append(key)
+
+
+class FakeESClient(object):
+    """ElasticSearch client returning FakeBulkIndexes."""
+    def __init__(self, sent, failing):
+        self.sent = sent
+        self.failing = failing
+
+    def get_bulk_index(self, name, type, autoflush=None):
+        return FakeBulkIndex(self.sent, self.failing)
+
+
+class FakeClientPool(object):
+    """Pool of FakeESClients sharing sent and failing keys."""
+    def __init__(self):
+        self.sent = []
+        self.failing = set()
+
+    @contextmanager
+    def get(self):
+        yield FakeESClient(self.sent, self.failing)
+
+
+class FakeResult(object):
+    def __init__(self, rows):
+        self.rows = rows
+
+    def fetchall(self):
+        return self.rows
+
+    def scalar(self):
+        return self.rows[0][0] if self.rows else None
+
+
+class FakeQuery(object):
+    def __init__(self, session):
+        self.session = session
+
+    def filter(self, *args):
+        return self
+
+    def update(self, values, synchronize_session=None):
+        self.session.updates += 1
+        return self.session.claimed
+
+
+class FakeSession(object):
+    """db session returning the specified rows, recording statements.
+
+    The first statement executed returns rows, and later statements
+    return results. Updates report claimed rows as updated.
+    """
+    def __init__(self, rows, results=None, claimed=0):
+        self.rows = rows
+        self.results = results or []
+        self.claimed = claimed
+        self.statements = []
+        self.updates = 0
+        self.committed = False
+
+    def execute(self, statement, params):
+        self.statements.append((str(statement), params))
+        if len(self.statements) == 1:
+            return FakeResult(self.rows)
+        return FakeResult(self.results)
+
+    def query(self, *args):
+        return FakeQuery(self)
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeMembership(object):
+    grace_seconds = 30
+
+    def clause(self, data):
+        return "owned(%s)" % data.column, {"membership_node": "member-0000000001"}
@@ -0,0 +1,116 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+SERVICE_NAME = "indexsvc"
+#Add SERVICE_ROOT to python path, for imports.
+SERVICE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", SERVICE_NAME))
+sys.path.insert(0, SERVICE_ROOT)
+
+from trindexsvc.gen.ttypes import IndexData
+
+from indexers.es_indexer import ESIndexer
+from indexers.fingerprint import FingerprintStore
+from indexop import IndexAction, IndexOp
+
+from fakes import FakeClientPool
+
+
+class FakeDocumentGenerator(object):
+    """Document generator returning docs from a dict of {key: doc}."""
+    def __init__(self, docs):
+        self.docs = docs
+
+    def generate(self, keys, key_range=None):
+        for key in sorted(keys or self.docs.keys()):
+            yield (key, self.docs[key])
+
+
+class FingerprintStoreTest(unittest.TestCase):
+    """Test the persistence of document fingerprints."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = FingerprintStore(os.path.join(self.directory, "fingerprints"))
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.directory)
+
+    def test_fingerprint(self):
+        fingerprint = FingerprintStore.fingerprint({"id": 1, "name": "a", "skills": [1, 2]})
+        self.assertEqual(fingerprint,
+                FingerprintStore.fingerprint({"skills": [1, 2], "name": "a", "id": 1}))
+        self.assertNotEqual(fingerprint,
+                FingerprintStore.fingerprint({"id": 1, "name": "a", "skills": [2, 1]}))
+
+    def test_store(self):
+        self.store.update("users", {1: "a", "2": "b"})
+        self.store.update("topics", {1: "c"})
+        self.assertEqual(self.store.get("users", "1"), "a")
+        self.assertEqual(self.store.get("users", 2), "b")
+
+        self.store.remove("users", [1, 3])
+        self.assertEqual(self.store.get("users", 1), None)
+        self.store.clear("users")
+        self.assertEqual(self.store.get("users", 2), None)
+
+        # Fingerprints persist across processes
+        self.store.close()
+        self.store = FingerprintStore(os.path.join(self.directory, "fingerprints"))
+        self.assertEqual(self.store.get("topics", 1), "c")
+
+
+class ESIndexerFingerprintTest(unittest.TestCase):
+    """Test the skipping of unchanged documents by ESIndexer."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = FingerprintStore(self.directory)
+        self.pool = FakeClientPool()
+        self.indexer = ESIndexer(None, self.pool, "tests", "test", fingerprint_store=self.store)
+        self.docs = dict([(str(key), {"id": key}) for key in range(3)])
+        self.indexer.document_generator = FakeDocumentGenerator(self.docs)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.directory)
+
+    def index(self, action, keys=None):
+        del self.pool.sent[:]
+        return self.indexer.index(IndexOp(action,
+                IndexData(name="tests", type="test", keys=keys or [])))
+
+    def test_update(self):
+        result = self.index(IndexAction.Update)
+        self.assertEqual((result.count, result.skipped), (3, 0))
+
+        result = self.index(IndexAction.Update)
+        self.assertEqual((result.count, result.skipped), (0, 3))
+        self.assertEqual(self.pool.sent, [])
+
+        self.docs["1"] = {"id": 1, "changed": True}
+        result = self.index(IndexAction.Update)
+        self.assertEqual((result.count, result.skipped), (1, 2))
+        self.assertEqual(self.pool.sent, ["1"])
+
+    def test_failed(self):
+        # Fingerprints of documents which failed to index are not stored
+        self.pool.failing.add("2")
+        result = self.index(IndexAction.Update)
+        self.assertEqual(result.failed_keys, ["2"])
+
+        self.pool.failing.clear()
+        result = self.index(IndexAction.Update)
+        self.assertEqual(self.pool.sent, ["2"])
+
+    def test_delete(self):
+        self.index(IndexAction.Create)
+        self.index(IndexAction.Delete, ["1"])
+        result = self.index(IndexAction.Update)
+        self.assertEqual(self.pool.sent, ["1"])
+
+if __name__ == '__main__':
+    unittest.main()
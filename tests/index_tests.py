@@ -10,7 +10,7 @@ SERVICE_NAME = "indexsvc"
 SERVICE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", SERVICE_NAME))
 sys.path.insert(0, SERVICE_ROOT)
 
-from trindexsvc.gen.ttypes import IndexData, UnavailableException, InvalidDataException
+from trindexsvc.gen.ttypes import IndexData, IndexPriority, UnavailableException, InvalidDataException
 from trpycore.timezone import tz
 from trsvcscore.db.models import IndexJob as IndexJobModel
 
@@ -123,6 +123,12 @@ class IndexServiceTest(IntegrationTestCase):
         with self.assertRaises(InvalidDataException):
             self.service_proxy.index(self.context, invalid_index_data)
 
+        # Invalid index priority
+        invalid_index_data = copy.deepcopy(self.index_data)
+        invalid_index_data.priority = 99
+        with self.assertRaises(InvalidDataException):
+            self.service_proxy.index(self.context, invalid_index_data)
+
     def test_index(self):
         """Simple test case."""
         try:
@@ -154,6 +160,139 @@ class IndexServiceTest(IntegrationTestCase):
             if index_models is not None:
                 self._cleanup_models(index_models)
 
+    def test_indexFields(self):
+        """Partial update test case."""
+        try:
+            # Init models to None to avoid unnecessary cleanup on failure
+            index_models = None
+
+            index_data = copy.deepcopy(self.index_data)
+            index_data.fields = ['actively_seeking']
+
+            # Create & write IndexJob to db
+            self.service_proxy.index(self.context, index_data)
+
+            # Verify IndexJob model
+            index_job_model = self.db_session.query(IndexJobModel).\
+                filter(IndexJobModel.context==self.context).\
+                one()
+            index_models = [index_job_model]
+            self._validate_indexjob_model(
+                index_job_model,
+                IndexAction.Update,
+                index_data
+            )
+
+        finally:
+            if index_models is not None:
+                self._cleanup_models(index_models)
+
+    def test_indexPriority(self):
+        """Explicit priority test case."""
+        try:
+            # Init models to None to avoid unnecessary cleanup on failure
+            index_models = None
+
+            index_data = copy.deepcopy(self.index_data)
+            index_data.priority = IndexPriority.BULK
+
+            # Create & write IndexJob to db
+            self.service_proxy.index(self.context, index_data)
+
+            # Verify IndexJob model
+            index_job_model = self.db_session.query(IndexJobModel).\
+                filter(IndexJobModel.context==self.context).\
+                one()
+            index_models = [index_job_model]
+            self._validate_indexjob_model(
+                index_job_model,
+                IndexAction.Update,
+                index_data
+            )
+            self.assertEqual(IndexPriority.BULK,
+                    IndexOp.from_json(index_job_model.data).data.priority)
+
+        finally:
+            if index_models is not None:
+                self._cleanup_models(index_models)
+
+    def test_indexBatch(self):
+        """Batch test case."""
+        try:
+            # Init models to None to avoid unnecessary cleanup on failure
+            index_models = None
+
+            index_all_data = copy.deepcopy(self.index_data)
+            index_all_data.keys = []
+            index_data_list = [self.index_data, index_all_data]
+
+            # Create & write IndexJobs to db
+            self.service_proxy.indexBatch(self.context, index_data_list)
+
+            # Verify IndexJob models
+            index_job_models = self.db_session.query(IndexJobModel).\
+                filter(IndexJobModel.context==self.context).\
+                order_by(IndexJobModel.id).\
+                all()
+            self.assertEqual(len(index_job_models), len(index_data_list))
+
+            # Add models to list for cleanup
+            index_models = index_job_models
+
+            for model, index_data in zip(index_job_models, index_data_list):
+                self._validate_indexjob_model(
+                    model,
+                    IndexAction.Update,
+                    index_data
+                )
+
+        finally:
+            if index_models is not None:
+                self._cleanup_models(index_models)
+
+    def test_indexBatchInvalidData(self):
+
+        # Empty batch
+        with self.assertRaises(InvalidDataException):
+            self.service_proxy.indexBatch(self.context, [])
+
+        # Invalid index name. No jobs should be created.
+        invalid_index_data = copy.deepcopy(self.index_data)
+        invalid_index_data.name = None
+        with self.assertRaises(InvalidDataException):
+            self.service_proxy.indexBatch(self.context, [self.index_data, invalid_index_data])
+
+        index_job_count = self.db_session.query(IndexJobModel).\
+            filter(IndexJobModel.context==self.context).\
+            count()
+        self.assertEqual(index_job_count, 0)
+
+    def test_rebuildInvalidData(self):
+
+        # Keys are not supported
+        with self.assertRaises(InvalidDataException):
+            self.service_proxy.rebuild(self.context, self.index_data)
+
+        # Invalid index name
+        invalid_index_data = copy.deepcopy(self.index_data)
+        invalid_index_data.keys = []
+        invalid_index_data.name = None
+        with self.assertRaises(InvalidDataException):
+            self.service_proxy.rebuild(self.context, invalid_index_data)
+
+        # Fields are not supported
+        invalid_index_data = copy.deepcopy(self.index_data)
+        invalid_index_data.keys = []
+        invalid_index_data.fields = ['actively_seeking']
+        with self.assertRaises(InvalidDataException):
+            self.service_proxy.rebuild(self.context, invalid_index_data)
+
+    def test_indexIncrementalInvalidData(self):
+
+        # Keys are not supported
+        with self.assertRaises(InvalidDataException):
+            self.service_proxy.indexIncremental(self.context, self.index_data)
+
 
 if __name__ == '__main__':
     unittest.main()
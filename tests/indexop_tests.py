@@ -0,0 +1,57 @@
+import os
+import sys
+import unittest
+
+SERVICE_NAME = "indexsvc"
+#Add SERVICE_ROOT to python path, for imports.
+SERVICE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", SERVICE_NAME))
+sys.path.insert(0, SERVICE_ROOT)
+
+from trindexsvc.gen.ttypes import IndexData
+
+import serialization
+from indexop import IndexAction, IndexOp, IndexOpSQL
+
+
+class IndexOpTest(unittest.TestCase):
+    """Test the serialization of IndexOps."""
+
+    def roundtrip(self, indexop):
+        return IndexOp.from_json(serialization.dumps(indexop.to_json()))
+
+    def test_json(self):
+        indexop = self.roundtrip(IndexOp(IndexAction.Update,
+                IndexData(name="users", type="user", keys=["1", "2"], fields=["skills"]),
+                sources=["technologies"]))
+        self.assertEqual(indexop.action, IndexAction.Update)
+        self.assertEqual((indexop.data.name, indexop.data.type), ("users", "user"))
+        self.assertEqual(indexop.data.keys, ["1", "2"])
+        self.assertEqual(indexop.data.fields, ["skills"])
+        self.assertEqual(indexop.sources, ["technologies"])
+        self.assertEqual(indexop.key_range, None)
+
+    def test_optionalFields(self):
+        json = IndexOp(IndexAction.Create,
+                IndexData(name="users", type="user", keys=[])).to_json()
+        self.assertEqual(sorted(json.keys()), ["action", "keys", "name", "type"])
+
+        indexop = self.roundtrip(IndexOp(IndexAction.Create,
+                IndexData(name="users", type="user", keys=[]), key_range=(None, 10)))
+        self.assertEqual(indexop.key_range, (None, 10))
+        self.assertEqual(indexop.sources, [])
+
+
+class IndexOpSQLTest(unittest.TestCase):
+    """Test the SQL expressions of serialized IndexOps."""
+
+    def test_expressions(self):
+        sql = IndexOpSQL("index_job.data")
+        self.assertEqual(sql.name, "(index_job.data::json->>'name')")
+        self.assertEqual(sql.type, "(index_job.data::json->>'type')")
+        self.assertEqual(sql.action, "((index_job.data::json->>'action')::integer)")
+        self.assertEqual(sql.priority, "coalesce(((index_job.data::json->>'priority')::integer), 0)")
+        self.assertEqual(sql.num_keys, "json_array_length(coalesce(index_job.data::json->'keys', '[]'::json))")
+        self.assertTrue(sql.token.startswith("(CASE WHEN %s > 0 THEN " % sql.num_keys))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import os
+import sys
+import unittest
+
+SERVICE_NAME = "indexsvc"
+#Add SERVICE_ROOT to python path, for imports.
+SERVICE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", SERVICE_NAME))
+sys.path.insert(0, SERVICE_ROOT)
+
+from trindexsvc.gen.ttypes import IndexPriority
+
+from indexop import IndexOpSQL
+from jobqueue import IndexJobQueue
+from priority import PriorityPolicy
+
+from fakes import FakeMembership, FakeSession
+
+
+class IndexJobQueueTest(unittest.TestCase):
+    """Test the claiming of IndexJobs."""
+
+    def queue(self, rows, next_seconds=None, **kwargs):
+        self.session = FakeSession(rows, [(next_seconds,)], claimed=len(rows))
+        return IndexJobQueue("indexsvc", lambda: self.session, poll_seconds=60, **kwargs)
+
+    def test_claim(self):
+        queue = self.queue([(1,), (2,)])
+        self.assertEqual(queue._claim(5, None), ([1, 2], 60))
+        self.assertEqual(self.session.updates, 1)
+
+        # As many jobs are locked as requested
+        statement, params = self.session.statements[0]
+        self.assertEqual(params, {"max_jobs": 5})
+        self.assertTrue(statement.endswith("LIMIT :max_jobs FOR UPDATE SKIP LOCKED"))
+        self.assertTrue("WHERE owner IS NULL AND not_before <= current_timestamp " in statement)
+
+    def test_lanes(self):
+        policy = PriorityPolicy(bulk_contexts=["index_job_scheduler"])
+        interactive, params = policy.clause(IndexOpSQL("data"), "context", IndexPriority.INTERACTIVE)
+
+        # Lanes are selected before jobs are locked
+        queue = self.queue([(1,)], priority_policy=policy, lanes=[IndexPriority.INTERACTIVE])
+        queue._claim(1, IndexPriority.INTERACTIVE)
+        statement, claim_params = self.session.statements[0]
+        self.assertTrue("AND %s AND" % interactive in statement)
+        self.assertEqual(claim_params, dict(params, max_jobs=1))
+
+        queue = self.queue([(1,)], priority_policy=policy, lanes=[IndexPriority.INTERACTIVE])
+        queue._claim(1, None)
+        self.assertTrue("AND NOT (%s) AND" % interactive in self.session.statements[0][0])
+
+        # Without reserved lanes all jobs belong to the default lane
+        queue = self.queue([(1,)], priority_policy=policy)
+        queue._claim(1, None)
+        self.assertFalse("priority" in self.session.statements[0][0])
+
+    def test_membership(self):
+        queue = self.queue([(1,)], membership=FakeMembership())
+        queue._claim(1, None)
+        statement, params = self.session.statements[0]
+        self.assertTrue("AND (CASE WHEN owned(data) THEN not_before "
+                        "ELSE not_before + :grace_seconds * interval '1 second' END) "
+                        "<= current_timestamp " in statement)
+        self.assertEqual(params, {
+            "max_jobs": 1,
+            "grace_seconds": 30,
+            "membership_node": "member-0000000001"
+        })
+
+    def test_wait(self):
+        # Wake up when the next job may be claimed
+        queue = self.queue([], next_seconds=2.5, membership=FakeMembership())
+        self.assertEqual(queue._claim(1, None), ([], 2.5))
+        self.assertEqual(self.session.updates, 0)
+        statement, params = self.session.statements[1]
+        self.assertTrue("owned(data)" in statement)
+        self.assertTrue(statement.endswith("> current_timestamp"))
+
+        queue = self.queue([], next_seconds=None)
+        self.assertEqual(queue._claim(1, None), ([], 60))
+
+if __name__ == '__main__':
+    unittest.main()
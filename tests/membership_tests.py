@@ -0,0 +1,122 @@
+import os
+import sys
+import unittest
+
+SERVICE_NAME = "indexsvc"
+#Add SERVICE_ROOT to python path, for imports.
+SERVICE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", SERVICE_NAME))
+sys.path.insert(0, SERVICE_ROOT)
+
+from indexop import IndexOpSQL
+from membership import IndexMembership
+
+
+class FakeZookeeperClient(object):
+    """In-memory ZooKeeper client."""
+    def __init__(self):
+        self.nodes = {"/": ""}
+        self.sequence = 0
+
+    def exists(self, path):
+        return path in self.nodes
+
+    def create(self, path, data, sequence=False, ephemeral=False):
+        if sequence:
+            path = "%s%010d" % (path, self.sequence)
+            self.sequence += 1
+        self.nodes[path] = data
+        return path
+
+    def get_children(self, path, watch=None):
+        prefix = path.rstrip("/") + "/"
+        return [node[len(prefix):] for node in self.nodes
+                if node.startswith(prefix) and "/" not in node[len(prefix):]]
+
+    def delete(self, path):
+        del self.nodes[path]
+
+
+class IndexMembershipTest(unittest.TestCase):
+    """Test the ownership of jobs by indexsvc members."""
+
+    def setUp(self):
+        self.zookeeper_client = FakeZookeeperClient()
+        self.memberships = [self.member() for i in range(3)]
+        self.refresh()
+        self.tokens = ["users"] + ["users/%d" % key for key in range(300)]
+
+    def member(self):
+        membership = IndexMembership(self.zookeeper_client, "/indexsvc/members")
+        membership._refresh()
+        return membership
+
+    def refresh(self):
+        for membership in self.memberships:
+            membership._refresh()
+
+    def owners(self):
+        return dict([(token, [m.node for m in self.memberships if m.owns(token)])
+                     for token in self.tokens])
+
+    def test_register(self):
+        self.assertEqual([m.node for m in self.memberships],
+                ["member-0000000000", "member-0000000001", "member-0000000002"])
+        self.assertEqual(self.memberships[1].counters(),
+                {"index_members": 3, "index_member_slot": 1})
+
+    def test_exclusive(self):
+        owners = self.owners()
+        for token in self.tokens:
+            self.assertEqual(len(owners[token]), 1)
+        # Jobs are spread over the members
+        for membership in self.memberships:
+            self.assertTrue(len([o for o in owners.values() if o == [membership.node]]) > 50)
+
+    def test_rebalance(self):
+        before = self.owners()
+        self.memberships.append(self.member())
+        self.refresh()
+        after = self.owners()
+
+        # Only jobs taken over by the new member change owners
+        for token in self.tokens:
+            if after[token] != before[token]:
+                self.assertEqual(after[token], [self.memberships[-1].node])
+
+        # Only jobs of the member which left change owners
+        node = self.memberships.pop(0).node
+        self.zookeeper_client.delete("/indexsvc/members/%s" % node)
+        self.refresh()
+        self.assertEqual(len(self.memberships[0].members), 3)
+        for token, owners in self.owners().items():
+            if owners != after[token]:
+                self.assertEqual(after[token], [node])
+
+    def test_notMember(self):
+        membership = IndexMembership(self.zookeeper_client, "/indexsvc/members")
+        self.assertTrue(membership.owns("users"))
+        self.assertEqual(membership.clause(IndexOpSQL("data")), (None, {}))
+
+        # Nodes own all jobs while the members are not known
+        self.memberships[0]._set_members(self.memberships[0].node, [])
+        self.assertTrue(self.memberships[0].owns("users"))
+
+    def test_clause(self):
+        data = IndexOpSQL("data")
+        clause, params = self.memberships[1].clause(data)
+        self.assertEqual(params, {
+            "membership_node": "member-0000000001",
+            "membership_member_0": "member-0000000000",
+            "membership_member_1": "member-0000000002"
+        })
+        node = "md5(:membership_node || ':' || %s) COLLATE \"C\"" % data.token
+        # Hash ties are won by the greater member name
+        self.assertTrue("%s >= md5(:membership_member_0" % node in clause)
+        self.assertTrue("%s > md5(:membership_member_1" % node in clause)
+
+        membership = self.memberships[0]
+        membership._set_members(membership.node, [membership.node])
+        self.assertEqual(membership.clause(data), ("TRUE", {}))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import sys
+import threading
+import unittest
+
+SERVICE_NAME = "indexsvc"
+#Add SERVICE_ROOT to python path, for imports.
+SERVICE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", SERVICE_NAME))
+sys.path.insert(0, SERVICE_ROOT)
+
+import jobstats
+from indexers.indexer import IndexResult
+from partition import IndexPartitionSet
+
+
+class FakeIndexer(object):
+    """Indexer returning a result with the partition's failed keys."""
+    def __init__(self, processed, failing=None):
+        self.processed = processed
+        self.failing = failing
+
+    def index(self, indexop):
+        self.processed.append((indexop, threading.current_thread().name))
+        if indexop == self.failing:
+            raise Exception("partition %s failed" % indexop)
+        jobstats.increment(jobstats.DOCS, 10)
+        return IndexResult(count=10, failed_keys=[str(indexop)])
+
+
+class IndexPartitionSetTest(unittest.TestCase):
+    """Test the processing of partitions by multiple threads."""
+
+    def test_process(self):
+        processed = []
+        stats = jobstats.JobStats()
+        with jobstats.activate(stats):
+            partition_set = IndexPartitionSet(range(6),
+                    lambda indexop: FakeIndexer(processed))
+
+        threads = [threading.Thread(target=partition_set.process) for i in range(2)]
+        for thread in threads:
+            thread.start()
+        partition_set.process()
+        result = partition_set.wait()
+        for thread in threads:
+            thread.join()
+
+        # Each partition is processed exactly once
+        self.assertEqual(sorted([indexop for indexop, thread in processed]), range(6))
+        self.assertEqual(result.count, 60)
+        self.assertEqual(sorted(result.failed_keys), [str(i) for i in range(6)])
+
+        # The stats of the creating thread are active on all threads
+        self.assertEqual(stats.counts[jobstats.DOCS], 60)
+
+    def test_failure(self):
+        processed = []
+        partition_set = IndexPartitionSet(range(4),
+                lambda indexop: FakeIndexer(processed, failing=1))
+        partition_set.process()
+
+        # Partitions are not started after a failure
+        self.assertEqual([indexop for indexop, thread in processed], [0, 1])
+        self.assertRaises(Exception, partition_set.wait)
+
+    def test_single(self):
+        partition_set = IndexPartitionSet([0], lambda indexop: FakeIndexer([]))
+        partition_set.process()
+        # Additional threads return without work
+        partition_set.process()
+        self.assertEqual(partition_set.wait().count, 10)
+
+if __name__ == '__main__':
+    unittest.main()
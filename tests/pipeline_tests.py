@@ -0,0 +1,69 @@
+import os
+import sys
+import unittest
+
+SERVICE_NAME = "indexsvc"
+#Add SERVICE_ROOT to python path, for imports.
+SERVICE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", SERVICE_NAME))
+sys.path.insert(0, SERVICE_ROOT)
+
+from indexers.pipeline import BulkPipeline
+
+from fakes import FakeBulkIndex, FakeClientPool
+
+
+def operations(count, error_after=None):
+    """Generate put operations, raising after error_after operations."""
+    for key in range(count):
+        if key == error_after:
+            raise ValueError("generate failed: %s" % key)
+        yield ("put", (key, {"id": key}, False))
+
+
+class BulkPipelineTest(unittest.TestCase):
+    """Test the sending of bulk operations on sender threads."""
+
+    def pipeline(self, index, senders=1, index_factory=None):
+        return BulkPipeline(index, FakeClientPool(), index_factory,
+                senders=senders, queue_size=10)
+
+    def test_send(self):
+        indexes = []
+        def index_factory(index_client):
+            indexes.append(FakeBulkIndex(errors=["error"]))
+            return indexes[-1]
+
+        index = FakeBulkIndex()
+        count = self.pipeline(index, 3, index_factory).send(operations(100))
+        self.assertEqual(count, 100)
+
+        keys = index.sent + [key for i in indexes for key in i.sent]
+        self.assertEqual(sorted(keys), range(100))
+
+        # Errors of additional senders are collected in the first index
+        self.assertEqual(index.errors, ["error", "error"])
+
+    def test_generatorError(self):
+        index = FakeBulkIndex()
+        pipeline = self.pipeline(index)
+        self.assertRaises(ValueError, pipeline.send, operations(100, error_after=50))
+
+        # Operations produced before the error are still sent
+        self.assertEqual(index.sent, range(50))
+
+    def test_senderError(self):
+        index = FakeBulkIndex(raising=5)
+        pipeline = self.pipeline(index)
+        self.assertRaises(RuntimeError, pipeline.send, operations(1000))
+        self.assertTrue(len(index.sent) < 1000)
+
+    def test_additionalSenderError(self):
+        def index_factory(index_client):
+            return FakeBulkIndex(raising=5)
+
+        index = FakeBulkIndex(raising=5)
+        pipeline = self.pipeline(index, 2, index_factory)
+        self.assertRaises(RuntimeError, pipeline.send, operations(1000))
+
+if __name__ == '__main__':
+    unittest.main()
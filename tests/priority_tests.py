@@ -0,0 +1,70 @@
+import os
+import sys
+import unittest
+
+SERVICE_NAME = "indexsvc"
+#Add SERVICE_ROOT to python path, for imports.
+SERVICE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", SERVICE_NAME))
+sys.path.insert(0, SERVICE_ROOT)
+
+from trindexsvc.gen.ttypes import IndexData, IndexPriority
+
+from indexop import IndexAction, IndexOp, IndexOpSQL
+from priority import PriorityPolicy
+
+
+class PriorityPolicyTest(unittest.TestCase):
+    """Test the assignment of jobs to priority lanes."""
+
+    def setUp(self):
+        self.policy = PriorityPolicy(interactive_max_keys=2,
+                bulk_contexts=["index_job_scheduler"])
+
+    def priority(self, keys, action=IndexAction.Update, priority=None, context=None):
+        indexop = IndexOp(action, IndexData(name="users", type="user",
+                keys=keys, priority=priority))
+        return self.policy.priority(indexop, context)
+
+    def test_derived(self):
+        self.assertEqual(self.priority(["1", "2"]), IndexPriority.INTERACTIVE)
+        self.assertEqual(self.priority(["1"], context="web"), IndexPriority.INTERACTIVE)
+        self.assertEqual(self.priority(["1"], IndexAction.Delete), IndexPriority.INTERACTIVE)
+
+        self.assertEqual(self.priority([]), IndexPriority.BULK)
+        self.assertEqual(self.priority(["1", "2", "3"]), IndexPriority.BULK)
+        self.assertEqual(self.priority(["1"], context="index_job_scheduler"), IndexPriority.BULK)
+        self.assertEqual(self.priority(["1"], IndexAction.Rebuild), IndexPriority.BULK)
+        self.assertEqual(self.priority(["1"], IndexAction.Incremental), IndexPriority.BULK)
+
+    def test_explicit(self):
+        self.assertEqual(self.priority([], priority=IndexPriority.INTERACTIVE),
+                         IndexPriority.INTERACTIVE)
+        self.assertEqual(self.priority(["1"], priority=IndexPriority.BULK),
+                         IndexPriority.BULK)
+        # Unknown priorities are ignored
+        self.assertEqual(self.priority(["1"], priority=7), IndexPriority.INTERACTIVE)
+
+    def test_clause(self):
+        data = IndexOpSQL("data")
+        interactive, params = self.policy.clause(data, "context", IndexPriority.INTERACTIVE)
+        self.assertEqual(params, {
+            "priority_max_keys": 2,
+            "priority_context_0": "index_job_scheduler"
+        })
+        self.assertTrue(interactive.startswith("(%s = 1 OR (%s NOT IN (1, 2) AND %s NOT IN (3, 4) AND " %\
+                        (data.priority, data.priority, data.action)))
+        self.assertTrue("coalesce(context, '') NOT IN (:priority_context_0)" in interactive)
+
+        # Jobs without an explicit priority are in exactly one lane
+        bulk, params = self.policy.clause(data, "context", IndexPriority.BULK)
+        derived = interactive[interactive.index(" AND ", interactive.index("NOT IN (1, 2)")) + 5:-2]
+        self.assertTrue(bulk.endswith("NOT (%s)))" % derived))
+
+    def test_clauseWithoutBulkContexts(self):
+        clause, params = PriorityPolicy().clause(IndexOpSQL("data"), "context",
+                IndexPriority.INTERACTIVE)
+        self.assertEqual(params, {"priority_max_keys": 100})
+        self.assertFalse("context" in clause)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import os
+import sys
+import unittest
+
+SERVICE_NAME = "indexsvc"
+#Add SERVICE_ROOT to python path, for imports.
+SERVICE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", SERVICE_NAME))
+sys.path.insert(0, SERVICE_ROOT)
+
+from documents.refcache import ReferenceCache, ReferenceTable
+
+
+class FakeTable(ReferenceTable):
+    """Reference table reading rows from a dict, recording reads."""
+    def __init__(self, name, rows, index_name=None):
+        super(FakeTable, self).__init__(name, None, ["name"], index_name)
+        self.rows = rows
+        self.reads = []
+        self.on_load = None
+
+    def load(self, db_session, ids):
+        self.reads.append(sorted(ids))
+        if self.on_load is not None:
+            self.on_load()
+        return dict((id, {"name": self.rows[id]}) for id in ids if id in self.rows)
+
+
+class ReferenceCacheTest(unittest.TestCase):
+    """Test the caching of reference table rows."""
+
+    def setUp(self):
+        self.table = FakeTable("technologies",
+                {1: "python", 2: "java", 3: "scala"}, index_name="technologies")
+
+    def test_get(self):
+        cache = ReferenceCache()
+        self.assertEqual(cache.get(None, self.table, [1, 2, None, 4]),
+                         {1: {"name": "python"}, 2: {"name": "java"}})
+        self.assertEqual(cache.get(None, self.table, [1, 2, 3]),
+                         {1: {"name": "python"}, 2: {"name": "java"}, 3: {"name": "scala"}})
+        # Only missing rows are read
+        self.assertEqual(self.table.reads, [[1, 2, 4], [3]])
+
+    def test_ttl(self):
+        cache = ReferenceCache(ttl_seconds=0)
+        cache.get(None, self.table, [1])
+        cache.get(None, self.table, [1])
+        self.assertEqual(self.table.reads, [[1], [1]])
+
+    def test_lru(self):
+        cache = ReferenceCache(max_size=2)
+        cache.get(None, self.table, [1])
+        cache.get(None, self.table, [2])
+        # Mark 1 as most recently used, so 2 is evicted
+        cache.get(None, self.table, [1])
+        cache.get(None, self.table, [3])
+        self.assertEqual(len(cache.entries), 2)
+
+        cache.get(None, self.table, [1, 2, 3])
+        self.assertEqual(self.table.reads, [[1], [2], [3], [2]])
+
+    def test_invalidate(self):
+        cache = ReferenceCache()
+        cache.get(None, self.table, [1, 2])
+        cache.invalidate("users")
+        cache.get(None, self.table, [1])
+        self.assertEqual(self.table.reads, [[1, 2]])
+
+        cache.invalidate("technologies")
+        self.table.rows[1] = "python3"
+        self.assertEqual(cache.get(None, self.table, [1]), {1: {"name": "python3"}})
+        self.assertEqual(self.table.reads, [[1, 2], [1]])
+
+    def test_invalidateDuringLoad(self):
+        cache = ReferenceCache()
+        # Rows read while the table is invalidated may be stale
+        # and are returned, but not cached.
+        self.table.on_load = lambda: cache.invalidate("technologies")
+        self.assertEqual(cache.get(None, self.table, [1]), {1: {"name": "python"}})
+        self.assertEqual(cache.entries, {})
+
+        self.table.on_load = None
+        cache.get(None, self.table, [1])
+        cache.get(None, self.table, [1])
+        self.assertEqual(self.table.reads, [[1], [1]])
+
+if __name__ == '__main__':
+    unittest.main()
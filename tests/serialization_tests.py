@@ -0,0 +1,80 @@
+import datetime
+import os
+import sys
+import unittest
+
+SERVICE_NAME = "indexsvc"
+#Add SERVICE_ROOT to python path, for imports.
+SERVICE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", SERVICE_NAME))
+sys.path.insert(0, SERVICE_ROOT)
+
+from serialization import JSONBackend, Serializer
+
+
+class MissingBackend(JSONBackend):
+    """Backend whose library is not installed."""
+    name = "missing"
+
+    def __init__(self):
+        raise ImportError("No module named missing")
+
+
+class InexactBackend(JSONBackend):
+    """Backend encoding dates as timestamps, and decoding floats as strings."""
+    name = "inexact"
+
+    def dumps(self, obj, sort_keys=False):
+        if isinstance(obj, dict):
+            obj = dict([(key, value.strftime("%s") if isinstance(value, datetime.datetime) else value)
+                        for key, value in obj.items()])
+        return super(InexactBackend, self).dumps(obj, sort_keys)
+
+    def loads(self, data):
+        return super(InexactBackend, self).loads(data.replace("4.5", "\"4.5\""))
+
+
+class PartialBackend(JSONBackend):
+    """Exact backend failing on values containing "unsupported"."""
+    name = "partial"
+
+    def dumps(self, obj, sort_keys=False):
+        if "unsupported" in repr(obj):
+            raise TypeError("unsupported value")
+        return super(PartialBackend, self).dumps(obj, sort_keys)
+
+    def loads(self, data):
+        if "unsupported" in data:
+            raise ValueError("unsupported value")
+        return super(PartialBackend, self).loads(data)
+
+
+class SerializerTest(unittest.TestCase):
+    """Test the selection of serialization backends."""
+
+    def test_default(self):
+        serializer = Serializer(backends=[JSONBackend])
+        self.assertEqual(serializer.encoder.name, "json")
+        self.assertEqual(serializer.dumps({"b": 1, "a": [datetime.date(2013, 1, 2)]}, sort_keys=True),
+                         '{"a":["2013-01-02"],"b":1}')
+
+    def test_probe(self):
+        serializer = Serializer(backends=[MissingBackend, InexactBackend, PartialBackend])
+        # Backends whose output differs from the json module are not used
+        self.assertEqual(serializer.encoder.name, "partial")
+        self.assertEqual(serializer.decoder.name, "partial")
+
+        serializer = Serializer(backends=[MissingBackend, InexactBackend])
+        self.assertTrue(serializer.encoder is serializer.reference)
+        self.assertTrue(serializer.decoder is serializer.reference)
+
+    def test_fallback(self):
+        serializer = Serializer(backends=[PartialBackend])
+        # Values the backend fails on are handled by the json module
+        data = serializer.dumps({"value": "unsupported"})
+        self.assertEqual(data, '{"value":"unsupported"}')
+        self.assertEqual(serializer.loads(data), {"value": "unsupported"})
+
+        self.assertRaises(ValueError, serializer.loads, "{invalid")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import os
+import sys
+import threading
+import unittest
+
+SERVICE_NAME = "indexsvc"
+#Add SERVICE_ROOT to python path, for imports.
+SERVICE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../", SERVICE_NAME))
+sys.path.insert(0, SERVICE_ROOT)
+
+from writebuffer import IndexJobWriteBuffer, WriteBufferStopped
+
+
+class FakeWriter(object):
+    """Writer recording written batches, failing on bad jobs."""
+    def __init__(self):
+        self.batches = []
+        self.available = True
+        self.lock = threading.Lock()
+
+    def __call__(self, jobs):
+        with self.lock:
+            if not self.available:
+                raise Exception("db unavailable")
+            if [job for job in jobs if job.get("bad")]:
+                raise Exception("invalid job")
+            self.batches.append([job["id"] for job in jobs])
+
+    def written(self):
+        with self.lock:
+            return sorted([id for batch in self.batches for id in batch])
+
+
+class IndexJobWriteBufferTest(unittest.TestCase):
+    """Test the writing of buffered IndexJobs."""
+
+    def setUp(self):
+        self.writer = FakeWriter()
+        # The flusher thread is not started, flushes are explicit
+        self.buffer = IndexJobWriteBuffer(self.writer, flush_seconds=0.01,
+                max_buffered=5, max_retry_seconds=0.05, max_attempts=2)
+        self.buffer.running = True
+
+    def test_flush(self):
+        self.buffer.put([{"id": 1}, {"id": 2}])
+        self.buffer.put([{"id": 3}])
+        self.assertTrue(self.buffer.flush())
+        self.assertEqual(self.writer.batches, [[1, 2, 3]])
+
+    def test_isolateFailedJobs(self):
+        self.buffer.put([{"id": 1}, {"id": 2, "bad": True}, {"id": 3}])
+        self.assertFalse(self.buffer.flush())
+        self.assertEqual(self.writer.written(), [1, 3])
+        self.assertEqual(self.buffer.failures, 1)
+
+        # A failing first job is retried after the others without
+        # counting the attempt, since the db may be unavailable.
+        self.buffer.put([{"id": 4}])
+        self.assertFalse(self.buffer.flush())
+        self.assertEqual(self.writer.written(), [1, 3])
+
+        # The bad job is discarded after max_attempts, but
+        # does not prevent new jobs from being written.
+        self.assertTrue(self.buffer.flush())
+        self.assertEqual(self.writer.written(), [1, 3, 4])
+        self.assertEqual(self.buffer.jobs, [])
+        self.assertEqual(self.buffer.failures, 0)
+
+    def test_unavailable(self):
+        self.writer.available = False
+        self.buffer.put([{"id": 1}, {"id": 2}])
+        for attempt in range(3):
+            self.assertFalse(self.buffer.flush())
+
+        # Jobs are kept while nothing can be written, with backoff
+        self.assertEqual(len(self.buffer.jobs), 2)
+        self.assertEqual(self.buffer.delay, 0.05)
+
+        self.writer.available = True
+        self.assertTrue(self.buffer.flush())
+        self.assertEqual(self.writer.written(), [1, 2])
+        self.assertEqual(self.buffer.delay, 0.01)
+
+    def test_full(self):
+        self.buffer.put([{"id": id} for id in range(5)])
+        # Jobs beyond max_buffered are written synchronously
+        self.buffer.put([{"id": 5}])
+        self.assertEqual(self.writer.batches, [[5]])
+
+        self.writer.available = False
+        self.assertRaises(Exception, self.buffer.put, [{"id": 6}])
+
+    def test_stop(self):
+        self.buffer.running = False
+        self.buffer.start()
+        self.buffer.put([{"id": 1}])
+        self.buffer.stop()
+        self.buffer.join()
+
+        # Remaining jobs are written on stop
+        self.assertEqual(self.writer.written(), [1])
+        self.assertRaises(WriteBufferStopped, self.buffer.put, [{"id": 2}])
+
+if __name__ == '__main__':
+    unittest.main()